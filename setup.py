@@ -10,7 +10,8 @@ from numpy import get_include
 packages = ['ufloat',
             'ufloat.qh5py']
 
-ext_modules = [Extension("ufloat.ufloat", ["ufloat/ufloat.pyx"])]
+ext_modules = [Extension("ufloat.unit", ["ufloat/unit.pyx"]),
+               Extension("ufloat.ufloat", ["ufloat/ufloat.pyx"])]
 
 requires = ['numpy', 'h5py']
 
@@ -25,6 +26,7 @@ setup(name="ufloat",
       author_email = "christoph.gohle@mpq.mpg.de",
       ext_modules=ext_modules,
       packages = packages,
+      package_data = {'ufloat': ['*.pxd']},
       cmdclass = {'build_ext': build_ext},
       include_dirs = [get_include()],
       requires = requires,
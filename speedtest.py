@@ -56,11 +56,31 @@ def tests(u):
     
 
 
+def storage_tests(u, frames=50, shape=(512, 512)):
+    print('#######################')
+    print('# storage precision (%d frames of %dx%d)'%((frames,)+shape))
+    print('#######################')
+    for dtype in (numpy.float64, numpy.float32, numpy.float16):
+        stack = numpy.ones((frames,)+shape, dtype)*u.V
+        t = time()
+        for i in range(10):
+            a = stack*(2*u.mV)
+        dt = (time()-t)/10
+        print('%s: \t\t%.1f MB, scale %f (%.0f MB/s)'%(
+            numpy.dtype(dtype).name, stack.nbytes/1e6, dt,
+            (stack.nbytes + a.nbytes)/1e6/dt))
+        t = time()
+        for i in range(10):
+            a = stack.mean(axis=0)
+        print('%s mean: \t\t%f'%(numpy.dtype(dtype).name, (time()-t)/10))
+
+
 #tests(units)
 #tests(quantities)
 tests(ufloat.funits)
 tests(ufloat.aunits)
 tests(scalar)
+storage_tests(ufloat.funits)
 #tests(unum.units)
 #tests(pinttest)
 #tests(sympytest)
@@ -23,9 +23,10 @@ Created on Fri Mar  1 16:08:07 2013
 
 from ufloat import funits as f
 from ufloat import aunits as a
-from ufloat.ufloat import ufloat
-from ufloat.uarray import UnitArray 
-from numpy import arange, array, all
+from ufloat.ufloat import ufloat, ucomplex, uncertain
+from ufloat.uarray import UnitArray, UncertainArray
+from ufloat.unit import as_unit
+from numpy import arange, array, all, float64
 from matplotlib.cbook import flatten, is_scalar_or_string
 
 data = [1.,5.,20., arange(10)+1]
@@ -133,6 +134,767 @@ def test_cmp():
                 assert(lu!=ru)
     print('comparison ... passed')
     
+def test_unit_interning():
+    assert(as_unit({'m':1, 's':-1}) is as_unit({'s':-1., 'm':1}))
+    assert((f.m/f.s).unitDict is (a.m/a.s).unitDict)
+    assert((f.m*f.s/f.s).unitDict is f.m.unitDict)
+    assert(not as_unit({'m':0}))
+    def ior(u):
+        u |= {'s':1}
+    for change in (lambda u: u.__setitem__('m', 2), lambda u: u.update(s=1),
+                   ior, lambda u: u.pop('m'), lambda u: u.clear()):
+        try:
+            change(as_unit({'m':1}))
+        except TypeError:
+            pass
+        else:
+            assert(False)
+    assert(as_unit({'m':1}) == {'m':1})
+    u = as_unit({'m':1}) | {'s':1}
+    assert(type(u) is dict and u == {'m':1, 's':1})
+    assert(type({'s':1} | as_unit({'m':1})) is dict)
+    print('unit interning ... passed')
+
+def test_rational_exponents():
+    assert(f.m**0.5*f.m**0.5 == f.m)
+    assert((f.m**(1/3.))**3 == f.m)
+    assert((a.s**0.5).unitDict == {'s':0.5})
+    try:
+        f.m**(1/7.)
+    except ValueError:
+        pass
+    else:
+        assert(False)
+    #arbitrary exponents of dimensionless quantities are not cached
+    import tracemalloc
+    tracemalloc.start()
+    for i in range(20000):
+        ufloat(2.)**(1 + i*1e-6)
+    assert(tracemalloc.get_traced_memory()[0] < 100000)
+    tracemalloc.stop()
+    print('rational exponents ... passed')
+
+def test_scalar_results():
+    x = 5*f.m
+    assert((x + x).unitDict is x.unitDict)
+    assert((-x).unitDict is x.unitDict)
+    assert((2*x).unitDict is x.unitDict)
+    y = float64(2.)*x
+    assert(isinstance(y, ufloat) and y == 10*f.m)
+    assert(isinstance(x/float64(2.), ufloat))
+    print('scalar results ... passed')
+
+def test_threads():
+    from threading import Thread
+    results = [None]*8
+    def work(i):
+        u = ufloat(1, {'thread_test':1})
+        r = []
+        for j in range(200):
+            r.append((u*f.m**j).unitDict)
+        results[i] = r
+    threads = [Thread(target=work, args=(i,)) for i in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    for r in results[1:]:
+        assert(all([a is b for a, b in zip(r, results[0])]))
+    print('threads ... passed')
+
+_CYTHON_API_TEST = """
+from ufloat.ufloat cimport uqty, uqty_from, uqty_box, uq_mul, uq_add
+
+def power(a, int n):
+    # a**n by repeated unit checked multiplication without the gil
+    cdef uqty x, r
+    cdef int i, err = 0
+    uqty_from(a, &x)
+    r = x
+    with nogil:
+        for i in range(n - 1):
+            err = uq_mul(&r, &x, &r)
+            if err:
+                break
+    return err, uqty_box(&r)
+
+def add(a, b):
+    cdef uqty x, y, r
+    cdef int err
+    uqty_from(a, &x)
+    uqty_from(b, &y)
+    with nogil:
+        err = uq_add(&x, &y, &r)
+    return err, uqty_box(&r) if err == 0 else None
+"""
+
+def _have_compiler():
+    import shutil
+    import sysconfig
+    cc = sysconfig.get_config_var('CC')
+    return bool(cc) and shutil.which(cc.split()[0]) is not None
+
+def test_cython_api():
+    import os
+    import sys
+    import tempfile
+    import pytest
+    pyximport = pytest.importorskip('pyximport')
+    if not _have_compiler():
+        pytest.skip('no C compiler')
+    #an extension outside the package that cimports the installed pxd files
+    d = tempfile.mkdtemp()
+    with open(os.path.join(d, 'uq_api_test.pyx'), 'w') as fh:
+        fh.write(_CYTHON_API_TEST)
+    sys.path.insert(0, d)
+    importer = pyximport.install(build_dir=os.path.join(d, 'build'),
+                                 setup_args={'include_dirs': [os.getcwd()]},
+                                 language_level=3)
+    try:
+        import uq_api_test
+    finally:
+        pyximport.uninstall(*importer)
+        sys.path.remove(d)
+    err, r = uq_api_test.power(2*f.m, 3)
+    assert(err == 0 and r == 8*f.m**3 and r.unitDict is (f.m**3).unitDict)
+    assert(uq_api_test.add(2*f.m, 3*f.m) == (0, 5*f.m))
+    assert(uq_api_test.add(2*f.m, 3*f.s)[0] != 0)
+    #exponents out of range are reported, not wrapped around
+    assert(uq_api_test.power(f.m**100, 1000)[0] != 0)
+    print('cython api passed')
+
+def test_hash_cache():
+    from ufloat import cache
+    assert(hash(5*f.m) == hash(ufloat(5, {'m':1})))
+    assert(hash(ufloat(5)) == hash(5.))
+    assert(len(set([5*f.m, 5*f.m, 5*f.s])) == 2)
+    calls = []
+    @cache(maxsize=2)
+    def g(x):
+        calls.append(x)
+        return 2*x
+    assert(g(5*f.m) == 10*f.m)
+    assert(g(ufloat(5, {'m':1})) == 10*f.m)
+    assert(g(5*f.s) == 10*f.s)
+    assert(all(g(a.m*arange(3.)) == a.m*arange(0, 6, 2.)))
+    assert(len(calls) == 3)
+    info = g.cache_info()
+    assert(info.hits == 1 and info.misses == 3 and info.evictions == 1)
+    g(a.m*arange(100.))
+    assert(g.cache_info().uncached == 1)
+    g(array([1*f.m, 2*f.s], dtype=object))
+    assert(g.cache_info().uncached == 2)
+    @cache(rtol=1e-6)
+    def h(x):
+        calls.append(x)
+        return x
+    h(1.*f.m)
+    h((1+1e-9)*f.m)
+    assert(h.cache_info().hits == 1)
+    #uncertain arguments with different sigma are different calls
+    assert(h(uncertain(1, 0, {'m':1})).sigma == 0*f.m)
+    assert(h(uncertain(1, 0.5, {'m':1})).sigma == 0.5*f.m)
+    ua = UncertainArray(arange(2.), 0.1, {'m':1})
+    assert(all(h(ua).sigma == 0.1*f.m))
+    assert(all(h(UncertainArray(arange(2.), 0.2, {'m':1})).sigma == 0.2*f.m))
+    print('hash and cache ... passed')
+
+def test_complex():
+    z = (3+4j)*f.V
+    assert(isinstance(z, ucomplex) and z == ucomplex(3+4j, {'V':1}))
+    assert(abs(z) == 5*f.V)
+    assert(z.conjugate() == (3-4j)*f.V)
+    assert(z.real == 3*f.V and z.imag == 4*f.V)
+    assert(abs(ucomplex(1j, {'V':1}).phase - 1.5707963267948966) < 1e-15)
+    assert(z*f.s == ucomplex(3+4j, {'V':1, 's':1}))
+    assert(z/z == 1)
+    assert(z + 1*f.V == (4+4j)*f.V)
+    assert(1j*f.V - z == (-3-3j)*f.V)
+    try:
+        z + f.s
+    except ValueError:
+        pass
+    else:
+        assert(False)
+    x = z*arange(3)
+    assert(isinstance(x, UnitArray) and x.unitDict == {'V':1})
+    assert(x[1] == z)
+    #one element arrays stay arrays, on either side
+    for r in (z*array([1.]), array([1.])*z, z/array([1.]), z + array([0.])*f.V,
+              z - array([0.])*f.V):
+        assert(isinstance(r, UnitArray) and r.shape == (1, ) and r[0] == z)
+    import pickle
+    assert(pickle.loads(pickle.dumps(z)) == z)
+    print('complex ... passed')
+
+def test_uncertain():
+    import pickle
+    x = uncertain(2., 0.3, {'m':1})
+    y = uncertain(4., 0.4, {'s':1})
+    assert(x == 2*f.m)
+    assert(x.sigma == 0.3*f.m)
+    p = x*y
+    assert(p == 8*f.m*f.s)
+    assert(abs(p.sigma/(f.m*f.s) - (1.2**2 + 0.8**2)**0.5) < 1e-12)
+    q = x/y
+    assert(abs(q.sigma/(f.m/f.s) - ((0.3/4)**2 + (2*0.4/16)**2)**0.5) < 1e-12)
+    assert(abs((x**3).sigma/f.m**3 - 3*4*0.3) < 1e-12)
+    assert(abs((x + x).sigma/f.m - 0.3*2**0.5) < 1e-12)
+    assert((x - 2*f.m).sigma == x.sigma)
+    assert(abs((3*x).sigma/f.m - 0.9) < 1e-12)
+    #dimensionless results keep the uncertainty
+    assert(isinstance(x/f.m, uncertain))
+    try:
+        x + y
+        assert(False)
+    except ValueError:
+        pass
+    r = pickle.loads(pickle.dumps(x))
+    assert(r == x and r.sigma == x.sigma)
+    a = x*arange(3.)
+    assert(isinstance(a, UncertainArray))
+    assert(all(a.sigma == array([0., 0.3, 0.6])*f.m))
+    assert(isinstance(a[1], uncertain) and a[1].sigma == 0.3*f.m)
+    assert(isinstance(f.s*a, UncertainArray))
+    b = a*y
+    assert(all(b.nominal == array([0., 8., 16.])*f.m*f.s))
+    assert(abs(b[2].sigma/(f.m*f.s) - ((0.6*4)**2 + (4*0.4)**2)**0.5) < 1e-12)
+    assert(all((a - a).sigma == a.sigma*2**0.5))
+    #views transform sigma like the values, or don't know it
+    import numpy as np
+    m = UncertainArray(arange(4.).reshape(2, 2), arange(4.).reshape(2, 2), {'m':1})
+    assert(all(m.T.sigma == m.sigma.T) and all(np.transpose(m).sigma.value == m.T.value))
+    assert(all(m.reshape(4).sigma == arange(4.)*f.m))
+    assert(all(m.ravel().sigma == arange(4.)*f.m) and all(m.copy().sigma == m.sigma))
+    assert(all(np.isnan(m.diagonal().sigma.value)))
+    print('uncertain passed')
+
+def test_unit_cache():
+    import numpy as np
+    from ufloat import uarray
+    x = arange(5.)*a.m
+    uarray.unit_cache_clear()
+    for i in range(3):
+        y = np.square(x)
+        z = np.maximum(x, x)
+    assert(all(y == x*x) and all(z == x))
+    info = uarray.unit_cache_info()
+    assert(info.misses == 2 and info.hits == 4 and info.currsize == 2)
+    #scalar operands without unit are part of the key (zeros can be added)
+    assert(np.maximum(x, 0).unitDict == {'m':1})
+    #array operands without unit are not cached
+    assert(np.maximum(x, np.zeros(5)).unitDict == {'m':1})
+    assert(uarray.unit_cache_info().uncached == 1)
+    uarray.set_unit_cache_size(2)
+    y = np.sqrt(x)
+    info = uarray.unit_cache_info()
+    assert(info.currsize == 2 and info.evictions == 2)
+    uarray.set_unit_cache_size(1024)
+    #comparing with zero must not let other numbers through later
+    import numpy as np
+    from ufloat import evaluate
+    x = arange(3.)*f.m
+    assert(not any(np.less(x, 0)))
+    for bad in (lambda: np.less(x, 5), lambda: np.greater(x, 5),
+                lambda: evaluate('x < 5', dict(x=x))):
+        try:
+            bad()
+            assert(False)
+        except ValueError:
+            pass
+    print('unit cache passed')
+
+def test_array_ufunc():
+    import numpy as np
+    x = arange(1., 7.)*a.m
+    #plain out arrays for results without unit
+    b = np.empty(6, bool)
+    assert(np.less(x, x, out=b) is b and not b.any())
+    r = np.empty(6)
+    assert(np.divide(x, x, out=r) is r and all(r == 1))
+    assert(np.add.reduce(x) == 21*f.m)
+    assert(np.multiply.reduce(x) == 720*f.m**6)
+    y = x.reshape(2, 3)
+    assert(all(np.add.reduce(y, axis=1) == array([6., 15.])*f.m))
+    assert(np.multiply.reduce(y, axis=0).unitDict == {'m':2})
+    assert(all(np.add.accumulate(x) == array([1., 3., 6., 10., 15., 21.])*f.m))
+    assert(all(np.add.reduceat(x, [0, 2, 4]) == array([3., 7., 11.])*f.m))
+    assert(all(np.maximum(x, x[::-1]) == array([6., 5., 4., 4., 5., 6.])*f.m))
+    o = np.zeros(6)*a.s
+    assert(np.multiply(x, x, out=o) is o)
+    assert(o.unitDict == {'m':2} and o[2] == 9*f.m**2)
+    np.add(x, x, out=o, where=x > 3*f.m)
+    assert(o.unitDict == {'m':1} and o[3] == 8*f.m and o[5] == 12*f.m)
+    z = x.copy()
+    np.add.at(z, [0, 0], x[:2])
+    assert(z[0] == 4*f.m)
+    assert(np.multiply.outer(x[:2], x[:3]).shape == (2, 3))
+    for bad in (lambda: np.multiply.accumulate(x),
+                lambda: np.add(x, x, out=np.empty(6)),
+                lambda: np.add.at(z, [0], x[:1]*x[:1]),
+                lambda: np.maximum(x, x*x)):
+        try:
+            bad()
+            assert(False)
+        except ValueError:
+            pass
+    #results without unit are plain arrays
+    assert(type(np.less(x, x[::-1])) is np.ndarray)
+    #ufuncs with scalar quantities
+    assert(all(np.maximum(x, 5*f.m) == array([5., 5., 5., 5., 5., 6.])*f.m))
+    assert(np.abs(-3*f.m) == 3*f.m and np.abs((3+4j)*f.V) == 5*f.V)
+    z = x.copy()
+    np.multiply(z, 2*f.s, out=z)
+    assert(z.unitDict == {'m':1, 's':1} and z[1] == 4*f.m*f.s)
+    z = x.copy()
+    np.add.at(z, [0, 0], 1*f.m)
+    assert(z[0] == 3*f.m)
+    try:
+        np.add.at(z, [0], 1*f.s)
+        assert(False)
+    except ValueError:
+        pass
+    print('array ufunc passed')
+
+def test_array_function():
+    import numpy as np
+    x = arange(1., 7.)*a.m
+    t = arange(6.)*a.s
+    c = np.concatenate([x, x])
+    assert(c.unitDict == {'m':1} and c.shape == (12, ))
+    assert(np.stack([x, x]).shape == (2, 6))
+    assert(all(np.where(x > 3*f.m, x, 0) == array([0, 0, 0, 4., 5., 6.])*f.m))
+    assert(np.interp(array([2.5])*a.m, x, x*a.s)[0] == 2.5*f.m*f.s)
+    assert(all(np.diff(x) == 1*f.m))
+    assert(np.gradient(x*x, t).unitDict == {'m':2, 's':-1})
+    assert(np.trapz(x, t) == 17.5*f.m*f.s)
+    assert(np.trapz(x, dx=1*f.s) == 17.5*f.m*f.s)
+    assert(np.cumsum(x)[-1] == 21*f.m)
+    hist, edges = np.histogram(x, bins=2, density=True)
+    assert(hist.unitDict == {'m':-1} and edges.unitDict == {'m':1})
+    assert(np.clip(x, 2*f.m, 4*f.m).max() == 4*f.m)
+    o = np.empty(12)*a.m
+    assert(np.concatenate([x, x], out=o) is o)
+    try:
+        np.concatenate([x, x*x])
+        assert(False)
+    except ValueError:
+        pass
+    print('array function passed')
+
+def test_reductions():
+    import numpy as np
+    y = arange(1., 7.).reshape(2, 3)*a.m
+    assert(all(y.max(axis=1) == array([3., 6.])*f.m))
+    assert(y.min(axis=0, keepdims=True).shape == (1, 3))
+    assert(all(y.argmax(axis=1) == array([2, 2])))
+    assert(all(y.ptp(axis=0) == 3*f.m))
+    assert(all(y.mean(axis=1) == array([2., 5.])*f.m))
+    assert(y.var().unitDict == {'m':2})
+    assert(y.std(axis=0).unitDict == {'m':1})
+    assert(y.prod(axis=1).unitDict == {'m':3})
+    assert(y.prod() == 720*f.m**6)
+    assert(y.sum(where=y > 2*f.m) == 18*f.m)
+    assert(y.max(initial=10*f.m) == 10*f.m)
+    o = np.empty(3)*a.s
+    assert(y.sum(axis=0, out=o) is o and o.unitDict == {'m':1})
+    yn = array([[1, np.nan, 3], [4, 5, 6.]])*a.m
+    assert(all(np.nanmean(yn, axis=0) == array([2.5, 5., 4.5])*f.m))
+    assert(np.nanmax(yn) == 6*f.m)
+    assert(np.nanvar(yn).unitDict == {'m':2})
+    assert(np.nanargmax(yn) == 5)
+    print('reductions passed')
+
+def test_wrap():
+    import numpy as np
+    import tracemalloc
+    b = bytearray(80)
+    w = UnitArray.wrap(b, {'m':1}, dtype=float64)
+    w.value[1] = 3
+    assert(np.frombuffer(b)[1] == 3 and w.unitDict == {'m':1})
+    x = arange(1e5)
+    w = UnitArray.wrap(x, {'s':1})
+    assert(np.shares_memory(w, x) and isinstance(w, UnitArray))
+    assert(UnitArray.wrap(w).unitDict == {'s':1})
+    assert(isinstance(UnitArray.wrap(memoryview(x)), UnitArray))
+    #the products are not copied again
+    tracemalloc.start()
+    for op in (lambda: f.m*x, lambda: x/f.m, lambda: w + f.s):
+        tracemalloc.reset_peak()
+        r = op()
+        assert(tracemalloc.get_traced_memory()[1] < 1.5*x.nbytes)
+        del r
+    tracemalloc.stop()
+    print('wrap passed')
+
+def test_boxing():
+    import numpy as np
+    x = arange(6.)*a.m
+    y = x.reshape(2, 3)
+    assert(type(x[3]) is ufloat and x[3] == 3*f.m)
+    assert(y[1, 2] == 5*f.m and y[np.int64(1), 0] == 3*f.m)
+    assert(isinstance(y[1], UnitArray) and np.shares_memory(y[1], y))
+    assert(list(x) == [i*f.m for i in range(6)])
+    assert(y.tolist() == [[0*f.m, 1*f.m, 2*f.m], [3*f.m, 4*f.m, 5*f.m]])
+    assert(x[::2].tolist() == [0*f.m, 2*f.m, 4*f.m])
+    assert(x.item(4) == 4*f.m)
+    assert(isinstance((x*1j).tolist()[1], ucomplex))
+    #byte swapped and read only strided data
+    b = UnitArray.wrap(np.arange(3.).astype('>f8'), {'m':1})
+    assert(list(b) == b.tolist() == [0*f.m, 1*f.m, 2*f.m])
+    r = np.arange(6.)
+    r.flags.writeable = False
+    r = UnitArray.wrap(r[::2], {'m':1})
+    assert(list(r) == r.tolist() == [0*f.m, 2*f.m, 4*f.m])
+    #the unit is shared
+    assert(x[1].unitDict is x[2].unitDict)
+    print('boxing passed')
+
+def test_from_ufloats():
+    from ufloat import fsum
+    l = [ufloat(0.1*i, {'m':1}) for i in range(1000)]
+    x = UnitArray.from_ufloats(l)
+    assert(isinstance(x, UnitArray) and x.unitDict == {'m':1} and x[10] == l[10])
+    assert(UnitArray.from_ufloats(iter(l[:3])).shape == (3, ))
+    assert(UnitArray.from_ufloats([], {'s':1}).unitDict == {'s':1})
+    for bad in ([f.m, f.s], [f.m, 1.]):
+        try:
+            UnitArray.from_ufloats(bad)
+            assert(False)
+        except ValueError:
+            pass
+    #sum starts with 0
+    assert(sum(l[:4]) == sum(x[:4]) and 0 - f.m == -f.m)
+    assert(fsum(l) == ufloat(49950., {'m':1}))
+    assert(fsum([]) == 0 and fsum([1e100, 1., -1e100]) == 1.)
+    try:
+        fsum([f.m, f.s])
+        assert(False)
+    except ValueError:
+        pass
+    print('from_ufloats passed')
+
+def test_operators():
+    import numpy as np
+    #0-d unit arrays (aunits) give ufloats, like the ufloat units
+    for x in (5*a.m*a.s, a.m*5*a.s, 5*a.m/a.s*a.s, (5*a.m)**1):
+        assert(isinstance(x, ufloat))
+    assert(5*a.m*a.s == 5*f.m*f.s and 2*a.m + 3*a.m == 5*f.m)
+    assert(a.m/a.m == 1 and a.m**2 == f.m**2 and 3*a.m - a.m == 2*f.m)
+    assert(np.float64(2.)*a.m == 2*f.m and a.m*np.float32(2.) == 2*f.m)
+    x = arange(4.)*a.m
+    assert(all(x + 0 == x) and all(0 - x == -x) and all(x % (3*f.m) == array([0., 1., 2., 0.])*f.m))
+    assert((x/a.s).unitDict == {'m':1, 's':-1} and (f.s/x[1:]).unitDict == {'m':-1, 's':1})
+    assert(all(x**2 == x*x) and all(x + f.m == x + 1*a.m))
+    for bad in (lambda: x + 1, lambda: x - a.s, lambda: x**a.m,
+                lambda: x**arange(4.), lambda: f.m + x*x):
+        try:
+            bad()
+            assert(False)
+        except ValueError:
+            pass
+    print('operators passed')
+
+def test_inplace_views():
+    import numpy as np
+    x = arange(10.)*a.m
+    #relabelling a view doesn't touch the data or the unit of x
+    v = x[2:5]
+    v *= f.s
+    assert(v.unitDict == {'m':1, 's':1} and x.unitDict == {'m':1})
+    assert(all(v.value == x.value[2:5]))
+    #scaling it copies the view (copy on write), x keeps its values
+    w = x[2:5]
+    view = w
+    w /= 2*f.s
+    assert(w is not view and w.unitDict == {'m':1, 's':-1} and all(w == array([1., 1.5, 2.])*f.m/f.s))
+    assert(all(x == arange(10.)*f.m))
+    #storing the result back in x checks the unit
+    try:
+        x[2:5] **= 2
+        assert(False)
+    except ValueError:
+        pass
+    assert(all(x == arange(10.)*f.m))
+    #same unit: in place
+    x[2:5] *= 2
+    assert(x[4] == 8*f.m)
+    #an array that owns its data and has no views is scaled in place
+    y = x.copy()
+    z = y
+    y *= 3*f.s
+    assert(y is z and y[1] == 3*f.m*f.s)
+    y **= 2
+    assert(y is z and y.unitDict == {'m':2, 's':2})
+    #views of an array that owns its data keep their values and unit
+    y = (arange(4.)*f.m).copy()
+    v = y[1:3]
+    y *= ufloat(2, {'s':1})
+    assert(all(y == arange(4.)*2*f.m*f.s))
+    assert(v.unitDict == {'m':1} and all(v == array([1., 2.])*f.m))
+    y **= 2
+    assert(y.unitDict == {'m':2, 's':2} and all(v == array([1., 2.])*f.m))
+    print('inplace views passed')
+
+def test_mixed():
+    import numpy as np
+    from ufloat import MixedUnitArray
+    p = MixedUnitArray([80*f.MHz, -3*f.dBm, 2*f.ms, 5.])
+    assert(p.shape == (4, ) and len(p.units) == 4 and p[0] == 80*f.MHz and p[3] == 5.)
+    q = p*2*f.s
+    assert(q[2] == 4*f.ms*f.s and q[1] == -6*f.dBm*f.s and q[3] == 10*f.s)
+    assert(list(p/p) == [1., 1., 1., 1.] and (p/p).units == (as_unit(None), ))
+    assert((p**2)[0] == (80*f.MHz)**2 and (-p)[1] == 3*f.dBm and (abs(p))[1] == 3*f.dBm)
+    assert(all(p + p == 2*p) and (p - p)[0] == 0*f.MHz)
+    assert(all((p*np.arange(4))[1:] == np.arange(1, 4)*p[1:]))
+    assert(list(p == p[::-1]) == [False]*4 and list(f.ms*2 == p) == [False, False, True, False])
+    try:
+        p + p[::-1]
+        assert(False)
+    except ValueError as e:
+        assert('at (1,)' in str(e))
+    assert(all(p < 2*abs(p)))
+    #views share values and the unit table
+    v = p[1:3]
+    v[0] = 7*f.s
+    assert(p[1] == 7*f.s and p.units == v.units)
+    import pickle
+    assert(all(pickle.loads(pickle.dumps(p)) == p))
+    #numpy functions use the unit index, unsupported ones raise
+    c = np.concatenate([p, p[:2], arange(2.)*f.s])
+    assert(isinstance(c, MixedUnitArray) and c.shape == (8, ) and c[5] == p[1] and c[7] == 1*f.s)
+    q = MixedUnitArray([[1*f.m, 2*f.s], [3*f.m, 4*f.s]])
+    assert(np.sum(q[:, 1]) == 6*f.s and all(np.sum(q, axis=0) == MixedUnitArray([4*f.m, 6*f.s])))
+    for bad, error in ((lambda: np.sum(p), ValueError), (lambda: np.sum(q, axis=1), ValueError),
+                       (lambda: np.stack([q, q]), TypeError)):
+        try:
+            bad()
+            assert(False)
+        except error:
+            pass
+    print('mixed passed')
+
+def test_table():
+    import numpy as np
+    import pickle
+    from ufloat import UnitTable
+    t = UnitTable(shot=arange(4), detuning=array([1., 2., 3., 4.])*f.MHz,
+                  N=[1e5, 3e5, 2e5, 4e5])
+    assert(len(t) == 4 and t.columns == ['shot', 'detuning', 'N'])
+    assert(t.data.dtype['shot'].kind == 'i' and t.units['detuning'] == f.MHz.unitDict)
+    #columns are views of the table
+    d = t['detuning']
+    assert(isinstance(d, UnitArray) and np.shares_memory(d.value, t.data))
+    assert(t[1]['detuning'] == 2*f.MHz and t[1]['N'] == 3e5)
+    s = t[t['detuning'] > 1.5*f.MHz].sort('N', reverse=True)
+    assert(list(s['shot']) == [3, 1, 2] and s['detuning'][0] == 4*f.MHz)
+    t['T'] = [1*f.uK, 2*f.uK, 3*f.uK, 4*f.uK]
+    t['rate'] = t['N']/t['T']
+    assert(t['rate'].unitDict == {'K':-1} and t[['T', 'N']].columns == ['T', 'N'])
+    del t['rate']
+    assert('rate' not in t and t.columns[-1] == 'T')
+    p = pickle.loads(pickle.dumps(t))
+    assert(all(p['T'] == t['T']) and p.units == t.units)
+    try:
+        t[:2] = UnitTable.wrap(t.data[:2], {'T':{'s':1}})
+        assert(False)
+    except ValueError:
+        pass
+    #a new unit doesn't change the columns of views
+    v = t[0:2]
+    t['detuning'] = array([1., 2., 3., 4.])*f.m
+    assert(v.units['detuning'] == f.MHz.unitDict and v['detuning'][1] == 2*f.MHz)
+    assert(t['detuning'][1] == 2*f.m)
+    print('table passed')
+
+def test_qh5py_table():
+    import os
+    import tempfile
+    import pytest
+    pytest.importorskip('h5py')
+    from ufloat import UnitTable
+    from ufloat.qh5py import qh5py
+    t = UnitTable(shot=arange(3), detuning=array([1., 2., 3.])*f.MHz,
+                  T=array([1., 2., 4.])*f.uK)
+    name = os.path.join(tempfile.mkdtemp(), 'table.h5')
+    with qh5py.File(name, 'w') as h:
+        h['t'] = t
+        #rows are written with their units checked
+        h['t'][:1] = t[2:]
+        try:
+            h['t'][:1] = UnitTable.wrap(t.data[:1], {'detuning':{'s':1}})
+            assert(False)
+        except ValueError:
+            pass
+    with qh5py.File(name, 'r') as h:
+        r = h['t'][()]
+    assert(isinstance(r, UnitTable) and r.columns == t.columns and r.units == t.units)
+    assert(all(r['detuning'] == array([3., 2., 3.])*f.MHz) and all(r['shot'] == [2, 1, 2]))
+    assert(r['T'].unitDict == f.uK.unitDict)
+    print('qh5py table passed')
+
+def test_conversion():
+    import numpy as np
+    b = array([1., 2.])*f.T
+    assert(all(b.asNumber('G') == b.asNumber(f.G)) and b.asNumber('mT')[1] == 2000)
+    assert(all((array([3., 4.])*f.W).asNumber('J/s') == [3, 4]))
+    assert((3*f.MHz).asNumber('1/s') == 3e6 and (3*f.MHz).asNumber('MHz') == 3)
+    #no copy if the factor is 1
+    g = array([1., 2.])*f.G
+    assert(np.shares_memory(g.asNumber('G'), g.value))
+    out = np.empty(2)
+    assert(g.asNumber('1e-4*T', out=out) is out and all(out == [1, 2]))
+    g.asNumber('mG', out=g.value)
+    assert(g.value[1] == 2000)
+    try:
+        b.asNumber('s')
+        assert(False)
+    except ValueError:
+        pass
+    v = array([1., 2.])
+    x = UnitArray.from_number(v, 'mW/cm**2', copy=False)
+    assert(np.shares_memory(x.value, v) and x[1] == 2*f.mW/f.cm**2)
+    print('conversion passed')
+
+def test_sorting():
+    import numpy as np
+    x = array([3., 1., 2., 3.])*f.ms
+    assert(list(x > 1.5*f.ms) == [True, False, True, True])
+    assert(list(x <= array([1., 1., 2., 2.])*f.ms) == [False, True, True, False])
+    assert(not any(x == array([3., 1., 2., 3.])*f.m) and all(x != 3))
+    try:
+        x < 1*f.m
+        assert(False)
+    except ValueError:
+        pass
+    s = np.sort(x)
+    assert(isinstance(s, UnitArray) and s[0] == 1*f.ms and list(np.argsort(x)) == [1, 2, 0, 3])
+    assert(s.searchsorted(2.5*f.ms) == 2 and list(np.searchsorted(s, [1*f.ms, 3*f.ms])) == [0, 2])
+    u, counts = np.unique(x, return_counts=True)
+    assert(all(u == array([1., 2., 3.])*f.ms) and list(counts) == [1, 1, 2])
+    assert(list(np.isin(x, [2*f.ms, 3*f.ms])) == [True, False, True, True])
+    i = np.intersect1d(x, array([2., 3., 4.])*f.ms)
+    assert(all(i == array([2., 3.])*f.ms))
+    try:
+        np.isin(x, [1*f.m])
+        assert(False)
+    except ValueError:
+        pass
+    x.sort()
+    assert(all(x == s))
+    print('sorting passed')
+
+def test_storage_precision():
+    import numpy as np
+    import warnings
+    for dtype in (np.float32, np.float16):
+        x = np.ones((4, 3), dtype)*f.V
+        assert(x.dtype == dtype and (x*(2*f.ms)).dtype == dtype)
+        assert((f.ms*x).dtype == dtype and (x/(3*f.s)).dtype == dtype)
+        assert((x + 1*f.V).dtype == dtype and (x**2).dtype == dtype)
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore')
+            assert((x*(1e40*f.s)).dtype == dtype)
+        assert(x.mean(axis=0).dtype == dtype and np.cumsum(x, axis=0).dtype == dtype)
+    #reductions accumulate in double precision
+    y = np.full(10**6, 0.1, np.float32)*f.V
+    assert(y.sum() == y.value.sum(dtype=np.float64)*f.V)
+    assert(np.nansum(y) == y.sum() and y.mean() == y.value.mean(dtype=np.float64)*f.V)
+    print('storage precision passed')
+
+def test_linalg():
+    import numpy as np
+    from ufloat import MixedUnitArray
+    A = array([[2., 1.], [1., 3.]])*f.V
+    b = array([1., 2.])*f.s
+    assert((A @ b).unitDict == (f.V*f.s).unitDict and all((A @ b).value == [4, 7]))
+    assert(all(np.dot(A, b) == A @ b) and all(A.dot(b) == A @ b))
+    assert(all(np.einsum('ij,j->i', A, b) == A @ b))
+    x = np.linalg.solve(A, b)
+    assert(x.unitDict == (f.s/f.V).unitDict and np.allclose((A @ x).value, b.value))
+    assert(np.linalg.inv(A).unitDict == (1/f.V).unitDict)
+    assert(np.linalg.det(A).unitDict == (f.V**2).unitDict)
+    x, res, rank, sv = np.linalg.lstsq(A, b, None)
+    assert(x.unitDict == (f.s/f.V).unitDict and sv.unitDict == f.V.unitDict)
+    assert(np.inner(b, b) == 5*f.s**2 and np.linalg.norm(b).unitDict == f.s.unitDict)
+    #a unit per row and column: counts = R @ (power, frequency)
+    R = MixedUnitArray([[2/f.mW, 1/f.MHz], [1/f.mW, 3/f.MHz]])
+    p = MixedUnitArray([1*f.mW, 2*f.MHz])
+    y = R @ p
+    assert(isinstance(y, MixedUnitArray) and list(y.value) == [4, 7] and not y.unit_of(0))
+    q = np.linalg.solve(R, y)
+    assert(q.units == p.units and np.allclose(q.value, p.value))
+    assert(np.allclose((np.linalg.inv(R) @ y).value, p.value))
+    q = np.linalg.lstsq(R, y, None)[0]
+    assert(q.units == p.units and np.allclose(q.value, p.value))
+    for bad in (lambda: R @ R, lambda: np.linalg.solve(R, MixedUnitArray([1*f.s, 1*f.m])),
+                lambda: np.linalg.inv(MixedUnitArray([[1*f.s, 1*f.m], [1*f.m, 1*f.m]]))):
+        try:
+            bad()
+            assert(False)
+        except ValueError:
+            pass
+    print('linalg passed')
+
+def test_sparse():
+    import numpy as np
+    from ufloat import UnitSparse
+    C = UnitSparse((array([1., 2., 3.])*f.MHz, ([0, 1, 2], [1, 2, 0])), shape=(3, 3))
+    assert(C.nnz == 3 and C.unitDict == f.MHz.unitDict)
+    x = arange(3.)*f.V
+    assert(all(C @ x == C.toarray() @ x) and all(x @ C == x @ C.toarray()))
+    assert((C @ C).unitDict == (f.MHz**2).unitDict and (C @ C).nnz == 3)
+    #scaling only touches the stored elements, values shares them
+    D = 2*f.us*C
+    assert(D.nnz == 3 and not D.unitDict and list(D.values) == [2., 4., 6.])
+    D.values[:] = 1
+    assert(all(D.toarray().sum(axis=0) == [1, 1, 1]))
+    assert(C.sum() == 6*f.MHz and all(C.sum(axis=1) == array([1., 2., 3.])*f.MHz))
+    assert(C.multiply(np.ones((3, 3))*f.s).nnz == 3 and (C + C).sum() == 12*f.MHz)
+    assert(np.allclose(C.asNumber('MHz').toarray(), C.toarray().asNumber(f.MHz)))
+    E = UnitSparse(np.eye(3)*f.V)
+    assert(E.nnz == 3 and E.unitDict == f.V.unitDict)
+    try:
+        C + E
+        assert(False)
+    except ValueError:
+        pass
+    #scipy is imported with the first UnitSparse, not with ufloat
+    import subprocess, sys
+    code = 'import sys, ufloat; print("scipy" in sys.modules)'
+    assert(subprocess.check_output([sys.executable, '-c', code]).strip() == b'False')
+    print('sparse passed')
+
+def test_evaluate():
+    import numpy as np
+    from ufloat import evaluate
+    delta = np.linspace(-10, 10, 100001)*f.MHz
+    Omega = 2*f.MHz
+    Gamma = 6*f.MHz
+    S = Omega**2/4/(delta**2 + Omega**2/2 + Gamma**2/4)
+    for threads in (None, 1, 3):
+        s = evaluate('Omega**2/4/(delta**2 + Omega**2/2 + Gamma**2/4)', threads=threads, block=1000)
+        assert(isinstance(s, np.ndarray) and np.allclose(s, S))
+    r = evaluate('sqrt(delta**2 + Gamma**2)', dict(delta=delta, Gamma=Gamma))
+    assert(r.unitDict == f.MHz.unitDict and np.allclose(r.value, np.sqrt(delta**2 + Gamma**2).value))
+    w = evaluate('where(delta > 0, delta, -delta) + abs(delta)*2')
+    assert(np.allclose(w.value, 3*abs(delta.value)))
+    c = evaluate('where(b > 1, b, 1.)', dict(b=arange(4.)))
+    assert(type(c) is np.ndarray and all(c == array([1., 1., 2., 3.])))
+    assert(evaluate('2*Omega + Gamma') == 10*f.MHz)
+    out = np.empty(delta.shape)*f.s
+    assert(evaluate('Omega**-1*delta', out=out) is out and out.unitDict == {})
+    a = np.ones((3, 4))*f.s
+    b = arange(4.)
+    assert(all(evaluate('a*b + a', block=4) == a*b + a))
+    for bad in ('delta + 1', 'exp(delta)', 'delta**b', 'sum(delta)'):
+        try:
+            evaluate(bad)
+            assert(False)
+        except ValueError:
+            pass
+    print('evaluate passed')
+
 if __name__=='__main__':
     test_basicdiv()
     test_basicmul()
@@ -142,4 +904,33 @@ if __name__=='__main__':
     test_sub()
     test_pow()
     test_cmp()
+    test_unit_interning()
+    test_rational_exponents()
+    test_scalar_results()
+    test_threads()
+    if _have_compiler():
+        test_cython_api()
+    test_hash_cache()
+    test_complex()
+    test_uncertain()
+    test_unit_cache()
+    test_array_ufunc()
+    test_array_function()
+    test_reductions()
+    test_wrap()
+    test_boxing()
+    test_from_ufloats()
+    test_operators()
+    test_inplace_views()
+    test_mixed()
+    test_table()
+    import importlib.util
+    if importlib.util.find_spec('h5py') is not None:
+        test_qh5py_table()
+    test_conversion()
+    test_sorting()
+    test_storage_precision()
+    test_linalg()
+    test_sparse()
+    test_evaluate()
     print('all tests passed')
@@ -48,8 +48,13 @@ ValueError: Can't add two quantities with differnt units 5.0 [s] and 12 [m].
 
 from numpy import *
 __version__ = '0.2.1'
-from .ufloat import ufloat
-from .uarray import UnitArray
+from .ufloat import ufloat, ucomplex, uncertain, fsum
+from .uarray import UnitArray, UncertainArray
+from .marray import MixedUnitArray
+from .table import UnitTable
+from .sparse import UnitSparse
+from .expr import evaluate
+from .memo import cache
 #from . import funits
 #from . import aunits
 
@@ -31,12 +31,13 @@ if you need others you can use the function pc.
 For example calling 
 >>> pc('Newtonian constant of gravitation')
 ufloat(6.67408e-11, {u'kg': -1.0, u's': -2.0, u'm': 3.0})
->>>
+>>> pc('Newtonian constant of gravitation', uncertainty=True)
+uncertain(6.67408e-11, 3.1e-15, {u'kg': -1.0, u's': -2.0, u'm': 3.0})
 
 
 """
 from . import unit_from_string
-from .ufloat import ufloat
+from .ufloat import ufloat, uncertain
 from . import funits
 
 try:
@@ -445,7 +446,12 @@ default_names = {'Angstrom star': None,
  'weak mixing angle': None,
  '{220} lattice spacing of silicon': None}
     
-def pc(name):
+def pc(name, uncertainty=False):
+    """the physical constant name from scipy.constants.physical_constants
+
+    If uncertainty is True the result is an uncertain number with the
+    standard uncertainty of the constant (see ufloat.uncertain), otherwise
+    the uncertainty is dropped."""
     v, u, p = scipyconstants.physical_constants[name]
     ufix = u.replace('^','**')
     u = unit_from_string(ufix)
@@ -459,13 +465,14 @@ def pc(name):
             remain[s]=e
     if len(remain)>0:
         unorm = unorm*ufloat(1,remain)
-        
+
+    if uncertainty:
+        return uncertain(v, p)*unorm
     return v*unorm
         
 if have_scipy:
     for n, s in default_names.items():
         if s is not None:
             globals()[s] = pc(n)
-    import scipy
-    mu_0 = 4e-7*scipy.pi
+    mu_0 = 4e-7*scipyconstants.pi
     epsilon_0 = 1 / (mu_0*c*c) #analysis:ignore
\ No newline at end of file
@@ -0,0 +1,278 @@
+# -*- coding: utf-8 -*-
+#    ufloat - fast python floats with physical units
+#    Copyright (C) 2015  Christoph Gohle <christoph.gohle@mpq.mpg.de>
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+"""
+Evaluation of elementwise expressions of quantities in blocks.
+
+Evaluating a formula like
+
+>>> S = Omega**2/4/(delta**2 + Omega**2/2 + Gamma**2/4)
+
+with UnitArrays of 10**7 elements makes a full size temporary array for
+every operator (and checks the units of every operation on them). evaluate
+does the same in two steps: the unit of the result is worked out once from
+the units of the operands with the rules of the ufuncs (uarray.p_dict), then
+the plain values are computed in blocks that fit into the cache, spread over
+a pool of threads:
+
+>>> S = evaluate('Omega**2/4/(delta**2 + Omega**2/2 + Gamma**2/4)')
+
+Expressions can use +, -, *, /, %, **, comparisons, numbers, the names of
+numpy ufuncs (sin, exp, sqrt, arctan2, ...), abs and where(c, x, y).
+"""
+from __future__ import division
+
+import ast
+import os
+import sys
+import threading
+
+import numpy as np
+
+from .unit import DIMENSIONLESS, as_unit
+from .ufloat import box
+from .uarray import (UnitArray, _ufunc_unit, _plain_out, _wrap_out,
+                     _d_check_uniform)
+
+#elements per block, the temporaries of a block stay in the L2 cache
+BLOCK = 1 << 14
+
+_binops = {ast.Add: np.add, ast.Sub: np.subtract, ast.Mult: np.multiply,
+           ast.Div: np.true_divide, ast.Mod: np.remainder, ast.Pow: np.power}
+_unaryops = {ast.USub: np.negative, ast.UAdd: np.positive}
+_compares = {ast.Lt: np.less, ast.LtE: np.less_equal, ast.Gt: np.greater,
+             ast.GtE: np.greater_equal, ast.Eq: np.equal, ast.NotEq: np.not_equal}
+_aliases = {'abs': np.absolute}
+
+#the thread pool shared by all evaluations
+_pool = None
+_pool_lock = threading.Lock()
+
+def _shared_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            from concurrent.futures import ThreadPoolExecutor
+            _pool = ThreadPoolExecutor(os.cpu_count() or 1)
+    return _pool
+
+
+def _probe(value, unit):
+    """a stand-in with unit for the symbolic pass (a 0-d UnitArray)"""
+    res = np.array(value, dtype=float).view(UnitArray)
+    res._unit = unit
+    return res
+
+
+class _Node(object):
+    """a compiled expression node
+
+    f(env, out) computes the plain values (env maps names to plain values),
+    probe is a stand-in with the unit of the node (or the value itself for
+    values without unit, which some unit rules need). value is the plain
+    value of scalar nodes, these are computed once when compiling."""
+    __slots__ = ('f', 'probe', 'unit', 'value')
+
+    def __init__(self, f, probe, unit, value=None):
+        self.f = f
+        self.probe = probe
+        self.unit = unit
+        self.value = value
+
+
+def _scalar(value, unit):
+    """the node for a known scalar value"""
+    return _Node(lambda env, out=None: value,
+                 _probe(value, unit) if unit else value, unit, value)
+
+
+#powers with these exponents are done by cheaper ufuncs (like ndarray.__pow__)
+_powers = {2: np.square, 0.5: np.sqrt, 1: np.positive,
+           -1: lambda x, out=None: np.true_divide(1., x, out=out)}
+
+
+def _ufunc(uf, args):
+    """the node for uf applied to the nodes args"""
+    probes = tuple(a.probe for a in args)
+    if (uf is np.power and args[0].unit and args[1].value is None
+            and np.ndim(args[1].probe) == 0):
+        raise ValueError('the exponent of a quantity has to be a constant')
+    unit = _ufunc_unit(uf, probes)
+    if all(a.value is not None for a in args):
+        return _scalar(uf(*[a.value for a in args]), unit)
+    fs = [a.f for a in args]
+    if uf is np.power and args[1].value in _powers and args[0].value is None:
+        uf, fs = _powers[args[1].value], fs[:1]
+    if len(fs) == 1:
+        f0, = fs
+        f = lambda env, out=None: uf(f0(env), out=out)
+    else:
+        f0, f1 = fs
+        f = lambda env, out=None: uf(f0(env), f1(env), out=out)
+    return _Node(f, _probe(1., unit) if unit else np.float64(1.), unit)
+
+
+def _where(args):
+    c, x, y = args
+    #the rule gives None if neither branch has a unit
+    unit = as_unit(_d_check_uniform(x.probe, y.probe))
+    fc, fx, fy = c.f, x.f, y.f
+    def f(env, out=None):
+        res = np.where(fc(env), fx(env), fy(env))
+        if out is not None:
+            out[...] = res
+            return out
+        return res
+    return _Node(f, _probe(1., unit) if unit else np.float64(1.), unit)
+
+
+def _compile(node, names):
+    """the _Node for the ast node, names are the operands"""
+    if isinstance(node, ast.Expression):
+        return _compile(node.body, names)
+    if isinstance(node, ast.BinOp) and type(node.op) in _binops:
+        return _ufunc(_binops[type(node.op)], [_compile(node.left, names),
+                                               _compile(node.right, names)])
+    if isinstance(node, ast.UnaryOp) and type(node.op) in _unaryops:
+        return _ufunc(_unaryops[type(node.op)], [_compile(node.operand, names)])
+    if (isinstance(node, ast.Compare) and len(node.ops) == 1
+            and type(node.ops[0]) in _compares):
+        return _ufunc(_compares[type(node.ops[0])], [_compile(node.left, names),
+                                                     _compile(node.comparators[0], names)])
+    if isinstance(node, ast.Call) and not node.keywords:
+        func = node.func
+        if (isinstance(func, ast.Attribute) and isinstance(func.value, ast.Name)
+                and func.value.id in ('np', 'numpy')):
+            name = func.attr
+        elif isinstance(func, ast.Name):
+            name = func.id
+        else:
+            raise ValueError('unsupported function call in expression')
+        args = [_compile(a, names) for a in node.args]
+        if name == 'where' and len(args) == 3:
+            return _where(args)
+        uf = _aliases.get(name, getattr(np, name, None))
+        if not isinstance(uf, np.ufunc) or uf.nin != len(args) or uf.nout != 1:
+            raise ValueError('%s is not a ufunc with %d arguments' % (name, len(args)))
+        return _ufunc(uf, args)
+    if isinstance(node, ast.Name):
+        if node.id not in names:
+            raise NameError('name %r is not defined' % node.id)
+        return _operand(node.id, names[node.id])
+    value = getattr(node, 'value', getattr(node, 'n', None))
+    if type(node).__name__ in ('Constant', 'Num') and isinstance(value, (int, float, complex)):
+        return _scalar(value, DIMENSIONLESS)
+    raise ValueError('unsupported expression %s' % ast.dump(node))
+
+
+def _operand(name, x):
+    """the node for the operand x"""
+    unit = getattr(x, 'unitDict', None) or DIMENSIONLESS
+    value = getattr(x, 'value', x)
+    if np.ndim(value) == 0:
+        return _scalar(np.asarray(value)[()], unit)
+    f = lambda env, out=None: env[name]
+    if unit:
+        return _Node(f, _probe(1., unit), unit)
+    #arrays without unit are their own stand-in (for value dependent rules)
+    return _Node(f, np.asarray(value), unit)
+
+
+def _run(f, env, out):
+    res = f(env, out)
+    if res is not out:
+        out[...] = res
+
+
+def evaluate(expr, local_dict=None, out=None, threads=None, block=BLOCK):
+    """the value of the elementwise expression expr
+
+    Parameters
+    ----------
+    expr : str
+        The expression, e.g. 'Omega**2/(delta**2 + Gamma**2/4)'.
+    local_dict : dict, optional
+        The values of the names in expr (UnitArrays, ndarrays, ufloats,
+        numbers). By default the variables of the caller.
+    out : UnitArray or ndarray, optional
+        The array for the result (with the broadcast shape of the operands).
+    threads : int, optional
+        The number of threads, by default a thread pool with one thread per
+        core is used. 1 evaluates in the calling thread.
+    block : int
+        The number of elements computed at once.
+
+    The units are checked (and the unit of the result is computed) before
+    anything is evaluated, so unit errors are raised without computing
+    anything. The result is a UnitArray (an ndarray without unit, a ufloat
+    or a number for scalar expressions) or out.
+    """
+    if local_dict is None:
+        frame = sys._getframe(1)
+        local_dict = dict(frame.f_globals)
+        local_dict.update(frame.f_locals)
+    tree = ast.parse(expr.strip(), mode='eval')
+    used = set(n.id for n in ast.walk(tree) if isinstance(n, ast.Name))
+    names = dict((k, local_dict[k]) for k in used if k in local_dict)
+    node = _compile(tree, names)
+    unit = node.unit
+
+    arrays = dict((k, getattr(v, 'value', v)) for k, v in names.items()
+                  if np.ndim(getattr(v, 'value', v)))
+    shape = np.broadcast_shapes(*[np.shape(v) for v in arrays.values()]) if arrays else ()
+    plain_out = _plain_out(out, unit)
+    if not shape:
+        res = node.f({})
+        if plain_out is not None:
+            plain_out[...] = res
+        return _wrap_out(res, unit, out)
+    arrays = dict((k, np.broadcast_to(v, shape)) for k, v in arrays.items())
+
+    #blocks along the longest axis
+    axis = int(np.argmax(shape))
+    step = max(1, block//max(1, int(np.prod(shape))//shape[axis]))
+    def index(i):
+        return (slice(None), )*axis + (slice(i, i + step), )
+    def env(i):
+        k = index(i)
+        return dict((name, v[k]) for name, v in arrays.items())
+
+    #the first block gives the dtype of the result
+    first = node.f(env(0))
+    if plain_out is None:
+        plain_out = np.empty(shape, np.result_type(first))
+    plain_out[index(0)] = first
+    starts = range(step, shape[axis], step)
+    if threads == 1 or len(starts) == 0:
+        for i in starts:
+            _run(node.f, env(i), plain_out[index(i)])
+    else:
+        if threads is None:
+            pool = _shared_pool()
+        else:
+            from concurrent.futures import ThreadPoolExecutor
+            pool = ThreadPoolExecutor(threads)
+        try:
+            for r in [pool.submit(_run, node.f, env(i), plain_out[index(i)])
+                      for i in starts]:
+                r.result()
+        finally:
+            if threads is not None:
+                pool.shutdown()
+    if out is not None:
+        return _wrap_out(plain_out, unit, out)
+    return box(plain_out, unit)
@@ -0,0 +1,566 @@
+# -*- coding: utf-8 -*-
+#    ufloat - fast python floats with physical units
+#    Copyright (C) 2015  Christoph Gohle <christoph.gohle@mpq.mpg.de>
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+"""
+Arrays of quantities with different units.
+
+A UnitArray has one unit for all of its elements. Parameter sets like
+(frequency, power, duration) would have to be lists of ufloat, which are slow
+to compute with. A MixedUnitArray stores the values in a float array and for
+every element an index into a small table of units:
+
+>>> p = MixedUnitArray([80*MHz, -3*dBm, 2*ms])
+>>> p*2
+MixedUnitArray(array([ 1.6e+08, -6.0e+00,  4.0e-03]), [1/s, dBm, s])
+>>> p + p[::-1]
+ValueError: can't add quantities with different units, got [1/s] and [s] at (0,), [s] and [1/s] at (2,)
+
+Operations work on the whole value array at once. The units of the result
+are looked up once for every pair of units in the tables of the operands,
+not for every element. Unit errors list the elements they occurred at.
+
+Matrices whose units factor into a unit per row and a unit per column
+(response and calibration matrices) can be multiplied (@, dot), inverted and
+solved (np.linalg.inv, solve, lstsq); the units are checked once per row and
+column.
+"""
+from __future__ import division
+
+import numpy as np
+
+from .unit import as_unit, DIMENSIONLESS
+from .ufloat import ufloat, ucomplex, box
+
+#dtype of the unit index
+_INDEX = np.int16
+
+
+def _split(x):
+    """values, unit index and unit table of an operand"""
+    if isinstance(x, MixedUnitArray):
+        return x._value, x._index, x._units
+    value = np.asarray(getattr(x, 'value', x))
+    return value, np.zeros((), _INDEX), [getattr(x, 'unitDict', DIMENSIONLESS)]
+
+
+def _same(u1, u2):
+    return u1 if u1 is u2 else None
+
+
+def _unit_error(what, bad, ia, ua, ib, ub, maxshow=5):
+    """a ValueError listing the elements where bad is True"""
+    where = np.argwhere(bad)
+    ia = np.broadcast_to(ia, bad.shape)
+    ib = np.broadcast_to(ib, bad.shape)
+    items = ['[%s] and [%s] at %s' % (ua[ia[tuple(w)]].symbol,
+                                      ub[ib[tuple(w)]].symbol, tuple(w))
+             for w in where[:maxshow]]
+    if len(where) > maxshow:
+        items.append('and %d more' % (len(where) - maxshow))
+    return ValueError('%s, got %s' % (what, ', '.join(items)))
+
+
+def _combine(a, b, unit_op, what=None):
+    """values of a and b and the unit index and table of the result
+
+    unit_op(u1, u2) gives the unit of the result of an element with unit u1
+    and one with unit u2, or None if they can't be combined. It is called
+    once for every pair of units in the tables of a and b. Elements for
+    which it returns None are reported in a ValueError with the message
+    what."""
+    va, ia, ua = _split(a)
+    vb, ib, ub = _split(b)
+    nb = len(ub)
+    units = []
+    lut = np.empty(len(ua)*nb, np.intp)
+    for k in range(len(lut)):
+        u = unit_op(ua[k//nb], ub[k % nb])
+        if u is None:
+            lut[k] = -1
+        else:
+            if u not in units:
+                units.append(u)
+            lut[k] = units.index(u)
+    index = lut[ia.astype(np.intp)*nb + ib]
+    if (lut < 0).any():
+        bad = index < 0
+        if bad.any():
+            raise _unit_error(what, bad, ia, ua, ib, ub)
+    return va, vb, _compact(index, units)
+
+
+def _compact(index, units):
+    """index and units without the entries of units that aren't used"""
+    if len(units) > 1:
+        used = np.bincount(index.ravel(), minlength=len(units)) > 0
+        if not used.all():
+            new = np.cumsum(used) - 1
+            index = new[index]
+            units = [u for u, x in zip(units, used) if x]
+    return index.astype(_INDEX), units
+
+
+def _zero(x):
+    return (type(x) is int or type(x) is float) and x == 0
+
+
+def _new(cls, value, index, units):
+    """a cls with the given attributes, nothing is checked or copied"""
+    res = cls.__new__(cls)
+    res._value = value
+    res._index = index
+    res._units = units
+    return res
+
+
+#linear algebra with a unit per row and column. The units of a matrix m
+#with different units factor as unit(m[i, j]) == rows[i]*cols[j] if it is
+#the matrix of a linear map between quantities (a response or calibration
+#matrix). This is checked once per operation on the unit tables, the values
+#go to BLAS and LAPACK as they are.
+
+def _position(units, u):
+    return units.index(u) if u in units else -1
+
+
+def _factors(x, row=False):
+    """values, row and column units of the matrix x
+
+    Returns the values of x and (rows, ri), (cols, cj) such that the unit of
+    x[i, j] is rows[ri[i]]*cols[cj[j]]. Vectors are taken as columns, or as
+    rows if row is True. Raises ValueError if the units of x don't factor
+    like that."""
+    v, index, units = _split(x)
+    index = np.broadcast_to(index, v.shape)
+    if v.ndim == 1:
+        index = index[None, :] if row else index[:, None]
+    elif v.ndim != 2:
+        raise ValueError('expected a matrix or a vector, got an array with %d dimensions'
+                         % v.ndim)
+    rk, ri = np.unique(index[:, 0], return_inverse=True)
+    ck, cj = np.unique(index[0], return_inverse=True)
+    u0 = units[index[0, 0]]
+    rows = [units[k] for k in rk]
+    cols = [units[k]/u0 for k in ck]
+    lut = np.array([[_position(units, r*c) for c in cols] for r in rows], _INDEX)
+    bad = lut[ri[:, None], cj] != index
+    if bad.any():
+        i, j = np.argwhere(bad)[0]
+        raise ValueError('the units of the matrix don\'t factor into units of rows '
+                         'and columns, got [%s] at %s' % (units[index[i, j]].symbol, (i, j)))
+    return v, (rows, ri), (cols, cj)
+
+
+def _common(units, what):
+    """the only element of the set units, ValueError with message what if
+    there are more"""
+    if len(units) != 1:
+        raise ValueError('%s, got %s' % (what, ', '.join('[%s]' % u.symbol for u in units)))
+    return units.pop()
+
+
+def _row_scale(rows, ri, brows, bri):
+    """the unit b has on top of the row units of a for each row"""
+    pairs = set(zip(ri.tolist(), bri.tolist()))
+    return _common(set(brows[q]/rows[p] for p, q in pairs),
+                   'the rows of b don\'t have the units of the rows of a')
+
+
+def _outer(value, a, ai, b, bi, unit_op):
+    """a MixedUnitArray of value, element (i, j) has unit_op(a[ai[i]], b[bi[j]])
+
+    Vectors and scalars (for which ai or bi has length 1) are reshaped."""
+    units = []
+    lut = np.empty((len(a), len(b)), np.intp)
+    for k, u in enumerate(a):
+        for l, w in enumerate(b):
+            r = unit_op(u, w)
+            if r not in units:
+                units.append(r)
+            lut[k, l] = units.index(r)
+    index, units = _compact(lut[ai[:, None], bi], units)
+    if np.ndim(value) == 0:
+        return box(float(value), units[index[0, 0]])
+    return _new(MixedUnitArray, value, index.reshape(np.shape(value)), units)
+
+
+def dot(a, b):
+    """the matrix product of a and b (matrices or vectors)
+
+    The column units of a times the row units of b have to be the same for
+    all columns of a (the unit of the quantities that are summed)."""
+    va, (ra, ri), (ca, cj) = _factors(a, row=True)
+    vb, (rb, rbi), (cb, cbj) = _factors(b)
+    if len(cj) != len(rbi):
+        raise ValueError('shapes %s and %s not aligned' % (np.shape(va), np.shape(vb)))
+    pairs = set(zip(cj.tolist(), rbi.tolist()))
+    q = _common(set(ca[p]*rb[r] for p, r in pairs),
+                'can\'t multiply, the columns of a and the rows of b have different units')
+    return _outer(np.dot(va, vb), ra, ri, cb, cbj, lambda u, w: u*q*w)
+
+
+def solve(a, b):
+    """np.linalg.solve for matrices with a unit per row and column
+
+    If unit(a[i, j]) == r[i]*c[j], b[i] needs the unit r[i] times the same
+    unit s for all rows (s can be different for the columns of b). The
+    solution x[j] then has the unit s/c[j]."""
+    va, (ra, ri), (ca, cj) = _factors(a)
+    vb, (rb, rbi), (cb, cbj) = _factors(b)
+    s = _row_scale(ra, ri, rb, rbi)
+    return _outer(np.linalg.solve(va, vb), ca, cj, cb, cbj, lambda c, k: s*k/c)
+
+
+def inv(a):
+    """np.linalg.inv for matrices with a unit per row and column
+
+    If unit(a[i, j]) == r[i]*c[j] the inverse has the units 1/(c[j]*r[k])."""
+    va, (ra, ri), (ca, cj) = _factors(a)
+    return _outer(np.linalg.inv(va), ca, cj, ra, ri,
+                  lambda c, r: DIMENSIONLESS/(c*r))
+
+
+def lstsq(a, b, rcond=None):
+    """np.linalg.lstsq for matrices with a unit per column
+
+    The squared residuals of the rows are summed, so all rows of a (and b)
+    need the same unit. Weight the rows first for data of different units.
+    The columns (the fit parameters) can have different units. The singular
+    values are plain numbers unless all columns of a have the same unit."""
+    va, (ra, ri), (ca, cj) = _factors(a)
+    vb, (rb, rbi), (cb, cbj) = _factors(b)
+    if len(ra) > 1:
+        _common(set(ra), 'lstsq needs the same unit for all rows of a')
+    s = _row_scale(ra, ri, rb, rbi)
+    x, residuals, rank, sv = np.linalg.lstsq(va, vb, rcond)
+    x = _outer(x, ca, cj, cb, cbj, lambda c, k: s*k/c)
+    if len(residuals):
+        one = np.zeros(1, np.intp)
+        residuals = _outer(residuals, [DIMENSIONLESS], one, cb, cbj,
+                           lambda u, k: (ra[0]*s*k)**2)
+    if len(ca) == 1:
+        sv = box(sv, ra[0]*ca[0])
+    return x, residuals, rank, sv
+
+
+def concatenate(arrays, axis=0):
+    """np.concatenate for MixedUnitArrays (and UnitArrays, ufloats and
+    numbers), the unit tables are merged"""
+    values = []
+    indices = []
+    units = []
+    for x in arrays:
+        v, i, u = _split(x)
+        lut = np.empty(len(u), np.intp)
+        for k, w in enumerate(u):
+            if w not in units:
+                units.append(w)
+            lut[k] = units.index(w)
+        values.append(v)
+        indices.append(np.broadcast_to(lut[i], np.shape(v)))
+    index, units = _compact(np.concatenate(indices, axis), units)
+    return _new(MixedUnitArray, np.concatenate(values, axis), index, units)
+
+
+def sum(a, axis=None):
+    """np.sum for MixedUnitArrays, the summed elements need the same unit"""
+    v, index, units = _split(a)
+    #the same unit can be in the table more than once
+    first = np.array([units.index(u) for u in units], np.intp)
+    index = first[np.broadcast_to(index, v.shape)]
+    if axis is None:
+        v, index, axis = v.ravel(), index.ravel(), 0
+    if v.shape[axis] == 0:
+        return np.sum(v, axis)
+    first = np.take(index, [0], axis)
+    bad = index != first
+    if bad.any():
+        raise _unit_error('can\'t add quantities with different units',
+                          bad, index, units, first, units)
+    res = np.sum(v, axis)
+    first = np.squeeze(first, axis)
+    if np.ndim(res) == 0:
+        return box(float(res), units[first[()]])
+    index, units = _compact(first, units)
+    return _new(MixedUnitArray, res, index, units)
+
+
+#numpy functions that MixedUnitArray implements
+_functions = {np.dot: dot, np.linalg.solve: solve, np.linalg.inv: inv,
+              np.linalg.lstsq: lstsq, np.concatenate: concatenate, np.sum: sum}
+
+
+class MixedUnitArray(object):
+    """An array of quantities, each element with its own unit.
+
+    The values are a float array (value), the unit of an element is
+    units[index[i]]. Arithmetic (+, -, *, /, ** with a dimensionless
+    exponent, abs) and comparisons work elementwise with numbers, ufloats,
+    UnitArrays and other MixedUnitArrays. Indexing an element gives a
+    ufloat, slices and masks a MixedUnitArray.
+
+    Views (slices) share the values, the index and the unit table with the
+    array they are taken from. Of the numpy functions dot, concatenate, sum
+    and np.linalg.inv, solve and lstsq are supported, others raise
+    TypeError.
+
+    Parameters
+    ----------
+    quantities : sequence
+        ufloats and numbers (dimensionless), also nested sequences, or a
+        UnitArray or MixedUnitArray (which is copied).
+    """
+    #arithmetic with numpy arrays and UnitArray is done here
+    __array_ufunc__ = None
+
+    def __init__(self, quantities):
+        if isinstance(quantities, MixedUnitArray):
+            value, index, units = (quantities._value.copy(),
+                                   quantities._index.copy(),
+                                   list(quantities._units))
+        elif hasattr(quantities, 'unitDict') or isinstance(quantities, np.ndarray):
+            value, index, units = _split(quantities)
+            value = np.array(value, dtype=float)
+            index = np.zeros(value.shape, _INDEX)
+        else:
+            flat = quantities
+            shape = None
+            if any(isinstance(x, (list, tuple, np.ndarray)) for x in quantities):
+                q = np.empty(np.shape(quantities), dtype=object)
+                q[...] = quantities
+                flat, shape = q.ravel(), q.shape
+            units = []
+            pos = {}
+            index = []
+            value = []
+            for x in flat:
+                u = getattr(x, 'unitDict', DIMENSIONLESS)
+                k = pos.get(u)
+                if k is None:
+                    k = pos[u] = len(units)
+                    units.append(u)
+                index.append(k)
+                value.append(getattr(x, 'value', x))
+            value = np.array(value, dtype=float).reshape(shape or len(value))
+            index = np.array(index, dtype=_INDEX).reshape(value.shape)
+        self._value = value
+        self._index = index
+        self._units = units
+
+    @classmethod
+    def wrap(cls, value, index, units):
+        """a MixedUnitArray using value and index without copying them
+
+        Parameters
+        ----------
+        value : ndarray
+            the values
+        index : ndarray of int
+            the position of the unit of each element in units (same shape as
+            value)
+        units : sequence
+            the unit table, units or unit dicts
+        """
+        value = np.asarray(value)
+        index = np.asarray(index)
+        if index.dtype != _INDEX:
+            index = index.astype(_INDEX)
+        if index.shape != value.shape:
+            index = np.broadcast_to(index, value.shape).copy()
+        return _new(cls, value, index, [as_unit(u) for u in units])
+
+    @property
+    def value(self):
+        """the values as ndarray (shared with this array)"""
+        return self._value
+
+    @property
+    def index(self):
+        """the index of the unit of every element in units"""
+        return self._index
+
+    @property
+    def units(self):
+        """the table of units"""
+        return tuple(self._units)
+
+    @property
+    def shape(self):
+        return self._value.shape
+
+    @property
+    def ndim(self):
+        return self._value.ndim
+
+    @property
+    def size(self):
+        return self._value.size
+
+    def __len__(self):
+        return len(self._value)
+
+    def __getitem__(self, key):
+        value = self._value[key]
+        index = self._index[key]
+        if isinstance(value, np.ndarray):
+            #views share the unit table, setting items may add units to it
+            return _new(MixedUnitArray, value, index, self._units)
+        return box(float(value), self._units[index])
+
+    def __setitem__(self, key, value):
+        v, i, units = _split(value)
+        lut = np.empty(len(units), _INDEX)
+        for k, u in enumerate(units):
+            if u not in self._units:
+                self._units.append(u)
+            lut[k] = self._units.index(u)
+        self._value[key] = v
+        self._index[key] = lut[i]
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    def tolist(self):
+        """the elements as (nested) list of ufloat and float"""
+        if self.ndim == 0:
+            return self[()]
+        return [x.tolist() if isinstance(x, MixedUnitArray) else x for x in self]
+
+    def copy(self):
+        return MixedUnitArray(self)
+
+    def unit_of(self, key):
+        """the unit of the element key"""
+        return self._units[self._index[key]]
+
+    #arithmetic
+    def __add__(self, other):
+        if _zero(other):
+            return self.copy()
+        va, vb, (index, units) = _combine(self, other, _same, 'can\'t add quantities with different units')
+        return _new(MixedUnitArray, va + vb, index, units)
+
+    def __radd__(self, other):
+        if _zero(other):
+            return self.copy()
+        va, vb, (index, units) = _combine(other, self, _same, 'can\'t add quantities with different units')
+        return _new(MixedUnitArray, va + vb, index, units)
+
+    def __sub__(self, other):
+        if _zero(other):
+            return self.copy()
+        va, vb, (index, units) = _combine(self, other, _same, 'can\'t subtract quantities with different units')
+        return _new(MixedUnitArray, va - vb, index, units)
+
+    def __rsub__(self, other):
+        if _zero(other):
+            return -self
+        va, vb, (index, units) = _combine(other, self, _same, 'can\'t subtract quantities with different units')
+        return _new(MixedUnitArray, va - vb, index, units)
+
+    def __mul__(self, other):
+        va, vb, (index, units) = _combine(self, other, lambda u1, u2: u1*u2)
+        return _new(MixedUnitArray, va*vb, index, units)
+
+    def __rmul__(self, other):
+        va, vb, (index, units) = _combine(other, self, lambda u1, u2: u1*u2)
+        return _new(MixedUnitArray, va*vb, index, units)
+
+    def __truediv__(self, other):
+        va, vb, (index, units) = _combine(self, other, lambda u1, u2: u1/u2)
+        return _new(MixedUnitArray, va/vb, index, units)
+
+    def __rtruediv__(self, other):
+        va, vb, (index, units) = _combine(other, self, lambda u1, u2: u1/u2)
+        return _new(MixedUnitArray, va/vb, index, units)
+
+    __div__ = __truediv__
+    __rdiv__ = __rtruediv__
+
+    def __matmul__(self, other):
+        return dot(self, other)
+
+    def __rmatmul__(self, other):
+        return dot(other, self)
+
+    def dot(self, other):
+        """the matrix product, see marray.dot"""
+        return dot(self, other)
+
+    def __array_function__(self, func, types, args, kwargs):
+        f = _functions.get(func)
+        if f is None:
+            #other functions would see the elements as objects (ufloats)
+            return NotImplemented
+        return f(*args, **kwargs)
+
+    def __pow__(self, other):
+        if getattr(other, 'unitDict', None) or np.ndim(other):
+            raise ValueError('Can\'t expontiate using exponent with units or array')
+        index, units = _compact(self._index, [u**other for u in self._units])
+        return _new(MixedUnitArray, self._value**other, index, units)
+
+    def __neg__(self):
+        return _new(MixedUnitArray, -self._value, self._index.copy(), list(self._units))
+
+    def __pos__(self):
+        return self.copy()
+
+    def __abs__(self):
+        return _new(MixedUnitArray, abs(self._value), self._index.copy(), list(self._units))
+
+    #comparisons
+    def _compare(self, other, op):
+        va, vb, (index, units) = _combine(self, other, _same, 'can\'t compare quantities with different units')
+        return op(va, vb)
+
+    def __lt__(self, other):
+        return self._compare(other, np.less)
+
+    def __le__(self, other):
+        return self._compare(other, np.less_equal)
+
+    def __gt__(self, other):
+        return self._compare(other, np.greater)
+
+    def __ge__(self, other):
+        return self._compare(other, np.greater_equal)
+
+    def __eq__(self, other):
+        #elements with different units are not equal
+        va, ia, ua = _split(self)
+        vb, ib, ub = _split(other)
+        same = np.array([[u1 is u2 for u2 in ub] for u1 in ua])
+        return same[ia, ib] & (va == vb)
+
+    def __ne__(self, other):
+        return ~(self == other)
+
+    __hash__ = None
+
+    def __repr__(self):
+        return '%s(%s, [%s])' % (self.__class__.__name__, repr(self._value),
+                                 ', '.join(u.symbol or '1' for u in self._units))
+
+    def __str__(self):
+        if self.ndim == 0:
+            return str(self[()])
+        return '[%s]' % ', '.join(str(x) for x in self)
+
+    def __reduce__(self):
+        return (MixedUnitArray.wrap, (self._value, self._index, self._units))
@@ -0,0 +1,173 @@
+# -*- coding: utf-8 -*-
+#    ufloat - fast python floats with physical units
+#    Copyright (C) 2015  Christoph Gohle <christoph.gohle@mpq.mpg.de>
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+"""
+A LRU cache for functions that take quantities with units.
+
+functools.lru_cache can't be used with UnitArray arguments and has no way
+to treat almost equal values as equal. This one can:
+
+>>> @cache(maxsize=256, rtol=1e-9)
+... def zeeman_shift(B):
+...     return mu_b*B/h
+>>> shift = zeeman_shift(1*G)
+>>> zeeman_shift.cache_info()
+CacheInfo(hits=0, misses=1, evictions=0, uncached=0, maxsize=256, currsize=1)
+
+ufloat arguments are keys by value and unit, small arrays (UnitArray or
+ndarray with at most maxarray elements) by unit, shape, dtype and values.
+Calls with larger arrays, object arrays or other unhashable arguments are
+passed through to the function and counted as uncached.
+"""
+from __future__ import division
+
+from collections import namedtuple, OrderedDict
+from functools import update_wrapper
+from math import frexp, isinf, isnan
+from threading import Lock
+
+import numpy as np
+
+from .ufloat import ufloat, uncertain
+
+CacheInfo = namedtuple('CacheInfo', ['hits', 'misses', 'evictions',
+                                     'uncached', 'maxsize', 'currsize'])
+
+
+class _Uncachable(Exception):
+    pass
+
+
+def _quantize(v, rtol):
+    """map v to a key that is the same for values within about rtol"""
+    if v == 0 or isinf(v) or isnan(v):
+        return v
+    m, e = frexp(v)
+    return (int(round(m/rtol)), e)
+
+
+def _array_values(value, rtol):
+    if rtol is None or not value.dtype.kind == 'f':
+        return value.tobytes()
+    return tuple(_quantize(v, rtol) for v in value.flat)
+
+
+def _key_item(arg, rtol, maxarray):
+    if isinstance(arg, uncertain):
+        #uncertain compares (and hashes) like its value, the key needs sigma
+        value, sigma = arg.value, arg.sigma.value
+        if rtol is not None:
+            value, sigma = _quantize(value, rtol), _quantize(sigma, rtol)
+        return (uncertain, value, sigma, arg.unitDict)
+    if isinstance(arg, ufloat):
+        if rtol is None:
+            return arg
+        return (_quantize(arg.value, rtol), arg.unitDict)
+    elif isinstance(arg, np.ndarray):
+        #the bytes of object arrays are pointers, which can be reused
+        if arg.size > maxarray or arg.dtype.hasobject:
+            raise _Uncachable
+        value = arg.view(type=np.ndarray)
+        key = (getattr(arg, '_unit', None), value.shape, value.dtype.str,
+               _array_values(value, rtol))
+        sigma = getattr(arg, '_sigma', None)
+        if sigma is not None:
+            key += (_array_values(np.asarray(sigma), rtol), )
+        return key
+    elif isinstance(arg, float) and rtol is not None:
+        return _quantize(arg, rtol)
+    try:
+        hash(arg)
+    except TypeError:
+        raise _Uncachable
+    return arg
+
+
+def cache(maxsize=128, rtol=None, maxarray=16):
+    """LRU cache decorator for functions of quantities with units
+
+    Parameters
+    ----------
+    maxsize : int
+        the maximum number of results that are kept. If more are added the
+        least recently used one is dropped (and counted as eviction).
+    rtol : float or None
+        if given, floating point arguments (also the values of ufloats and
+        arrays) that differ by less than about rtol relative to their size
+        are treated as equal.
+    maxarray : int
+        arrays with more than maxarray elements are not cached.
+
+    The decorated function has the methods cache_info() and cache_clear().
+    cache can also be used without arguments (@cache).
+    """
+    if callable(maxsize):
+        return cache()(maxsize)
+
+    def decorating_function(f):
+        results = OrderedDict()
+        lock = Lock()
+        stats = {'hits': 0, 'misses': 0, 'evictions': 0, 'uncached': 0}
+
+        def wrapper(*args, **kwargs):
+            try:
+                key = tuple(_key_item(a, rtol, maxarray) for a in args)
+                if kwargs:
+                    key += tuple((k, _key_item(v, rtol, maxarray))
+                                 for k, v in sorted(kwargs.items()))
+            except _Uncachable:
+                with lock:
+                    stats['uncached'] += 1
+                return f(*args, **kwargs)
+            with lock:
+                try:
+                    result = results[key]
+                except KeyError:
+                    pass
+                else:
+                    results.move_to_end(key)
+                    stats['hits'] += 1
+                    return result
+            result = f(*args, **kwargs)
+            with lock:
+                stats['misses'] += 1
+                results[key] = result
+                results.move_to_end(key)
+                while len(results) > maxsize:
+                    results.popitem(last=False)
+                    stats['evictions'] += 1
+            return result
+
+        def cache_info():
+            """statistics of the cache"""
+            with lock:
+                return CacheInfo(stats['hits'], stats['misses'],
+                                 stats['evictions'], stats['uncached'],
+                                 maxsize, len(results))
+
+        def cache_clear():
+            """clear the cache and its statistics"""
+            with lock:
+                results.clear()
+                for k in stats:
+                    stats[k] = 0
+
+        wrapper.cache_info = cache_info
+        wrapper.cache_clear = cache_clear
+        return update_wrapper(wrapper, f)
+
+    return decorating_function
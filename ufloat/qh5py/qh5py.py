@@ -50,6 +50,8 @@ from numpy import void
 
 import h5py as h
 import ufloat as uf
+from ufloat.unit import as_unit
+from numpy.lib.recfunctions import repack_fields
 UNITATTR = 'unit'
 import os.path as osp
 
@@ -63,6 +65,11 @@ for n in dir(h):
         globals()[n] = getattr(h, n)
 
 
+def table_unit_attr(column):
+    """the name of the attribute with the unit of a column of a table"""
+    return '%s.%s' % (UNITATTR, column)
+
+
 class Group(h.Group):
     def __init__(self, *args, **kwargs):
         self._sm = kwargs.pop('sm', None)
@@ -73,6 +80,15 @@ class Group(h.Group):
         return Group(s._id, sm=self)
 
     def create_dataset(self, name, shape=None, dtype=None, data=None, **kwds):
+        if isinstance(data, uf.UnitTable):
+            #a compound dataset with the column units as attributes
+            table = data
+            data = repack_fields(table.data)
+            s = super(Group, self).create_dataset(name, shape, dtype, data, **kwds)
+            for col, u in list(table.units.items()):
+                if u:
+                    s.attrs[table_unit_attr(col)] = u.symbol
+            return Dataset(s._id, sm=self)
         s = super(Group, self).create_dataset(name, shape, dtype, data, **kwds)
         if hasattr(data, UNITATTR):
             #assume this is something that has a unit (and a 'symbol' property)
@@ -90,7 +106,10 @@ class Group(h.Group):
         return res
 
     def __setitem__(self, name, value):
-        if hasattr(value, 'unit'):
+        if isinstance(value, uf.UnitTable):
+            self.create_dataset(name, data=value)
+
+        elif hasattr(value, 'unit'):
             super(Group, self).__setitem__(name, value.value)
             self[name].attrs[UNITATTR] = value.symbol
 
@@ -165,10 +184,22 @@ class Dataset(h.Dataset):
     def value(self):
         return self[()]
 
+    def table_units(self):
+        """the units of the columns of a compound dataset (or None)"""
+        names = self.dtype.names
+        if names is None:
+            return None
+        keys = list(self.attrs.keys())
+        return dict((n, uf.unit_from_string(self.attrs[table_unit_attr(n)]))
+                    for n in names if table_unit_attr(n) in keys)
+
     def __getitem__(self, args):
         res = super(Dataset, self).__getitem__(args)
         if UNITATTR in list(self.attrs.keys()):
             res = uf.ufloat(1, uf.unit_from_string(self.attrs[UNITATTR])) * res
+        elif self.dtype.names is not None and getattr(res, 'ndim', 0) > 0:
+            #compound datasets are read as tables
+            res = uf.UnitTable.wrap(res, self.table_units())
 
         # SB 160826 handle binary blob, see below
         if six.PY3 and 'is_binary' in self.attrs:
@@ -178,7 +209,14 @@ class Dataset(h.Dataset):
         return res
 
     def __setitem__(self, args, val):
-        if UNITATTR in list(self.attrs.keys()):
+        if isinstance(val, uf.UnitTable):
+            units = self.table_units()
+            for n, u in list(val.units.items()):
+                if u is not as_unit(units.get(n)):
+                    raise ValueError('column %s should be of unit %s' % (n, units.get(n)))
+            val = repack_fields(val.data)
+
+        elif UNITATTR in list(self.attrs.keys()):
             u = uf.unit_from_string(self.attrs[UNITATTR])
             if hasattr(val, 'unit'):
                 #check if the unit can be rescaled to
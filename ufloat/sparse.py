@@ -0,0 +1,274 @@
+# -*- coding: utf-8 -*-
+#    ufloat - fast python floats with physical units
+#    Copyright (C) 2015  Christoph Gohle <christoph.gohle@mpq.mpg.de>
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+"""
+Sparse matrices with a unit.
+
+A UnitSparse is a scipy.sparse matrix and a unit, like a UnitArray is an
+ndarray and a unit. Only the stored elements are kept in memory:
+
+>>> C = UnitSparse(([1., 2., 3.]*MHz, ([0, 1, 2], [1, 2, 0])), shape=(3, 3))
+>>> C @ (arange(3.)*s)
+array([1000000., 4000000.,       0.])
+>>> (2*pi*C).values
+UnitArray(array([ 6283185.30717959, 12566370.61435917, 18849555.92153876]), {'s': -1})
+
+scipy is optional for ufloat, UnitSparse needs it (and imports it when the
+first one is made).
+"""
+from __future__ import division
+
+import numpy as np
+
+from .unit import as_unit, DIMENSIONLESS
+from .ufloat import box
+from .uarray import UnitArray, checkunit, conversion_target
+
+
+def _scipy_sparse():
+    """scipy.sparse, imported with the first UnitSparse (it is optional and
+    slow to import)"""
+    try:
+        import scipy.sparse
+    except ImportError:
+        raise ImportError('UnitSparse needs scipy.sparse')
+    return scipy.sparse
+
+
+def _split(x):
+    """the plain value and the unit of x"""
+    if isinstance(x, UnitSparse):
+        return x._matrix, x._unit
+    if isinstance(x, UnitArray):
+        return x.view(np.ndarray), x._unit
+    unit = getattr(x, 'unitDict', None)
+    if unit is None:
+        return x, DIMENSIONLESS
+    return x.value, unit
+
+
+def _dense(x):
+    """x as ndarray, sparse results of sums are np.matrix"""
+    if isinstance(x, np.matrix):
+        return np.asarray(x)
+    return x
+
+
+def _new(matrix, unit):
+    res = UnitSparse.__new__(UnitSparse)
+    res._matrix = matrix
+    res._unit = unit
+    return res
+
+
+class UnitSparse(object):
+    """A scipy.sparse matrix with a unit.
+
+    Parameters
+    ----------
+    matrix : scipy.sparse matrix, array or constructor arguments
+        A sparse matrix is used as it is (not copied). Anything else is
+        passed to the scipy.sparse constructor of format, e.g. a dense
+        UnitArray or (data, (row, col)) with data a UnitArray. The unit of
+        the dense array or the data is the unit of the matrix.
+    units : unit dict, optional
+        The unit (if matrix doesn't have one).
+    shape : tuple, optional
+        The shape, passed to the constructor.
+    format : str
+        The sparse format for matrices that are constructed ('csr').
+
+    Products with ufloats and numbers scale the stored elements, @ (and
+    dot) multiplies with UnitArrays, ndarrays and other UnitSparse matrices.
+    + and - work between UnitSparse matrices with the same unit. * with an
+    array or matrix is the elementwise product (see multiply), as for
+    numpy arrays.
+    """
+    #arithmetic with numpy arrays and UnitArray is done here
+    __array_ufunc__ = None
+
+    def __init__(self, matrix, units=None, shape=None, format='csr'):
+        sp = _scipy_sparse()
+        unit = DIMENSIONLESS
+        if isinstance(matrix, UnitSparse):
+            matrix, unit = matrix._matrix, matrix._unit
+        elif not sp.issparse(matrix):
+            if isinstance(matrix, tuple):
+                data, unit = _split(matrix[0])
+                matrix = (data, ) + matrix[1:]
+            else:
+                matrix, unit = _split(matrix)
+            matrix = getattr(sp, format + '_matrix')(matrix, shape=shape)
+        if units is not None:
+            if unit:
+                checkunit(unit, units)
+            unit = as_unit(units)
+        self._matrix = matrix
+        self._unit = unit
+
+    @property
+    def matrix(self):
+        """the scipy.sparse matrix without unit"""
+        return self._matrix
+
+    @property
+    def unit(self):
+        return box(1., self._unit)
+
+    @property
+    def unitDict(self):
+        return self._unit
+
+    @property
+    def values(self):
+        """the stored elements as UnitArray (sharing memory with the matrix)
+
+        This is the data array of the sparse format (not for all formats)."""
+        return box(self._matrix.data, self._unit)
+
+    @property
+    def shape(self):
+        return self._matrix.shape
+
+    @property
+    def ndim(self):
+        return self._matrix.ndim
+
+    @property
+    def nnz(self):
+        return self._matrix.nnz
+
+    @property
+    def dtype(self):
+        return self._matrix.dtype
+
+    @property
+    def T(self):
+        return _new(self._matrix.T, self._unit)
+
+    def transpose(self):
+        return self.T
+
+    def toarray(self):
+        """the dense matrix as UnitArray"""
+        return box(self._matrix.toarray(), self._unit)
+
+    def asformat(self, format):
+        """the matrix in the sparse format format ('csr', 'csc', 'coo', ...)"""
+        return _new(self._matrix.asformat(format), self._unit)
+
+    def tocsr(self):
+        return self.asformat('csr')
+
+    def tocsc(self):
+        return self.asformat('csc')
+
+    def tocoo(self):
+        return self.asformat('coo')
+
+    def copy(self):
+        return _new(self._matrix.copy(), self._unit)
+
+    def asNumber(self, other=None):
+        """the plain sparse matrix in the unit other (see UnitArray.asNumber)"""
+        if other is None:
+            return self._matrix
+        unit, value = conversion_target(other)
+        if unit is not self._unit:
+            checkunit(self._unit, unit)
+        if value == 1:
+            return self._matrix
+        return self._matrix/value
+
+    def rescale(self, other):
+        return self.asNumber(other)
+
+    #arithmetic
+    def multiply(self, other):
+        """the elementwise product with a number, quantity, array or matrix"""
+        value, unit = _split(other)
+        if np.ndim(value) == 0:
+            return _new(self._matrix*value, self._unit*unit)
+        return _new(_scipy_sparse().csr_matrix(self._matrix.multiply(value)),
+                    self._unit*unit)
+
+    def __mul__(self, other):
+        value, unit = _split(other)
+        if np.ndim(value) == 0:
+            return _new(self._matrix*value, self._unit*unit)
+        return self.multiply(other)
+
+    __rmul__ = __mul__
+
+    def __truediv__(self, other):
+        value, unit = _split(other)
+        if np.ndim(value) != 0:
+            return NotImplemented
+        return _new(self._matrix/value, self._unit/unit)
+
+    __div__ = __truediv__
+
+    def __neg__(self):
+        return _new(-self._matrix, self._unit)
+
+    def __pos__(self):
+        return self
+
+    def __abs__(self):
+        return _new(abs(self._matrix), self._unit)
+
+    def __add__(self, other):
+        if not isinstance(other, UnitSparse):
+            return NotImplemented
+        checkunit(self._unit, other._unit)
+        return _new(self._matrix + other._matrix, self._unit)
+
+    def __sub__(self, other):
+        if not isinstance(other, UnitSparse):
+            return NotImplemented
+        checkunit(self._unit, other._unit)
+        return _new(self._matrix - other._matrix, self._unit)
+
+    def __matmul__(self, other):
+        value, unit = _split(other)
+        res = self._matrix @ value
+        if _scipy_sparse().issparse(res):
+            return _new(res, self._unit*unit)
+        return box(_dense(res), self._unit*unit)
+
+    def __rmatmul__(self, other):
+        value, unit = _split(other)
+        #(a @ m).T == m.T @ a.T, scipy multiplies sparse @ dense
+        res = (self._matrix.T @ np.transpose(value)).T
+        return box(_dense(res), unit*self._unit)
+
+    def dot(self, other):
+        return self @ other
+
+    def sum(self, axis=None):
+        """the sum of all elements, or along axis as UnitArray"""
+        res = self._matrix.sum(axis)
+        if axis is not None:
+            res = np.ravel(res)
+        return box(res, self._unit)
+
+    def __repr__(self):
+        return '%s(%r, %s)' % (self.__class__.__name__, self._matrix,
+                               repr(self._unit))
+
+    def __str__(self):
+        return '%s [%s]' % (self._matrix, self._unit.symbol)
@@ -0,0 +1,203 @@
+# -*- coding: utf-8 -*-
+#    ufloat - fast python floats with physical units
+#    Copyright (C) 2015  Christoph Gohle <christoph.gohle@mpq.mpg.de>
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+"""
+Tables of measurement results with a unit for every column.
+
+The rows of a UnitTable are stored in one structured numpy array (one field
+per column) and the units in a dict. Columns come out as UnitArray views of
+that buffer, so nothing is boxed per row:
+
+>>> t = UnitTable(shot=arange(3), detuning=array([1., 2., 3.])*MHz, N=[1e5, 2e5, 3e5])
+>>> t['detuning']*2*pi
+UnitArray(array([ 6283185.30717959, 12566370.61435917, 18849555.92153876]), {'s': -1})
+>>> t[t['detuning'] > 1.5*MHz].sort('N', reverse=True)['shot']
+array([2, 1])
+
+Tables are saved to and loaded from hdf5 files by ufloat.qh5py as compound
+datasets, with the units in the attributes 'unit.<column>'.
+"""
+from __future__ import division
+
+import numpy as np
+from numpy.lib.recfunctions import repack_fields
+
+from .unit import as_unit, DIMENSIONLESS
+from .ufloat import box
+from .uarray import UnitArray
+
+
+def _column(x):
+    """the plain values and the unit of a column"""
+    if isinstance(x, (list, tuple)) and len(x) and hasattr(x[0], 'unitDict'):
+        x = UnitArray.from_ufloats(x)
+    return np.asarray(getattr(x, 'value', x)), getattr(x, 'unitDict', DIMENSIONLESS)
+
+
+class UnitTable(object):
+    """A table with named columns, each with its own dtype and unit.
+
+    Parameters
+    ----------
+    columns : dict or sequence of (name, column) pairs
+        The columns, UnitArrays, ndarrays, lists of ufloats or of numbers.
+        All columns need the same length, scalars are repeated.
+    **kwargs
+        more columns
+
+    Indexing with a column name gives the column (a UnitArray or ndarray
+    view of the table), with a list of names a table with these columns
+    (also a view). Rows are selected with ints (a dict of the values of that
+    row), slices, boolean masks and index arrays (a table). Assigning to a
+    name replaces or adds a column.
+    """
+
+    def __init__(self, columns=(), **kwargs):
+        if isinstance(columns, dict):
+            columns = columns.items()
+        items = [(name, _column(c)) for name, c in list(columns) + list(kwargs.items())]
+        n = max([len(v) for name, (v, u) in items if v.ndim] or [len(items) and 1])
+        data = np.empty(n, [(name, v.dtype, v.shape[1:]) for name, (v, u) in items])
+        for name, (v, u) in items:
+            data[name] = v
+        self._data = data
+        self._units = dict((name, u) for name, (v, u) in items)
+
+    @classmethod
+    def wrap(cls, data, units=None):
+        """a UnitTable using the structured array data without copying it
+
+        units maps column names to units (or unit dicts), missing columns
+        are dimensionless."""
+        res = cls.__new__(cls)
+        res._data = data
+        units = units or {}
+        res._units = dict((name, as_unit(units.get(name)))
+                          for name in data.dtype.names)
+        return res
+
+    @property
+    def data(self):
+        """the structured array that holds the table"""
+        return self._data
+
+    @property
+    def units(self):
+        """the units of the columns as dict"""
+        return dict(self._units)
+
+    @property
+    def columns(self):
+        """the names of the columns"""
+        return list(self._data.dtype.names)
+
+    def keys(self):
+        return self.columns
+
+    def __len__(self):
+        return len(self._data)
+
+    def __iter__(self):
+        return iter(self.columns)
+
+    def __contains__(self, name):
+        return name in self._units
+
+    def __getitem__(self, key):
+        if isinstance(key, str):
+            return box(self._data[key], self._units[key])
+        if isinstance(key, list) and key and all(isinstance(k, str) for k in key):
+            return UnitTable.wrap(self._data[key], self._units)
+        rows = self._data[key]
+        if isinstance(rows, np.ndarray):
+            return UnitTable.wrap(rows, self._units)
+        return dict((name, box(rows[name], self._units[name]))
+                    for name in self.columns)
+
+    def __setitem__(self, key, value):
+        if isinstance(key, str):
+            v, u = _column(value)
+            if (u is self._units.get(key) and v.dtype == self._data.dtype[key].base
+                    and v.shape[1:] == self._data[key].shape[1:]):
+                self._data[key] = v
+            else:
+                #a new or different column (also a new unit, views of the
+                #table keep the old one), the table is copied
+                cols = [(name, self._data[name]) for name in self.columns]
+                if key not in self._units:
+                    cols.append((key, None))
+                cols = [(name, c) if name != key else
+                        (name, np.broadcast_to(v, (len(self), ) + v.shape[1:]))
+                        for name, c in cols]
+                data = np.empty(len(self), [(name, c.dtype, c.shape[1:])
+                                            for name, c in cols])
+                for name, c in cols:
+                    data[name] = c
+                self._data = data
+            self._units[key] = u
+        elif isinstance(value, UnitTable):
+            for name in value.columns:
+                if value._units[name] is not self._units.get(name):
+                    raise ValueError('column %s has unit [%s], not [%s]'
+                                     % (name, value._units[name].symbol,
+                                        self._units[name].symbol))
+            self._data[key] = value._data
+        else:
+            raise TypeError('rows can only be set from a UnitTable')
+
+    def __delitem__(self, name):
+        names = [n for n in self.columns if n != name]
+        if len(names) == len(self.columns):
+            raise KeyError(name)
+        self._data = repack_fields(self._data[names])
+        del self._units[name]
+
+    def copy(self):
+        return UnitTable.wrap(self._data.copy(), self._units)
+
+    def argsort(self, by, reverse=False):
+        """the row order that sorts the table by the column(s) by
+
+        by is a name or a list of names, ties in the first column are
+        broken by the second and so on. The sort is stable."""
+        if isinstance(by, str):
+            by = [by]
+        order = np.lexsort([self._data[name] for name in reversed(by)])
+        if reverse:
+            order = order[::-1]
+        return order
+
+    def sort(self, by, reverse=False):
+        """a copy of the table with the rows sorted by the column(s) by"""
+        return self[self.argsort(by, reverse)]
+
+    def to_dict(self):
+        """the columns as a dict of UnitArray (or ndarray) views"""
+        return dict((name, self[name]) for name in self.columns)
+
+    def __repr__(self):
+        return '%s(%s, %s)' % (self.__class__.__name__, repr(self._data),
+                               dict((name, dict(u)) for name, u in self._units.items()))
+
+    def __str__(self):
+        head = ['%s [%s]' % (name, self._units[name].symbol) if self._units[name]
+                else name for name in self.columns]
+        return '%s with %d rows: %s' % (self.__class__.__name__, len(self),
+                                         ', '.join(head))
+
+    def __reduce__(self):
+        return (UnitTable.wrap, (self._data, self._units))
@@ -27,75 +27,106 @@ units 'ufloat' that is a cython extension type.
 """
 from __future__ import division
 
+import ast
 import numpy as np
 from functools import wraps
 import sys
+from .unit import Unit, UnitCache, as_unit, DIMENSIONLESS
 STRREP = False
 
+#boxing of array elements, see ufloat.box. They are set by the ufloat
+#extension when it is imported (it imports this module).
+_box = None
+_iter_boxed = None
+_boxed_list = None
+#the arithmetic operators, see ufloat.binop
+_binop = None
+
 def mulunit(unit1, unit2):
-    u = unit1.copy()
-    for a, exp in unit2.items():
-        if a in u:
-            u[a] += exp
-            if u[a]==0:
-                u.pop(a)
-        else:
-            u[a] = exp
-    return u
+    return as_unit(unit1)*as_unit(unit2)
 
 def divunit(unit1, unit2):
-    u = unit1.copy()
-    for a, exp in unit2.items():
-        if a in u:
-            u[a] -= exp
-            if u[a]==0:
-                u.pop(a)
-        else:
-            u[a] = -exp
-    return u
+    return as_unit(unit1)/as_unit(unit2)
     
 def simplify_unit(unit):
-    u = unit.copy()
-    for un in unit:
-        if u[un]==0:
-            u.pop(un)
-    
-    return u
+    return as_unit(unit)
 
 def format_unit(unit):
-    nom = ''
-    denom = ''
-    for u, exp in unit.items():
-        if exp > 0:
-            if exp > 1:
-                nom += '%s**%s '%(u,abs(exp))
-            else:
-                nom += '%s '%u
-        else:
-            if exp < -1:
-                denom += '%s**%s '%(u,abs(exp))
-            else:
-                denom += '%s '%u
-    fill = ''
-    if not denom == '':
-        fill = '/'
-        if nom == '':
-            nom = '1'
-
-    return nom.strip()+fill+denom.strip()
+    return as_unit(unit).symbol
 
 
 def powunit(unit, exp):
-    u = {}
-    for unit, e in unit.items():
-        u[unit]=e*exp
-    return u
+    return as_unit(unit)**exp
 
 
 def checkunit(unit1, unit2):
-    if not unit1 == unit2:
+    if as_unit(unit1) is not as_unit(unit2):
         raise ValueError('the two units [%s] and [%s] are not the same.'%(format_unit(unit1), format_unit(unit2)))
 
+#conversion targets given by name, see conversion_target
+_targets = {}
+
+_unit_ops = {ast.Mult: lambda a, b: a*b, ast.Div: lambda a, b: a/b,
+             ast.Pow: lambda a, b: a**b}
+
+def _eval_unit(node, names):
+    """evaluate the parsed unit expression node with the units in names"""
+    if isinstance(node, ast.Expression):
+        return _eval_unit(node.body, names)
+    if isinstance(node, ast.BinOp) and type(node.op) in _unit_ops:
+        return _unit_ops[type(node.op)](_eval_unit(node.left, names),
+                                        _eval_unit(node.right, names))
+    if isinstance(node, ast.UnaryOp) and isinstance(node.op, ast.USub):
+        return -_eval_unit(node.operand, names)
+    if isinstance(node, ast.Name) and node.id in names:
+        return names[node.id]
+    value = getattr(node, 'value', getattr(node, 'n', None))
+    if type(node).__name__ in ('Constant', 'Num') and isinstance(value, (int, float)):
+        return value
+    raise ValueError('not a unit')
+
+def conversion_target(target):
+    """the unit and the value of target, something to convert quantities to
+
+    target is a ufloat, a UnitArray, a unit dict or a string: the name of a
+    unit from ufloat.units ('MHz'), an expression of these names and numbers
+    ('mW/cm**2', '1/s', '1e4*G') or a unit symbol ('kg m**2/s**2'). Strings
+    are looked up once and remembered, so converting to 'MHz' costs a
+    dictionary lookup.
+
+    A quantity with the unit returned is converted to target by dividing its
+    value by the value returned.
+    """
+    if isinstance(target, str):
+        try:
+            return _targets[target]
+        except KeyError:
+            pass
+        from . import funits, unit_from_string
+        names = dict((k, v) for k, v in vars(funits).items()
+                     if hasattr(v, 'unitDict'))
+        try:
+            q = _eval_unit(ast.parse(target.strip(), mode='eval'), names)
+        except (SyntaxError, ValueError):
+            try:
+                q = as_unit(unit_from_string(target))
+            except (ValueError, IndexError):
+                q = None
+            if q is None or any(k not in names for k in q):
+                raise ValueError('unknown unit %r' % target)
+        if isinstance(q, Unit):
+            res = (q, 1.)
+        else:
+            res = (as_unit(getattr(q, 'unitDict', None)), float(getattr(q, 'value', q)))
+        _targets[target] = res
+        return res
+    if isinstance(target, dict):
+        return as_unit(target), 1.
+    value = getattr(target, 'value', target)
+    if np.ndim(value) == 0:
+        value = float(value)
+    return as_unit(getattr(target, 'unitDict', None)), value
+
 class with_doc:
 
     """
@@ -145,26 +176,11 @@ def scale_other_units(f):
             ounit = other._unit
         else:
             other = np.asanyarray(other).view(type=UnitArray)
-            ounit = {}
+            ounit = DIMENSIONLESS
         checkunit(ounit, self._unit)
         return f(self, other, *args)
     return g
 
-def protected_multiplication(f):
-    @wraps(f)
-    def g(self, other, *args):
-        if getattr(other, '_unit', None):
-            try:
-#                print(self)
-#                print(type(self))
-#                print(self.base)
-#                print(type(self.base))
-                assert not isinstance(self.base, UnitArray)
-            except AssertionError:
-                raise ValueError('can not modify units of a view of a UnitArray')
-        return f(self, other, *args)
-    return g
-
 def check_uniform(f):
     @wraps(f)
     def g(self, other, *args):
@@ -178,29 +194,117 @@ def check_uniform(f):
         return f(self, other, *args)
     return g
 
-def protected_power(f):
-    @wraps(f)
-    def g(self, other, *args):
-        if other != 1:
-            try:
-                assert not isinstance(self.base, UnitArray)
-            except AssertionError:
-                raise ValueError('can not modify units of a view of a UnitArray')
-        return f(self, other, *args)
-    return g
-
-def wrap_comparison(f):
-    from .ufloat import ufloat
-    @wraps(f)
-    def g(self, other):
-        if isinstance(other, UnitArray):
-            other = other.rescale(self.unit)
-        elif isinstance(other, ufloat):
-            other = other.rescale(self.unit)
-
-        #print 'comparison', self, other
-        return f(self, other)
-    return g
+def _cmp_value(a, other):
+    """the plain value of other to compare with the UnitArray a
+
+    Quantities need the unit of a (checked by identity, nothing is converted
+    or copied), numbers and arrays without unit are compared as they are."""
+    unit = getattr(other, 'unitDict', None)
+    if unit is None:
+        return other
+    if unit is not a._unit:
+        checkunit(a._unit, unit)
+    if isinstance(other, np.ndarray):
+        return other.view(np.ndarray)
+    return other.value
+
+
+def _plain(x):
+    """x without unit, as ndarray view for UnitArray"""
+    if isinstance(x, UnitArray):
+        return x.view(np.ndarray)
+    return x
+
+
+def _quantity_array(x):
+    """quantities (ufloat, ucomplex) as 0-d UnitArray, other operands as they are"""
+    if isinstance(x, np.ndarray) or not hasattr(x, 'unitDict'):
+        return x
+    res = np.asarray(x.value).view(UnitArray)
+    res._unit = x.unitDict
+    return res
+
+
+def _plain_out(out, unit):
+    """the plain array for an out argument that will get the given unit"""
+    if out is None:
+        return None
+    if isinstance(out, UnitArray):
+        return out.view(np.ndarray)
+    if unit:
+        raise ValueError('can\'t store a result with unit [%s] in an array '
+                         'without unit' % unit.symbol)
+    return out
+
+
+def _wrap(value, unit):
+    """value with unit: UnitArray for arrays, ufloat for scalars
+
+    Values without unit are returned as they are."""
+    if not unit:
+        return value
+    if isinstance(value, np.ndarray):
+        value = value.view(UnitArray)
+        value._unit = unit
+        return value
+    return _scalar(value, unit)
+
+
+def _wrap_out(value, unit, out):
+    """like _wrap, but returns out (with the unit set) if it is given"""
+    if out is None:
+        return _wrap(value, unit)
+    if isinstance(out, UnitArray):
+        out._unit = unit
+    return out
+
+
+def _plain_value(x, unit):
+    """the value of x (a number or quantity) in the given unit"""
+    if getattr(x, 'unitDict', DIMENSIONLESS) is not unit:
+        if not np.all(getattr(x, 'value', x) == 0):
+            checkunit(getattr(x, 'unitDict', DIMENSIONLESS), unit)
+    return getattr(x, 'value', x)
+
+
+#The dtype of a UnitArray is its storage precision. float16 and float32
+#arrays (camera frames, digitizer traces) stay that way in arithmetic with
+#ufloats and numbers, but reductions accumulate in double precision (unless
+#a dtype is given) and only store array results with the dtype of the array.
+_ACCUMULATE = {np.dtype(np.float16): np.dtype(np.float64),
+               np.dtype(np.float32): np.dtype(np.float64),
+               np.dtype(np.complex64): np.dtype(np.complex128)}
+
+def _accumulate(f, a, out, kwargs):
+    """f(a, out=out, **kwargs) for a reduction f of the plain array a
+
+    If kwargs has dtype None and a is of reduced precision the reduction is
+    done in double precision, see _ACCUMULATE."""
+    acc = _ACCUMULATE.get(getattr(a, 'dtype', None))
+    if acc is None or 'dtype' not in kwargs or kwargs['dtype'] is not None:
+        return f(a, out=out, **kwargs)
+    kwargs['dtype'] = acc
+    res = f(a, out=out, **kwargs)
+    if out is None and isinstance(res, np.ndarray):
+        res = res.astype(a.dtype)
+    return res
+
+
+def _reduced_size(shape, axis):
+    """the number of elements that are combined by a reduction over axis"""
+    if axis is None:
+        return int(np.prod(shape))
+    if not isinstance(axis, tuple):
+        axis = (axis, )
+    return int(np.prod([shape[a] for a in axis]))
+
+
+def _scalar(value, unit):
+    """a ufloat (or ucomplex for complex values) with the given unit"""
+    from .ufloat import ufloat, ucomplex
+    if np.iscomplexobj(value):
+        return ucomplex(complex(value), unit)
+    return ufloat(value, unit)
 
 
 class UnitArray(np.ndarray):
@@ -225,22 +329,78 @@ class UnitArray(np.ndarray):
                 l = 0
             if l <= 1:
                 if hasattr(data,'_unit'):
-                    if data._unit == {}:
+                    if not data._unit:
                         return data.value
-                    return ufloat(data.value, data._unit)
+                    return _scalar(data.value, data._unit)
                 elif units and not units == {}:
-                    return ufloat(data, units)
+                    return _scalar(data, units)
                 else:
                     return data
 
         if units and not units == {} or reconstruct:        
             ret = np.array(data, dtype=dtype, copy=copy).view(cls)
-            ret._unit = units
+            ret._unit = as_unit(units)
         else:
             ret = np.array(data, dtype=dtype, copy=copy)
         return ret
 
 
+    @classmethod
+    def from_number(cls, values, units, copy=True):
+        """a UnitArray from values given in units, the inverse of asNumber
+
+        units can be anything conversion_target understands, e.g. 'MHz'.
+        With copy=False the array values is scaled in place and used as the
+        buffer of the result (nothing at all is done to it if the value of
+        units is 1)."""
+        unit, value = conversion_target(units)
+        if copy:
+            data = np.multiply(values, value)
+        else:
+            data = np.asarray(values)
+            if np.ndim(value) or value != 1:
+                np.multiply(data, value, out=data)
+        return cls.wrap(data, unit)
+
+    @classmethod
+    def wrap(cls, buffer, units=None, dtype=None):
+        """a UnitArray that shares the memory of buffer, nothing is copied
+
+        Parameters
+        ----------
+        buffer : ndarray or any object supporting the buffer protocol
+            (memoryview, bytearray, array.array, mmap, ...)
+        units : the unit of the array
+            A dictionary of the form {'unit_name':exponent,...}. Defaults to
+            the unit of buffer if it has one, else dimensionless. The result
+            is a UnitArray also if it is dimensionless.
+        dtype : data type
+            for buffers that are not arrays, the type of the elements in the
+            buffer. Defaults to the format of the buffer.
+        """
+        if isinstance(buffer, np.ndarray):
+            value = buffer.view(np.ndarray)
+        elif dtype is not None:
+            value = np.frombuffer(buffer, dtype)
+        else:
+            value = np.asarray(memoryview(buffer))
+        if units is None:
+            units = getattr(buffer, '_unit', None)
+        ret = value.view(cls)
+        ret._unit = as_unit(units)
+        return ret
+
+    @classmethod
+    def from_ufloats(cls, iterable, units=None):
+        """a UnitArray from an iterable of ufloats (e.g. a list of results)
+
+        All elements must have the same unit, which is checked while the
+        values are copied into the array. Plain numbers are accepted if the
+        elements are dimensionless. units gives the unit for an empty
+        iterable (and is checked otherwise)."""
+        from .ufloat import from_ufloats
+        return cls.wrap(from_ufloats(iterable, units))
+
     @property
     def value(self):
         return self.view(type=np.ndarray)
@@ -254,11 +414,26 @@ class UnitArray(np.ndarray):
     def unitDict(self):
         return self._unit
 
-    def asNumber(self, other = None):
-        if other:
-            checkunit(self.unitDict, other.unitDict)
-            return self.value/other.value
-        return self.value
+    def asNumber(self, other = None, out = None):
+        """the values as plain ndarray, in the unit other
+
+        other can be anything conversion_target understands, e.g. f.MHz or
+        'MHz'. The unit of the array has to be the same as that of other.
+        The result is a view of the array if the values don't change (other
+        is None or has the value 1) and no out array is given. Otherwise it
+        is written to out (which may be self.value to convert in place)."""
+        if other is None:
+            if out is None:
+                return self.value
+            out[...] = self.value
+            return out
+        unit, value = conversion_target(other)
+        if unit is not self._unit:
+            raise ValueError('the two units [%s] and [%s] are not the same.'
+                             % (self._unit.symbol, unit.symbol))
+        if out is None and np.ndim(value) == 0 and value == 1:
+            return self.value
+        return np.true_divide(self.value, value, out=out)
 
     def rescale(self, other):
         return self.asNumber(other)
@@ -276,7 +451,7 @@ class UnitArray(np.ndarray):
         # might be related to numpy ticket # 826
         #print 'astype', self, dtype
         if not isinstance(ret, type(self)):
-            return ufloat(ret, self._unit)
+            return _scalar(ret, self._unit)
             if self.__array_priority__ >= UnitArray.__array_priority__:
                 ret = type(self)(ret, self._unit)
             else:
@@ -284,50 +459,86 @@ class UnitArray(np.ndarray):
 
         return ret
 
+    #True once a UnitArray view of the data of this array has been made
+    _has_views = False
+
     def __array_finalize__(self, obj):
         #print 'finalize', self, obj
-        self._unit = getattr(obj, '_unit', {})
-
-    def __array_prepare__(self, obj, context=None):
-        #print 'prepare', self, obj, context
-        if context is not None:
-            uf, objs, huh = context
-            if uf.__name__.startswith('is'):
-                return obj
-            #print self, obj, res, uf, objs
-            try:
-                _unit = p_dict[uf](*objs)
-            except KeyError:
-                raise ValueError('ufunc %r not supported by units' % uf)
+        self._unit = getattr(obj, '_unit', DIMENSIONLESS)
+        #mark the owner of the data (see _iscale)
+        base = self.base
+        while base is not None:
+            owner = getattr(base, 'base', None)
+            if owner is None:
+                if isinstance(base, UnitArray):
+                    base._has_views = True
+                break
+            base = owner
+
+    def __array_ufunc__(self, ufunc, method, *inputs, **kwargs):
+        """run ufunc on the plain values and attach the unit of the result
+
+        The unit is looked up once (see _ufunc_unit and _reduce_unit),
+        the ufunc runs on ndarray views of the operands and out arrays and
+        the result is wrapped once. Results without unit are plain arrays,
+        scalar results with unit are ufloat. Quantity operands are handled
+        as 0-d UnitArrays, also if numpy calls ufloat.__array_ufunc__."""
+        out = kwargs.get('out', ())
+        if method == '__call__' and not kwargs and ufunc in _binops:
+            #arithmetic on quantities and numbers, e.g. from numpy scalars
+            res = _binop(ufunc, inputs[0], inputs[1], False)
+            if res is not NotImplemented:
+                return res
+        inputs = tuple(_quantity_array(x) for x in inputs)
+        if method == '__call__' and not out:
+            #the common case, kept short
+            unit = _ufunc_unit(ufunc, inputs)
+            res = ufunc(*[x.view(np.ndarray) if isinstance(x, UnitArray) else x
+                          for x in inputs], **kwargs)
+            return _wrap(res, unit)
+        if method == '__call__' or method == 'outer':
+            unit = _ufunc_unit(ufunc, inputs)
+        elif method == 'at':
+            #ufunc.at(a, indices[, b]) works in place, the unit can't change
+            unit = _ufunc_unit(ufunc, inputs[:1] + inputs[2:])
+            if unit is not getattr(inputs[0], '_unit', DIMENSIONLESS):
+                raise ValueError('%s.at would change the unit of [%s] to [%s]'
+                                 % (ufunc.__name__, format_unit(inputs[0]._unit), unit.symbol))
         else:
-            _unit = {}
-            
-        #print 'prepare unit', _unit
-        if not _unit == {}:
-            res = obj.view(UnitArray)
-            res._unit = _unit
-        else:
-            res = obj
-        #print 'prepare result', res
-        return res
-
-    def __array_wrap__(self, obj, context=None):
-        #print 'wrap', self, obj, context
-        if not isinstance(obj, UnitArray):
-            # backwards compatibility with numpy-1.3
-            obj = self.__array_prepare__(obj, context)
-        return obj
+            unit = _reduce_unit(ufunc, method, inputs[0], kwargs)
+            if 'initial' in kwargs:
+                kwargs['initial'] = _plain_value(kwargs['initial'], unit)
+        inputs = tuple(_plain(x) for x in inputs)
+        if out:
+            kwargs['out'] = tuple(_plain_out(o, unit) for o in out)
+        res = getattr(ufunc, method)(*inputs, **kwargs)
+        if method == 'at':
+            return None
+        if out:
+            for o in out:
+                if isinstance(o, UnitArray):
+                    o._unit = unit
+            return out[0] if len(out) == 1 else out
+        return _wrap(res, unit)
+
+    def __array_function__(self, func, types, args, kwargs):
+        """numpy functions with unit support (see f_dict)"""
+        try:
+            f = f_dict[func]
+        except KeyError:
+            return super(UnitArray, self).__array_function__(func, types, args, kwargs)
+        if not all(issubclass(t, np.ndarray) for t in types):
+            #let the other type (e.g. MixedUnitArray) handle it
+            return NotImplemented
+        return f(*args, **kwargs)
 
     @with_doc(np.ndarray.__add__)
-    @scale_other_units
     def __add__(self, other):
-        return super(UnitArray, self).__add__(other)
+        return _binop(np.add, self, other)
 
     @with_doc(np.ndarray.__radd__)
-    @scale_other_units
     def __radd__(self, other):
-        return np.add(other, self)
-        return super(UnitArray, self).__radd__(other)
+        return _binop(np.add, other, self)
 
     @with_doc(np.ndarray.__iadd__)
     @scale_other_units
@@ -335,15 +546,12 @@ class UnitArray(np.ndarray):
         return super(UnitArray, self).__iadd__(other)
 
     @with_doc(np.ndarray.__sub__)
-    @scale_other_units
     def __sub__(self, other):
-        return super(UnitArray, self).__sub__(other)
+        return _binop(np.subtract, self, other)
 
     @with_doc(np.ndarray.__rsub__)
-    @scale_other_units
     def __rsub__(self, other):
-        return np.subtract(other, self)
-        return super(UnitArray, self).__rsub__(other)
+        return _binop(np.subtract, other, self)
 
     @with_doc(np.ndarray.__isub__)
     @scale_other_units
@@ -351,55 +559,91 @@ class UnitArray(np.ndarray):
         return super(UnitArray, self).__isub__(other)
 
     @with_doc(np.ndarray.__mod__)
-    @scale_other_units
     def __mod__(self, other):
-        return super(UnitArray, self).__mod__(other)
+        return _binop(np.remainder, self, other)
+
+    @with_doc(np.ndarray.__rmod__)
+    def __rmod__(self, other):
+        return _binop(np.remainder, other, self)
 
     @with_doc(np.ndarray.__imod__)
     @scale_other_units
     def __imod__(self, other):
         return super(UnitArray, self).__imod__(other)
 
-    @with_doc(np.ndarray.__imul__)
-    @protected_multiplication
-    def __imul__(self, other):
-        return super(UnitArray, self).__imul__(other)
+    @with_doc(np.ndarray.__mul__)
+    def __mul__(self, other):
+        return _binop(np.multiply, self, other)
 
     @with_doc(np.ndarray.__rmul__)
     def __rmul__(self, other):
-        return np.multiply(other, self)
-        return super(UnitArray, self).__rmul__(other)
+        return _binop(np.multiply, other, self)
+
+    def _iscale(self, uf, value, unit):
+        """self = uf(self, value) with the result unit, for *=, /= and **=
+
+        Every UnitArray has its own unit, also views. Changing data that
+        other UnitArrays see under their unit would change the meaning of
+        their values. So if the unit changes, the data is only modified in
+        place if self owns it and no UnitArray view of it was ever made.
+        Otherwise self is relabelled if its values don't change (value is
+        1), or its values are copied first (copy on write). Then the result
+        is a new array, which the augmented assignment binds to the name of
+        self."""
+        if unit is not self._unit:
+            if np.ndim(value) == 0 and value == 1:
+                self._unit = unit
+                return self
+            if self.base is not None or self._has_views:
+                res = self.view(np.ndarray).copy()
+                uf(res, value, out=res)
+                res = res.view(type(self))
+                res._unit = unit
+                return res
+        plain = self.view(np.ndarray)
+        uf(plain, value, out=plain)
+        self._unit = unit
+        return self
 
-    @with_doc(np.ndarray.__itruediv__)
-    @protected_multiplication
-    def __itruediv__(self, other):
-        return super(UnitArray, self).__itruediv__(other)
+    @with_doc(np.ndarray.__imul__)
+    def __imul__(self, other):
+        return self._iscale(np.multiply, _nominal(other),
+                            mulunit(self._unit, getattr(other, 'unitDict', DIMENSIONLESS)))
+
+    @with_doc(np.ndarray.__truediv__)
+    def __truediv__(self, other):
+        return _binop(np.true_divide, self, other)
 
     @with_doc(np.ndarray.__rtruediv__)
     def __rtruediv__(self, other):
-        return np.true_divide(other, self)
-        return super(UnitArray, self).__rtruediv__(other)
+        return _binop(np.true_divide, other, self)
+
+    @with_doc(np.ndarray.__itruediv__)
+    def __itruediv__(self, other):
+        return self._iscale(np.true_divide, _nominal(other),
+                            divunit(self._unit, getattr(other, 'unitDict', DIMENSIONLESS)))
 
     if sys.version_info[0] < 3:
+        @with_doc(np.ndarray.__div__)
+        def __div__(self, other):
+            return _binop(np.true_divide, self, other)
+
         @with_doc(np.ndarray.__idiv__)
-        @protected_multiplication
         def __idiv__(self, other):
-            return super(UnitArray, self).__itruediv__(other)
+            return self.__itruediv__(other)
 
         @with_doc(np.ndarray.__rdiv__)
         def __rdiv__(self, other):
-            return np.divide(other, self)
+            return _binop(np.true_divide, other, self)
 
     @with_doc(np.ndarray.__pow__)
-    @check_uniform
     def __pow__(self, other):
-        return super(UnitArray, self).__pow__(other)
+        return _binop(np.power, self, other)
 
     @with_doc(np.ndarray.__ipow__)
     @check_uniform
-    @protected_power
     def __ipow__(self, other):
-        return super(UnitArray, self).__ipow__(other)
+        return self._iscale(np.power, other, powunit(self._unit, other.max()))
 
     def __round__(self, decimals=0):
         return np.around(self, decimals)
@@ -421,101 +665,82 @@ class UnitArray(np.ndarray):
 
     @with_doc(np.ndarray.__str__)
     def __str__(self):
-        dims = format_unit(getattr(self,'_unit',{}))
+        dims = format_unit(getattr(self,'_unit',DIMENSIONLESS))
         return '%s [%s]'%(repr(self.value), dims)
 
     @with_doc(np.ndarray.__getitem__)
     def __getitem__(self, key):
-        if isinstance(key, int):
-            # This might be resolved by issue # 826
-            return UnitArray(self.value[key], self._unit)
-        else:
-            return super(UnitArray, self).__getitem__(key)
+        return _box(self.value[key], self._unit)
+
+    def __iter__(self):
+        if self.ndim == 0:
+            raise TypeError('iteration over a 0-d array')
+        return _iter_boxed(self.value, self._unit)
+
+    @with_doc(np.ndarray.item)
+    def item(self, *args):
+        return _box(self.value.item(*args), self._unit)
 
     @with_doc(np.ndarray.__setitem__)
     def __setitem__(self, key, value):
-        if isinstance(value, UnitArray):
-            if self._unit != value._unit:
-                value = value.rescale(self._unit)
+        unit = getattr(value, 'unitDict', None)
+        if unit is not None:
+            if unit is not self._unit:
+                value = value.rescale(self.unit)
+            value = getattr(value, 'value', value)
         self.value[key] = value
 
     @with_doc(np.ndarray.__lt__)
-    @wrap_comparison
     def __lt__(self, other):
-        #print("#lt", self, other)
-        return self.value < getattr(other, 'value', other)
+        return self.view(np.ndarray) < _cmp_value(self, other)
 
     @with_doc(np.ndarray.__le__)
-    @wrap_comparison
     def __le__(self, other):
-        #print("#le", self, other)
-        return self.value <= getattr(other, 'value', other)
+        return self.view(np.ndarray) <= _cmp_value(self, other)
 
     @with_doc(np.ndarray.__eq__)
     def __eq__(self, other):
-        #print("#eq", self, other)
-        try:
-            other = other.rescale(self.unit)
-        except (ValueError, AttributeError):
+        #quantities with other units (and numbers) are never equal
+        if getattr(other, 'unitDict', None) is not self._unit:
             return np.zeros(self.shape, '?')
-        #print("#eq", self.value, other)
-        return self.value == other
+        return self.view(np.ndarray) == _cmp_value(self, other)
 
     @with_doc(np.ndarray.__ne__)
     def __ne__(self, other):
-        #print("#ne", self, other)
-        #print '#ne', self, other        
-        try:
-            other = other.rescale(self.unit)
-            return self.value != other
-        except (ValueError, AttributeError):
-            #either wrong unit or no unit
+        if getattr(other, 'unitDict', None) is not self._unit:
             return np.ones(self.shape, '?')
-        #print("#neq", self.value, other)
-        return self.value != other
-            
+        return self.view(np.ndarray) != _cmp_value(self, other)
+
     @with_doc(np.ndarray.__ge__)
-    @wrap_comparison
     def __ge__(self, other):
-        #print("#ge", self, other)
-        return self.value >= getattr(other, 'value', other)
+        return self.view(np.ndarray) >= _cmp_value(self, other)
 
     @with_doc(np.ndarray.__gt__)
-    @wrap_comparison
     def __gt__(self, other):
-        #print("#gt", self, other)
-        return self.value > getattr(other, 'value', other)
+        return self.view(np.ndarray) > _cmp_value(self, other)
 
-    #I don't think this implementation is particularly efficient,
-    #perhaps there is something better
     @with_doc(np.ndarray.tolist)
     def tolist(self):
-        #first get a dummy array from the ndarray method
-        work_list = self.value.tolist()
-        #now go through and replace all numbers with the appropriate UnitArray
-        self._tolist(work_list)
-        return work_list
-
-    def _tolist(self, work_list):
-        for i in range(len(work_list)):
-            #if it's a list then iterate through that list
-            if isinstance(work_list[i], list):
-                self._tolist(work_list[i])
-            else:
-                #if it's a number then replace it
-                # with the appropriate quantity
-                work_list[i] = UnitArray(work_list[i], self._unit)
+        return _boxed_list(self.value, self._unit)
 
     #need to implement other Array conversion methods:
-    # item, itemset, tofile, dump, byteswap
+    # itemset, tofile, dump, byteswap
 
     @with_doc(np.ndarray.sum)
-    def sum(self, axis=None, dtype=None, out=None):
-        return UnitArray(
-            self.value.sum(axis, dtype, out),
-            self._unit,
-            copy=False
-        )
+    def sum(self, axis=None, dtype=None, out=None, **kwargs):
+        return self._reduce(np.ndarray.sum, self._unit, out, axis=axis,
+                            dtype=dtype, **kwargs)
+
+    def _reduce(self, f, unit, out, **kwargs):
+        """the reduction f of the plain values, with the given unit
+
+        The reductions take the numpy keyword arguments (axis, keepdims,
+        where, ...). initial is converted to the unit of the array and out
+        gets the unit of the result."""
+        if 'initial' in kwargs:
+            kwargs['initial'] = _plain_value(kwargs['initial'], self._unit)
+        return _wrap_out(_accumulate(f, self.value, _plain_out(out, unit), kwargs),
+                         unit, out)
 
     @with_doc(np.ndarray.fill)
     def fill(self, value):
@@ -532,7 +757,7 @@ class UnitArray(np.ndarray):
         values - must be an UnitArray with the same units as self
         """
         if isinstance(values, UnitArray):
-            if values._unit == self._unit:
+            if values._unit is self._unit:
                 self.value.put(indicies, values, mode)
             else:
                 raise ValueError("values must have the same units as self")
@@ -542,124 +767,88 @@ class UnitArray(np.ndarray):
     # choose does not function correctly, and it is not clear
     # how it would function, so for now it will not be implemented
 
+    @with_doc(np.ndarray.sort)
+    def sort(self, axis=-1, kind=None, order=None):
+        self.view(np.ndarray).sort(axis, kind, order)
+
     @with_doc(np.ndarray.argsort)
-    def argsort(self, axis=-1, kind='quick', order=None):
-        return self.value.argsort(axis, kind, order)
+    def argsort(self, axis=-1, kind=None, order=None):
+        return self.view(np.ndarray).argsort(axis, kind, order)
 
     @with_doc(np.ndarray.searchsorted)
-    def searchsorted(self,values, side='left'):
-        if not isinstance (values, UnitArray):
-            values = UnitArray(values, copy=False)
-
-        if values._unit != self._unit:
-            raise ValueError("values does not have the same units as self")
+    def searchsorted(self, values, side='left', sorter=None):
+        return self.view(np.ndarray).searchsorted(_plain_value(values, self._unit), side, sorter)
 
-        return self.value.searchsorted(values.value, side)
+    @with_doc(np.ndarray.dot)
+    def dot(self, b, out=None):
+        return _f_dot(self, b, out)
 
     @with_doc(np.ndarray.nonzero)
     def nonzero(self):
         return self.value.nonzero()
 
     @with_doc(np.ndarray.max)
-    def max(self, axis=None, out=None):
-        return UnitArray(
-            self.value.max(),
-            self._unit,
-            copy=False
-        )
+    def max(self, axis=None, out=None, **kwargs):
+        return self._reduce(np.ndarray.max, self._unit, out, axis=axis, **kwargs)
 
     @with_doc(np.ndarray.min)
-    def min(self, axis=None, out=None):
-        return UnitArray(
-            self.value.min(),
-            self._unit,
-            copy=False
-        )
+    def min(self, axis=None, out=None, **kwargs):
+        return self._reduce(np.ndarray.min, self._unit, out, axis=axis, **kwargs)
 
     @with_doc(np.ndarray.argmin)
-    def argmin(self,axis=None, out=None):
-        return self.value.argmin()
+    def argmin(self, axis=None, out=None, **kwargs):
+        return self.value.argmin(axis, out, **kwargs)
+
+    @with_doc(np.ndarray.argmax)
+    def argmax(self, axis=None, out=None, **kwargs):
+        return self.value.argmax(axis, out, **kwargs)
 
     @with_doc(np.ndarray.ptp)
-    def ptp(self, axis=None, out=None):
-        return UnitArray(
-            self.value.ptp(),
-            self._unit,
-            copy=False
-        )
+    def ptp(self, axis=None, out=None, **kwargs):
+        return self._reduce(np.ndarray.ptp, self._unit, out, axis=axis, **kwargs)
 
     @with_doc(np.ndarray.clip)
-    def clip(self, min=None, max=None, out=None):
+    def clip(self, min=None, max=None, out=None, **kwargs):
         if min is None and max is None:
             raise ValueError("at least one of min or max must be set")
-        else:
-            if min is None: min = UnitArray(-np.Inf, self._unit)
-            if max is None: max = UnitArray(np.Inf, self._unit)
-
-        if self._unit and not \
-                (isinstance(min, UnitArray) and isinstance(max, UnitArray)):
-            raise ValueError(
-                "both min and max must be Quantities with compatible units"
-            )
-
-        clipped = self.value.clip(
-            min.rescale(self._unit).value,
-            max.rescale(self._unit).value,
-            out
-        )
-        return UnitArray(clipped, self._unit, copy=False)
+        return _f_clip(self, min, max, out, **kwargs)
 
     @with_doc(np.ndarray.round)
     def round(self, decimals=0, out=None):
-        return UnitArray(
-            self.value.round(decimals, out),
-            self._unit,
-            copy=False
-        )
+        return _wrap_out(self.value.round(decimals, _plain_out(out, self._unit)),
+                         self._unit, out)
 
     @with_doc(np.ndarray.trace)
     def trace(self, offset=0, axis1=0, axis2=1, dtype=None, out=None):
-        return UnitArray(
-            self.value.trace(offset, axis1, axis2, dtype, out),
-            self._unit,
-            copy=False
-        )
+        return _wrap_out(self.value.trace(offset, axis1, axis2, dtype,
+                                          _plain_out(out, self._unit)),
+                         self._unit, out)
 
     @with_doc(np.ndarray.mean)
-    def mean(self, axis=None, dtype=None, out=None):
-        return UnitArray(
-            self.value.mean(axis, dtype, out),
-            self._unit,
-            copy=False)
+    def mean(self, axis=None, dtype=None, out=None, **kwargs):
+        return self._reduce(np.ndarray.mean, self._unit, out, axis=axis,
+                            dtype=dtype, **kwargs)
 
     @with_doc(np.ndarray.var)
-    def var(self, axis=None, dtype=None, out=None):
-        return UnitArray(
-            self.value.var(axis, dtype, out),
-            self._unit**2,
-            copy=False
-        )
+    def var(self, axis=None, dtype=None, out=None, ddof=0, **kwargs):
+        return self._reduce(np.ndarray.var, self._unit**2, out, axis=axis,
+                            dtype=dtype, ddof=ddof, **kwargs)
 
     @with_doc(np.ndarray.std)
-    def std(self, axis=None, dtype=None, out=None):
-        return UnitArray(
-            self.value.std(axis, dtype, out),
-            self._unit,
-            copy=False
-        )
+    def std(self, axis=None, dtype=None, out=None, ddof=0, **kwargs):
+        return self._reduce(np.ndarray.std, self._unit, out, axis=axis,
+                            dtype=dtype, ddof=ddof, **kwargs)
 
     @with_doc(np.ndarray.prod)
-    def prod(self, axis=None, dtype=None, out=None):
-        if axis == None:
-            power = self.size
-        else:
-            power = self.shape[axis]
-
-        return UnitArray(
-            self.value.prod(axis, dtype, out),
-            self._unit**power,
-            copy=False
-        )
+    def prod(self, axis=None, dtype=None, out=None, **kwargs):
+        unit = self._unit
+        if unit:
+            if kwargs.get('where', True) is not True:
+                raise ValueError('prod with where is not supported for '
+                                 'quantities with unit [%s]' % unit.symbol)
+            unit = unit**_reduced_size(self.shape, axis)
+        return self._reduce(np.ndarray.prod, unit, out, axis=axis,
+                            dtype=dtype, **kwargs)
 
     @with_doc(np.ndarray.cumprod)
     def cumprod(self, axis=None, dtype=None, out=None):
@@ -685,14 +874,14 @@ class UnitArray(np.ndarray):
                  self.dtype,
                  self.flags.fnc,
                  self.tostring(cf),
-                 self._unit,
+                 dict(self._unit),
                  )
         return state
 
     def __setstate__(self, state):
         (ver, shp, typ, isf, raw, units) = state
         np.ndarray.__setstate__(self, (shp, typ, isf, raw))
-        self._unit = units
+        self._unit = as_unit(units)
 
     def __reduce__(self):
         """
@@ -710,8 +899,177 @@ def _reconstruct_quantity(subtype, baseclass, baseshape, basetype,):
     _data = np.ndarray.__new__(baseclass, baseshape, basetype)
     return subtype.__new__(subtype, _data, dtype=basetype, unitdef = True, copy=False, reconstruct=True)
 
+def _value_sigma(x):
+    """split x into the part without uncertainty and its standard deviation"""
+    from .ufloat import uncertain
+    if isinstance(x, UncertainArray):
+        return x.view(UnitArray), x._sigma
+    if isinstance(x, uncertain):
+        return x.nominal, getattr(x.sigma, 'value', x.sigma)
+    return x, 0.
+
+def _with_sigma(value, sigma):
+    """attach the standard deviation sigma to the result value"""
+    from .ufloat import uncertain
+    if isinstance(value, np.ndarray):
+        return UncertainArray(value, sigma, copy=False)
+    return uncertain(value, np.asarray(sigma).item())
+
+def _nominal(x):
+    """the plain values of x"""
+    return np.asarray(getattr(x, 'value', x))
+
+def _same_elements(a, b):
+    """True if the arrays a and b are the same elements of the same memory"""
+    return (a.shape == b.shape and a.strides == b.strides and a.dtype == b.dtype
+            and a.__array_interface__['data'][0] == b.__array_interface__['data'][0])
+
+def _sigma_method(name):
+    """the ndarray method name, applied to the values and the standard deviations"""
+    method = getattr(np.ndarray, name)
+    @with_doc(method)
+    def f(self, *args, **kwargs):
+        return UncertainArray(getattr(self.nominal, name)(*args, **kwargs),
+                              getattr(self._sigma, name)(*args, **kwargs), copy=False)
+    f.__name__ = name
+    return f
+
+
+class UncertainArray(UnitArray):
+    """A UnitArray with a standard deviation for every element.
+
+    The standard deviations are propagated linearly through +, -, *, / and
+    **, assuming that the errors of all elements are independent. Other
+    operations (ufuncs, reductions, comparisons) work on the values and return
+    a UnitArray without uncertainty. Indexing single elements gives uncertain
+    scalars. Indexing, transpose, reshape, ravel, squeeze and swapaxes give
+    views with the matching standard deviations, other views of the data
+    (e.g. diagonal) have unknown (nan) standard deviations.
+    """
+
+    def __new__(cls, data, sigma=0., units={}, dtype=None, copy=True):
+        if hasattr(data, '_unit'):
+            units = data._unit
+        ret = np.array(getattr(data, 'value', data), dtype=dtype, copy=copy).view(cls)
+        ret._unit = as_unit(units)
+        sigma = getattr(sigma, 'value', sigma)
+        dtype = ret.dtype if ret.dtype.kind == 'f' else float
+        ret._sigma = np.abs(np.broadcast_to(sigma, ret.shape)).astype(dtype)
+        return ret
+
+    def __array_finalize__(self, obj):
+        self._unit = getattr(obj, '_unit', DIMENSIONLESS)
+        sigma = getattr(obj, '_sigma', None)
+        if sigma is None:
+            sigma = np.zeros(self.shape)
+        elif not _same_elements(self, obj):
+            #the elements of other views of obj can't be matched with its
+            #sigma here (the methods below transform sigma like the values),
+            #their uncertainty is unknown
+            sigma = np.full(self.shape, np.nan)
+        self._sigma = sigma
+
+    transpose = _sigma_method('transpose')
+    reshape = _sigma_method('reshape')
+    ravel = _sigma_method('ravel')
+    flatten = _sigma_method('flatten')
+    squeeze = _sigma_method('squeeze')
+    swapaxes = _sigma_method('swapaxes')
+    copy = _sigma_method('copy')
+    astype = _sigma_method('astype')
+
+    @property
+    def T(self):
+        return self.transpose()
+
+    @property
+    def sigma(self):
+        """the standard deviations (with the unit of the values)"""
+        return UnitArray(self._sigma, self._unit, unitdef=True)
+
+    @property
+    def nominal(self):
+        """the values as UnitArray, without standard deviation"""
+        return self.view(UnitArray)
+
+    def __repr__(self):
+        if STRREP:
+            return self.__str__()
+        return '%s(%s, %s, %s)'%(
+            self.__class__.__name__, repr(self.value), repr(self._sigma),
+            repr(dict(self._unit)))
+
+    def __str__(self):
+        return '%s +- %s [%s]'%(repr(self.value), repr(self._sigma),
+                                format_unit(self._unit))
+
+    def __getitem__(self, key):
+        return _with_sigma(self.nominal[key], self._sigma[key])
+
+    def __mul__(self, other):
+        a, sa = _value_sigma(self)
+        b, sb = _value_sigma(other)
+        return _with_sigma(a*b, np.hypot(_nominal(b)*sa, _nominal(a)*sb))
+
+    def __rmul__(self, other):
+        return self*other
+
+    def __truediv__(self, other):
+        a, sa = _value_sigma(self)
+        b, sb = _value_sigma(other)
+        av, bv = _nominal(a), _nominal(b)
+        return _with_sigma(a/b, np.hypot(sa/bv, av*sb/bv**2))
+
+    def __rtruediv__(self, other):
+        a, sa = _value_sigma(other)
+        b, sb = _value_sigma(self)
+        av, bv = _nominal(a), _nominal(b)
+        return _with_sigma(a/b, np.hypot(sa/bv, av*sb/bv**2))
+
+    if sys.version_info[0] < 3:
+        __div__ = __truediv__
+        __rdiv__ = __rtruediv__
+
+    def __pow__(self, other):
+        if getattr(other, '_unit', None) or np.ndim(other):
+            raise ValueError('Can\'t expontiate using exponent with units or array')
+        a, sa = _value_sigma(self)
+        av = _nominal(a)
+        return _with_sigma(a**other, np.abs(other*av**(other - 1)*sa))
+
+    def __add__(self, other):
+        a, sa = _value_sigma(self)
+        b, sb = _value_sigma(other)
+        return _with_sigma(a + b, np.hypot(sa, sb))
+
+    def __radd__(self, other):
+        return self + other
+
+    def __sub__(self, other):
+        a, sa = _value_sigma(self)
+        b, sb = _value_sigma(other)
+        return _with_sigma(a - b, np.hypot(sa, sb))
+
+    def __rsub__(self, other):
+        a, sa = _value_sigma(other)
+        b, sb = _value_sigma(self)
+        return _with_sigma(a - b, np.hypot(sa, sb))
+
+    def __neg__(self):
+        return UncertainArray(-self.nominal, self._sigma)
+
+    def __reduce__(self):
+        return (UncertainArray, (self.value, self._sigma, dict(self._unit)))
+
+
 p_dict = {}
 
+def _value_dependent_rule(d):
+    """mark the p_dict rule d as depending on the values of operands
+    without unit, its results are not cached (see _unit_cache)"""
+    d.value_dependent = True
+    return d
+
 def _d_multiply(q1, q2, out=None):
     try:
         return mulunit(q1._unit, q2._unit)
@@ -729,13 +1087,15 @@ def _d_divide(q1, q2, out=None):
         try:
             return q1._unit
         except:
-            return divunit({},q2._unit)
+            return divunit(DIMENSIONLESS,q2._unit)
+p_dict[np.matmul] = _d_multiply
 p_dict[np.divide] = _d_divide
 p_dict[np.true_divide] = _d_divide
 
+@_value_dependent_rule
 def _d_check_uniform(q1, q2, out=None):
     try:
-        assert q1._unit == q2._unit
+        assert q1._unit is q2._unit
         return q1._unit
     except AssertionError:
         raise ValueError(
@@ -759,7 +1119,8 @@ def _d_check_uniform(q1, q2, out=None):
         except ValueError:
             raise ValueError(
                 'quantities must have identical units, got "%s" and "%s"' %
-                (q1.unit, q2.unit)
+                (format_unit(getattr(q1, '_unit', DIMENSIONLESS)),
+                 format_unit(getattr(q2, '_unit', DIMENSIONLESS)))
             )
 
 p_dict[np.add] = _d_check_uniform
@@ -769,18 +1130,39 @@ p_dict[np.fmod] = _d_check_uniform
 p_dict[np.remainder] = _d_check_uniform
 p_dict[np.floor_divide] = _d_check_uniform
 p_dict[np.arctan2] = _d_check_uniform
-
+p_dict[np.maximum] = _d_check_uniform
+p_dict[np.minimum] = _d_check_uniform
+p_dict[np.fmax] = _d_check_uniform
+p_dict[np.fmin] = _d_check_uniform
+p_dict[np.hypot] = _d_check_uniform
+p_dict[np.copysign] = _d_check_uniform
+
+@_value_dependent_rule
+def _d_compare(q1, q2, out=None):
+    _d_check_uniform(q1, q2)
+    return DIMENSIONLESS
+p_dict[np.less] = _d_compare
+p_dict[np.less_equal] = _d_compare
+p_dict[np.greater] = _d_compare
+p_dict[np.greater_equal] = _d_compare
+p_dict[np.equal] = _d_compare
+p_dict[np.not_equal] = _d_compare
+
+@_value_dependent_rule
 def _d_power(q1, q2, out=None):
     if getattr(q2, '_unit', None):
         raise ValueError("exponent must be dimensionless")
     try:
-        q2 = np.array(q2)
-        p = q2.min()
-        if p != q2.max():
-            raise ValueError('Quantities must be raised to a uniform power')
+        if np.ndim(q2) == 0:
+            p = q2
+        else:
+            q2 = np.asarray(q2)
+            p = q2.min()
+            if p != q2.max():
+                raise ValueError('Quantities must be raised to a uniform power')
         return powunit(q1._unit,p)
     except AttributeError:
-        return {}
+        return DIMENSIONLESS
 p_dict[np.power] = _d_power
 
 def _d_square(q1, out=None):
@@ -788,7 +1170,7 @@ def _d_square(q1, out=None):
 p_dict[np.square] = _d_square
 
 def _d_reciprocal(q1, out=None):
-    return divunit({},q1._unit)
+    return divunit(DIMENSIONLESS,q1._unit)
 p_dict[np.reciprocal] = _d_reciprocal
 
 def _d_copy(q1, out=None):
@@ -796,11 +1178,19 @@ def _d_copy(q1, out=None):
 p_dict[np.absolute] = _d_copy
 p_dict[np.conjugate] = _d_copy
 p_dict[np.negative] = _d_copy
+p_dict[np.positive] = _d_copy
 p_dict[np.ones_like] = _d_copy
 p_dict[np.rint] = _d_copy
 p_dict[np.floor] = _d_copy
 p_dict[np.fix] = _d_copy
 p_dict[np.ceil] = _d_copy
+p_dict[np.trunc] = _d_copy
+p_dict[np.spacing] = _d_copy
+
+def _d_sign(q1, out=None):
+    return DIMENSIONLESS
+p_dict[np.sign] = _d_sign
+p_dict[np.signbit] = _d_sign
 
 def _d_sqrt(q1, out=None):
     return powunit(q1._unit,0.5)
@@ -808,28 +1198,28 @@ p_dict[np.sqrt] = _d_sqrt
 
 def _d_radians(q1, out=None):
     try:
-        assert q1._unit == {}
+        assert not q1._unit
     except AssertionError:
         raise ValueError(
             'expected units of radians, got "%s"' % format_unit(q1._unit)
         )
-    return {}
+    return DIMENSIONLESS
 p_dict[np.radians] = _d_radians
 
 def _d_degrees(q1, out=None):
     try:
-        assert q1._unit == {}
+        assert not q1._unit
     except AssertionError:
         raise ValueError(
             'expected units of radians, got "%s"' % format_unit(q1._unit)
         )
-    return {}
+    return DIMENSIONLESS
 p_dict[np.degrees] = _d_degrees
 
 def _d_dimensionless(q1, out=None):
     if getattr(q1, '_unit', None):
         raise ValueError("quantity must be dimensionless")
-    return Dimensionality()
+    return DIMENSIONLESS
 p_dict[np.log] = _d_dimensionless
 p_dict[np.log10] = _d_dimensionless
 p_dict[np.log2] = _d_dimensionless
@@ -841,12 +1231,12 @@ p_dict[np.logaddexp2] = _d_dimensionless
 
 def _d_trig(q1, out=None):
     try:
-        assert q1._unit == {}
+        assert not q1._unit
     except AssertionError:
         raise ValueError(
             'expected units of radians, got "%s"' % q1._unit
         )
-    return {}
+    return DIMENSIONLESS
 p_dict[np.sin] = _d_trig
 p_dict[np.sinh] = _d_trig
 p_dict[np.cos] = _d_trig
@@ -857,7 +1247,7 @@ p_dict[np.tanh] = _d_trig
 def _d_arctrig(q1, out=None):
     if getattr(q1, '_unit', None):
         raise ValueError("quantity must be dimensionless")
-    return {}
+    return DIMENSIONLESS
 p_dict[np.arcsin] = _d_arctrig
 p_dict[np.arcsinh] = _d_arctrig
 p_dict[np.arccos] = _d_arctrig
@@ -866,6 +1256,407 @@ p_dict[np.arctan] = _d_arctrig
 p_dict[np.arctanh] = _d_arctrig
 
 
+#numpy functions (other than ufuncs) with unit support, see
+#UnitArray.__array_function__. They work on the plain values and wrap the
+#results once, so they don't copy more than numpy does.
+f_dict = {}
+
+def _split(x):
+    """the plain value and the unit of x"""
+    if isinstance(x, UnitArray):
+        return x.view(np.ndarray), x._unit
+    unit = getattr(x, 'unitDict', None)
+    if unit is None:
+        return x, DIMENSIONLESS
+    return x.value, unit
+
+def _uniform(*items):
+    """the plain values of items and their common unit
+
+    Values without unit are accepted if they are zero."""
+    unit = DIMENSIONLESS
+    for x in items:
+        unit = getattr(x, 'unitDict', None) or unit
+        if unit:
+            break
+    return [_plain_value(x, unit) for x in items], unit
+
+def _f_concatenate(arrays, axis=0, out=None, **kwargs):
+    values, unit = _uniform(*arrays)
+    return _wrap_out(np.concatenate(values, axis, _plain_out(out, unit), **kwargs), unit, out)
+f_dict[np.concatenate] = _f_concatenate
+
+def _f_stack(arrays, axis=0, out=None, **kwargs):
+    values, unit = _uniform(*arrays)
+    return _wrap_out(np.stack(values, axis, _plain_out(out, unit), **kwargs), unit, out)
+f_dict[np.stack] = _f_stack
+
+def _f_where(condition, *xy):
+    if not xy:
+        return np.where(_plain(condition))
+    (x, y), unit = _uniform(*xy)
+    return _wrap(np.where(_plain(condition), x, y), unit)
+f_dict[np.where] = _f_where
+
+def _f_interp(x, xp, fp, left=None, right=None, period=None):
+    (x, xp), xunit = _uniform(x, xp)
+    fp, unit = _split(fp)
+    if left is not None:
+        left = _plain_value(left, unit)
+    if right is not None:
+        right = _plain_value(right, unit)
+    if period is not None:
+        period = _plain_value(period, xunit)
+    return _wrap(np.interp(x, xp, fp, left, right, period), unit)
+f_dict[np.interp] = _f_interp
+
+def _f_linspace(start, stop, num=50, endpoint=True, retstep=False, dtype=None, axis=0):
+    (start, stop), unit = _uniform(start, stop)
+    res = np.linspace(start, stop, num, endpoint, retstep, dtype, axis)
+    if retstep:
+        return _wrap(res[0], unit), _wrap(res[1], unit)
+    return _wrap(res, unit)
+f_dict[np.linspace] = _f_linspace
+
+def _f_diff(a, n=1, axis=-1, **kwargs):
+    a, unit = _split(a)
+    for k in ('prepend', 'append'):
+        if k in kwargs:
+            kwargs[k] = _plain_value(kwargs[k], unit)
+    return _wrap(np.diff(a, n, axis, **kwargs), unit)
+f_dict[np.diff] = _f_diff
+
+def _f_gradient(f, *varargs, **kwargs):
+    f, unit = _split(f)
+    spacing = [_split(v) for v in varargs]
+    res = np.gradient(f, *[v for v, u in spacing], **kwargs)
+    units = [u for v, u in spacing] or [DIMENSIONLESS]
+    if isinstance(res, np.ndarray):
+        return _wrap(res, unit/units[0])
+    if len(units) == 1:
+        units = units*len(res)
+    return type(res)(_wrap(r, unit/u) for r, u in zip(res, units))
+f_dict[np.gradient] = _f_gradient
+
+def _f_trapz(y, x=None, dx=1.0, axis=-1):
+    y, unit = _split(y)
+    if x is None:
+        dx, xunit = _split(dx)
+        return _wrap(np.trapz(y, dx=dx, axis=axis), unit*xunit)
+    x, xunit = _split(x)
+    return _wrap(np.trapz(y, x, axis=axis), unit*xunit)
+for _f in ('trapz', 'trapezoid'):
+    if hasattr(np, _f):
+        f_dict[getattr(np, _f)] = _f_trapz
+
+def _f_cumsum(a, axis=None, dtype=None, out=None):
+    a, unit = _split(a)
+    return _wrap_out(_accumulate(np.cumsum, a, _plain_out(out, unit),
+                                 dict(axis=axis, dtype=dtype)), unit, out)
+f_dict[np.cumsum] = _f_cumsum
+
+def _f_histogram(a, bins=10, range=None, density=None, weights=None):
+    if np.ndim(bins) == 1:
+        (a, bins), unit = _uniform(a, bins)
+    else:
+        a, unit = _split(a)
+    if range is not None:
+        range = tuple(_plain_value(r, unit) for r in range)
+    wunit = DIMENSIONLESS
+    if weights is not None:
+        weights, wunit = _split(weights)
+    hist, edges = np.histogram(a, bins, range, density, weights)
+    if density:
+        wunit = DIMENSIONLESS/unit
+    return _wrap(hist, wunit), _wrap(edges, unit)
+f_dict[np.histogram] = _f_histogram
+
+def _f_clip(a, a_min, a_max, out=None, **kwargs):
+    a, unit = _split(a)
+    if a_min is not None:
+        a_min = _plain_value(a_min, unit)
+    if a_max is not None:
+        a_max = _plain_value(a_max, unit)
+    return _wrap_out(np.clip(a, a_min, a_max, _plain_out(out, unit), **kwargs), unit, out)
+f_dict[np.clip] = _f_clip
+
+#sorting and set operations, units are checked once and the plain values are
+#used, so no temporaries are made for the comparisons
+
+def _elements(x):
+    """x as UnitArray if it is a list of quantities"""
+    if isinstance(x, (list, tuple)) and len(x) and hasattr(x[0], 'unitDict'):
+        return UnitArray.from_ufloats(x)
+    return x
+
+def _f_sort(a, axis=-1, kind=None, order=None):
+    a, unit = _split(a)
+    return _wrap(np.sort(a, axis, kind, order), unit)
+f_dict[np.sort] = _f_sort
+
+def _f_argsort(a, axis=-1, kind=None, order=None):
+    return np.argsort(_split(a)[0], axis, kind, order)
+f_dict[np.argsort] = _f_argsort
+
+def _f_searchsorted(a, v, side='left', sorter=None):
+    (a, v), unit = _uniform(a, _elements(v))
+    return np.searchsorted(a, v, side, sorter)
+f_dict[np.searchsorted] = _f_searchsorted
+
+def _f_unique(ar, *args, **kwargs):
+    ar, unit = _split(ar)
+    res = np.unique(ar, *args, **kwargs)
+    if isinstance(res, tuple):
+        return (_wrap(res[0], unit), ) + res[1:]
+    return _wrap(res, unit)
+f_dict[np.unique] = _f_unique
+
+def _f_isin(element, test_elements, *args, **kwargs):
+    (element, test_elements), unit = _uniform(_elements(element), _elements(test_elements))
+    return np.isin(element, test_elements, *args, **kwargs)
+f_dict[np.isin] = _f_isin
+
+def _f_in1d(ar1, ar2, *args, **kwargs):
+    (ar1, ar2), unit = _uniform(_elements(ar1), _elements(ar2))
+    return np.in1d(ar1, ar2, *args, **kwargs)
+f_dict[np.in1d] = _f_in1d
+
+def _f_intersect1d(ar1, ar2, *args, **kwargs):
+    (ar1, ar2), unit = _uniform(_elements(ar1), _elements(ar2))
+    res = np.intersect1d(ar1, ar2, *args, **kwargs)
+    if isinstance(res, tuple):
+        return (_wrap(res[0], unit), ) + res[1:]
+    return _wrap(res, unit)
+f_dict[np.intersect1d] = _f_intersect1d
+
+#linear algebra, BLAS and LAPACK get the plain buffers of the operands and
+#the units of the results are computed from the units of the operands
+
+def _f_dot(a, b, out=None):
+    (a, ua), (b, ub) = _split(a), _split(b)
+    unit = ua*ub
+    return _wrap_out(np.dot(a, b, _plain_out(out, unit)), unit, out)
+f_dict[np.dot] = _f_dot
+
+def _unit_product(f):
+    """f_dict entry for a product f(a, b, ...) of two arrays"""
+    def g(a, b, *args, **kwargs):
+        (a, ua), (b, ub) = _split(a), _split(b)
+        unit = ua*ub
+        out = kwargs.get('out')
+        if out is not None:
+            kwargs['out'] = _plain_out(out, unit)
+        return _wrap_out(f(a, b, *args, **kwargs), unit, out)
+    return g
+for _f in (np.vdot, np.inner, np.outer, np.tensordot, np.kron, np.cross):
+    f_dict[_f] = _unit_product(_f)
+
+def _f_einsum(*operands, **kwargs):
+    #the subscripts (strings or lists of axes) are dimensionless
+    operands = [_split(x) for x in operands]
+    unit = DIMENSIONLESS
+    for x, u in operands:
+        unit = unit*u
+    out = kwargs.get('out')
+    if out is not None:
+        kwargs['out'] = _plain_out(out, unit)
+    return _wrap_out(np.einsum(*[x for x, u in operands], **kwargs), unit, out)
+f_dict[np.einsum] = _f_einsum
+
+def _f_multi_dot(arrays, out=None):
+    arrays = [_split(x) for x in arrays]
+    unit = DIMENSIONLESS
+    for x, u in arrays:
+        unit = unit*u
+    return _wrap_out(np.linalg.multi_dot([x for x, u in arrays], out=_plain_out(out, unit)),
+                     unit, out)
+f_dict[np.linalg.multi_dot] = _f_multi_dot
+
+def _f_solve(a, b):
+    (a, ua), (b, ub) = _split(a), _split(b)
+    return _wrap(np.linalg.solve(a, b), ub/ua)
+f_dict[np.linalg.solve] = _f_solve
+
+def _f_inv(a):
+    a, unit = _split(a)
+    return _wrap(np.linalg.inv(a), DIMENSIONLESS/unit)
+f_dict[np.linalg.inv] = _f_inv
+
+def _f_pinv(a, *args, **kwargs):
+    a, unit = _split(a)
+    return _wrap(np.linalg.pinv(a, *args, **kwargs), DIMENSIONLESS/unit)
+f_dict[np.linalg.pinv] = _f_pinv
+
+def _f_lstsq(a, b, rcond=None):
+    (a, ua), (b, ub) = _split(a), _split(b)
+    x, residuals, rank, s = np.linalg.lstsq(a, b, rcond)
+    return _wrap(x, ub/ua), _wrap(residuals, ub**2), rank, _wrap(s, ua)
+f_dict[np.linalg.lstsq] = _f_lstsq
+
+def _f_det(a):
+    a, unit = _split(a)
+    return _wrap(np.linalg.det(a), unit**np.shape(a)[-1])
+f_dict[np.linalg.det] = _f_det
+
+def _f_matrix_power(a, n):
+    a, unit = _split(a)
+    return _wrap(np.linalg.matrix_power(a, n), unit**n)
+f_dict[np.linalg.matrix_power] = _f_matrix_power
+
+def _f_norm(x, ord=None, *args, **kwargs):
+    x, unit = _split(x)
+    #ord=0 counts the nonzero elements
+    return _wrap(np.linalg.norm(x, ord, *args, **kwargs),
+                 unit if ord != 0 else DIMENSIONLESS)
+f_dict[np.linalg.norm] = _f_norm
+
+def _f_eigvals(a, *args, **kwargs):
+    a, unit = _split(a)
+    return _wrap(np.linalg.eigvals(a, *args, **kwargs), unit)
+f_dict[np.linalg.eigvals] = _f_eigvals
+
+def _f_eigvalsh(a, *args, **kwargs):
+    a, unit = _split(a)
+    return _wrap(np.linalg.eigvalsh(a, *args, **kwargs), unit)
+f_dict[np.linalg.eigvalsh] = _f_eigvalsh
+
+def _f_eig(a):
+    a, unit = _split(a)
+    w, v = np.linalg.eig(a)
+    return _wrap(w, unit), v
+f_dict[np.linalg.eig] = _f_eig
+
+def _f_eigh(a, *args, **kwargs):
+    a, unit = _split(a)
+    w, v = np.linalg.eigh(a, *args, **kwargs)
+    return _wrap(w, unit), v
+f_dict[np.linalg.eigh] = _f_eigh
+
+def _f_svd(a, full_matrices=True, compute_uv=True, *args, **kwargs):
+    a, unit = _split(a)
+    res = np.linalg.svd(a, full_matrices, compute_uv, *args, **kwargs)
+    if not compute_uv:
+        return _wrap(res, unit)
+    u, s, vh = res
+    return u, _wrap(s, unit), vh
+f_dict[np.linalg.svd] = _f_svd
+
+def _f_cholesky(a):
+    a, unit = _split(a)
+    return _wrap(np.linalg.cholesky(a), unit**0.5)
+f_dict[np.linalg.cholesky] = _f_cholesky
+
+def _f_qr(a, mode='reduced'):
+    a, unit = _split(a)
+    res = np.linalg.qr(a, mode)
+    if mode == 'r':
+        return _wrap(res, unit)
+    if mode == 'complete' or mode == 'reduced':
+        q, r = res
+        return q, _wrap(r, unit)
+    return res
+f_dict[np.linalg.qr] = _f_qr
+
+def _dimensionless(f):
+    """f_dict entry for f, which gives plain numbers for quantities"""
+    def g(a, *args, **kwargs):
+        return f(_split(a)[0], *args, **kwargs)
+    return g
+f_dict[np.linalg.cond] = _dimensionless(np.linalg.cond)
+f_dict[np.linalg.matrix_rank] = _dimensionless(np.linalg.matrix_rank)
+
+
+def _unit_reduction(f, power=1, accumulate=False):
+    """f_dict entry for the reduction f, the result has unit**power
+
+    If accumulate is True f takes a dtype, which defaults to double precision
+    for arrays of reduced precision (see _ACCUMULATE)."""
+    def g(a, *args, **kwargs):
+        a, unit = _split(a)
+        if 'initial' in kwargs:
+            kwargs['initial'] = _plain_value(kwargs['initial'], unit)
+        unit = unit**power
+        out = kwargs.pop('out', None)
+        if accumulate and len(args) < 2:
+            kwargs.setdefault('dtype', None)
+            return _wrap_out(_accumulate(lambda a, **kw: f(a, *args, **kw), a,
+                                         _plain_out(out, unit), kwargs),
+                             unit, out)
+        if out is not None:
+            kwargs['out'] = _plain_out(out, unit)
+        return _wrap_out(f(a, *args, **kwargs), unit, out)
+    return g
+f_dict[np.nansum] = _unit_reduction(np.nansum, accumulate=True)
+f_dict[np.nanmean] = _unit_reduction(np.nanmean, accumulate=True)
+f_dict[np.nanmax] = _unit_reduction(np.nanmax)
+f_dict[np.nanmin] = _unit_reduction(np.nanmin)
+f_dict[np.nanstd] = _unit_reduction(np.nanstd, accumulate=True)
+f_dict[np.nanvar] = _unit_reduction(np.nanvar, 2, True)
+f_dict[np.nanmedian] = _unit_reduction(np.nanmedian)
+f_dict[np.median] = _unit_reduction(np.median)
+f_dict[np.nanargmax] = _unit_reduction(np.nanargmax, 0)
+f_dict[np.nanargmin] = _unit_reduction(np.nanargmin, 0)
+
+
+#ufuncs for which the result unit depends on the values of operands without
+#unit (the exponent of power, zeros can be added to anything)
+_value_dependent = set(uf for uf, d in p_dict.items()
+                       if getattr(d, 'value_dependent', False))
+
+#cache of result units, see unit.UnitCache
+_unit_cache = UnitCache(1024, _value_dependent)
+
+def _ufunc_unit(uf, objs):
+    """the unit of the result of the ufunc uf applied to objs"""
+    return _unit_cache(uf, objs, _p_dict_unit)
+
+def _p_dict_unit(uf, objs):
+    if uf.__name__.startswith('is') or not any(getattr(o, '_unit', None) for o in objs):
+        return DIMENSIONLESS
+    try:
+        d = p_dict[uf]
+    except KeyError:
+        raise ValueError('ufunc %r not supported by units' % uf)
+    return as_unit(d(*objs))
+
+#ufuncs that are done by ufloat.binop
+_binops = frozenset([np.add, np.subtract, np.multiply, np.true_divide,
+                     np.remainder, np.power])
+
+#ufuncs that combine values of the same unit to a value of that unit
+_same_unit = set([np.add, np.subtract, np.maximum, np.minimum, np.fmax,
+                  np.fmin, np.hypot])
+
+def _reduce_unit(uf, method, q, kwargs):
+    """the unit of the result of uf.reduce, uf.accumulate or uf.reduceat"""
+    unit = getattr(q, '_unit', DIMENSIONLESS)
+    if not unit:
+        return DIMENSIONLESS
+    if uf in _same_unit:
+        return unit
+    if uf is np.multiply and method == 'reduce' and kwargs.get('where', True) is True:
+        return unit**_reduced_size(q.shape, kwargs.get('axis', 0))
+    raise ValueError('%s.%s is not supported for quantities with unit [%s]'
+                     % (uf.__name__, method, unit.symbol))
+
+def unit_cache_info():
+    """statistics of the cache of ufunc result units
+
+    The size of the cache can be changed with set_unit_cache_size."""
+    from .memo import CacheInfo
+    c = _unit_cache
+    return CacheInfo(c.hits, c.misses, c.evictions, c.uncached, c.maxsize,
+                     len(c))
+
+def unit_cache_clear():
+    """clear the cache of ufunc result units and its statistics"""
+    _unit_cache.clear()
+
+def set_unit_cache_size(maxsize):
+    """set the maximum number of entries of the cache of ufunc result units"""
+    _unit_cache.maxsize = maxsize
+
+
 if __name__ == '__main__':
     from .ufloat import ufloat
     s = UnitArray(1, {'s':1}, unitdef = True)
@@ -0,0 +1,106 @@
+# -*- coding: utf-8 -*-
+#    ufloat - fast python floats with physical units
+#    Copyright (C) 2015  Christoph Gohle <christoph.gohle@mpq.mpg.de>
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+#  The C-API of ufloat for other cython extensions. Use it like
+#
+#    from ufloat.ufloat cimport ufloat, Unit, ufloat_new, umul
+#
+#    cdef ufloat f = ...
+#    cdef ufloat p = ufloat_new(f._value*f._value, umul(f._unit, f._unit))
+#
+#  The unit algebra on exponent vectors (uvec_mul, uvec_pow, uvec_cmp) does
+#  not need the gil. Only turning a uvec into a Unit (intern_vec) does.
+#
+#  For unit checked arithmetic without the gil (e.g. in prange loops) convert
+#  the operands to uqty structs with uqty_from, use the uq_* kernels and turn
+#  the results back into python objects with uqty_box. The kernels return 0
+#  on success, UQ_OVERFLOW if an exponent is out of range and UQ_UNIT if the
+#  units of a sum or difference don't match.
+
+cimport cython
+
+from ufloat.unit cimport (UNIT_NDIMS, UNIT_DENOM, uvec, Unit, uvec_mul,
+                          uvec_pow, uvec_cmp, as_unit, intern_vec, umul,
+                          udiv, upow)
+
+#a value with unit that can be used without the gil
+ctypedef struct uqty:
+    double value
+    uvec unit
+
+cdef enum:
+    UQ_OVERFLOW = -1
+    UQ_UNIT = -2
+
+cdef inline int uq_mul(const uqty* a, const uqty* b, uqty* res) nogil:
+    res.value = a.value*b.value
+    return uvec_mul(&a.unit, &b.unit, &res.unit, 1)
+
+@cython.cdivision(True)
+cdef inline int uq_div(const uqty* a, const uqty* b, uqty* res) nogil:
+    res.value = a.value/b.value
+    return uvec_mul(&a.unit, &b.unit, &res.unit, -1)
+
+cdef inline int uq_pow(const uqty* a, double exp, uqty* res) nogil:
+    res.value = a.value**exp
+    return uvec_pow(&a.unit, exp, &res.unit)
+
+cdef inline int uq_add(const uqty* a, const uqty* b, uqty* res) nogil:
+    if not uvec_cmp(&a.unit, &b.unit):
+        return UQ_UNIT
+    res.value = a.value + b.value
+    res.unit = a.unit
+    return 0
+
+cdef inline int uq_sub(const uqty* a, const uqty* b, uqty* res) nogil:
+    if not uvec_cmp(&a.unit, &b.unit):
+        return UQ_UNIT
+    res.value = a.value - b.value
+    res.unit = a.unit
+    return 0
+
+cdef class ufloat:
+    cdef double _value
+    cdef Unit _unit
+
+cdef class ucomplex:
+    cdef double complex _value
+    cdef Unit _unit
+
+cdef class uncertain(ufloat):
+    cdef double _sigma
+
+#a ufloat with the given value and unit (also for dimensionless units)
+cdef ufloat ufloat_new(double value, Unit u)
+#same as ufloat_new, but returns a python float for dimensionless units
+cdef object newval(double value, Unit u)
+#the same for complex values
+cdef ucomplex ucomplex_new(double complex value, Unit u)
+cdef object cnewval(double complex value, Unit u)
+#an uncertain with standard deviation sigma (also for dimensionless units)
+cdef uncertain uncertain_new(double value, double sigma, Unit u)
+
+#the unit of a ufloat, ucomplex, UnitArray or plain number
+cdef Unit unit_of(object q)
+#fill res with the value and unit of the ufloat (or number) q
+cdef int uqty_from(object q, uqty* res) except -1
+#a ufloat (or float if dimensionless) from q
+cdef object uqty_box(const uqty* q)
+#the values of a UnitArray (or ndarray) as a C contiguous double buffer
+cdef double[::1] array_values(object a)
+#value with unit u: ufloat, ucomplex or a UnitArray view for arrays
+cpdef object box(object value, Unit u)
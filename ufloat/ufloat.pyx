@@ -1,4 +1,5 @@
 # -*- coding: utf-8 -*-
+# cython: freethreading_compatible=True, c_api_binop_methods=True
 #    ufloat - fast python floats with physical units
 #    Copyright (C) 2015  Christoph Gohle <christoph.gohle@mpq.mpg.de>
 #
@@ -30,242 +31,406 @@ python floats when it comes to multiplication etc.
 """
 from __future__ import division
 
-from libc.stdlib cimport malloc, free, realloc
+cimport cython
 
-from .uarray import UnitArray, mulunit, divunit, powunit
-from numpy import ndarray
+from libc.math cimport atan2, fabs, hypot
+cimport numpy as cnp
+
+from .uarray import UnitArray, UncertainArray
+from numpy import (ndarray, generic, complexfloating, empty, asarray,
+                   ascontiguousarray, float64, add, subtract, multiply,
+                   true_divide, remainder, power)
 from . import uarray
 
+cnp.import_array()
 
-cdef extern from "stdio.h":
-   int printf(char*,...)
-
-#dictionary storing all used unit names (so that references stay unique)
-cdef dict names = {}
-#helper array for multiplication (gloabl, so that it does not need to get realloced every time)
-cdef int *sused = <int *>malloc(10*sizeof(int))
-cdef int ssize = 10
-
-#just for debugging
-#def __nameDict():
-#    return names
-
-###########################
-# cython implementation of a 'unit' class
-##########################
-#dimension (with exponent)
-cdef struct dim:
-    char *name
-    float exponent
-
-#unit is a list of dimensions of length ndims
-cdef struct unit:
-    dim *dims
-    int ndims
-
-cdef unit* unew(length):
-    cdef unit *self = <unit*>malloc(sizeof(unit))
-    if self == NULL:
-        return NULL
-
-    self.dims = <dim *>malloc(length*sizeof(dim))
-    if self.dims == NULL:
-        free(self)
-        return NULL
-    self.ndims = length
-    for i in xrange(length):
-        self.dims[i].name = NULL
-        self.dims[i].exponent = 0
-    return self
-
-cdef unit* uinitd(unit* self, dict u) except NULL:
-    """initialize a unit block self with a copy of u"""
-    if self == NULL:
-        raise ValueError('self is NULL!')
-
-    if not self.ndims == len(u):
-        raise ValueError('the length of the unit struct needs to be the same as the dict')
-    i=0
-    for k, v in u.items():
-        if isinstance(k, str):
-            name = k.encode('UTF-8') #we encode everything into utf-8üs¨ß        
-        else:
-            name = k
-        if not name in names:
-            names[name]=name
-        else:
-            #make sure we use the string that was stored in names
-            name = names[name]
-        self.dims[i].name = name
-        self.dims[i].exponent = v
-        i+=1
-
-    return self
-
-cdef unit* uinitu(unit* self, unit *u) except NULL:
-    """initialize a self struct with a copy of u"""
-    if self == NULL or u == NULL:
-        raise ValueError('one of the units is NULL!')
-    if not self.ndims == u.ndims:
-        raise ValueError('The size of self does not match the other size')
-    self.ndims = u.ndims
-    for i in xrange(self.ndims):
-        self.dims[i].name = u.dims[i].name
-        self.dims[i].exponent = u.dims[i].exponent
-    return self
-
-cdef ufree(unit *self):
-    """free the unit memory block"""
-    if not self == NULL:
-        if not self.dims == NULL:
-            free(self.dims)
-        free(self)
-
-cdef object uformat(unit *self):
-    """create a string representation of self"""
-    if self == NULL:
-        return ''
-    nom = ''
-    denom = ''
-    cdef char *u
-    cdef float exp
-    for i in xrange(self.ndims):
-        u = self.dims[i].name
-        exp = self.dims[i].exponent
-        if exp > 0:
-            if exp > 1:
-                nom += u'{}**{} '.format(u.decode('UTF-8'),abs(exp))
-            else:
-                nom += u'{} '.format(u.decode('UTF-8'))
-        else:
-            if exp < -1:
-                denom += u'{}**{} '.format(u.decode('UTF-8'),abs(exp))
-            else:
-                denom += u'{} '.format(u.decode('UTF-8'))
-    fill = u''
-    if not denom == u'':
-        fill = u'/'
-        if nom == u'':
-            nom = u'1'
-    return nom.strip()+fill+denom.strip()
-
-cdef unit* upow(unit* self, float exp) except NULL:
-    """take the unit self to the power exp"""
-    cdef unit* res
-    if self == NULL:
-        raise ValueError('unit must not be NULL')
-
-    res = unew(self.ndims)
-    for i in xrange(self.ndims):
-        res.dims[i].name = self.dims[i].name
-        res.dims[i].exponent = self.dims[i].exponent*exp
+cdef Unit ONE = as_unit(None)
 
+cdef ufloat ufloat_new(double value, Unit u):
+    """create a new ufloat sharing the unit u"""
+    cdef ufloat res = ufloat.__new__(ufloat)
+    res._value = value
+    res._unit = u
     return res
 
-cdef unit* umul(unit* self, unit* other, float sign = 1) except NULL:
-    """mulitiply two units self and other with
-    other taken to the power sign first"""
-    if self == NULL or other == NULL:
-        raise ValueError('units are None while they should be unit')
-
-    cdef unit* u = unew(self.ndims+other.ndims)
-    global sused, ssize
-    #fix size of helper
-    if ssize < self.ndims:
-        sused = <int *>realloc(sused, self.ndims*sizeof(int))
-        ssize = self.ndims
-    if sused == NULL:
-        ssize = 0
-        raise MemoryError('out of memory in allocating a helper array')
-    for i in xrange(self.ndims):
-        sused[i]=0
-
-    cdef char* a
-    cdef float exp
-    cdef int newi = 0
-    for i in xrange(other.ndims):
-        a = other.dims[i].name
-        exp = sign*other.dims[i].exponent
-        for j in xrange(self.ndims):
-            if self.dims[j].name==a:
-                exp += self.dims[j].exponent
-                sused[j] = 1
-                break
-        if not exp == 0:
-            u.dims[newi].name = a
-            u.dims[newi].exponent = exp
-            newi += 1
-
-    for i in xrange(self.ndims):
-        if sused[i] == 0:
-            u.dims[newi].name = self.dims[i].name
-            u.dims[newi].exponent = self.dims[i].exponent
-            newi += 1
-
-    u.dims = <dim *>realloc(u.dims, newi*sizeof(dim))
-    if newi is not 0 and u.dims == NULL:
-        ufree(u)
-        raise MemoryError('failed to realloc dimensions memory')
-    u.ndims = newi
-
-    return u
-
-cdef int ucmp(unit* self, unit* other):
-    """compare two units and return True if equal, false otherwise"""
-    if self == NULL or other == NULL:
-        return False
-    for i in xrange(self.ndims):
-        same = False
-        for j in xrange(other.ndims):
-            if self.dims[i].name==other.dims[j].name and self.dims[i].exponent == other.dims[j].exponent:
-                    same = True
-                    break
-        if same == False:
-            break
-    return same
-
-cdef dict utodict(unit* self):
-    """create a python dictionary to represent the unit"""
-    cdef dict res = {}
-    if self == NULL:
-        return res
-    for i in xrange(self.ndims):
-        res[self.dims[i].name.decode('UTF-8')]=self.dims[i].exponent
+cdef object newval(double value, Unit u):
+    """helper for creating new unit values
+
+    The unit is shared with the result, units are immutable"""
+    if u is not ONE: # and not value == 0:
+        return ufloat_new(value, u)
+    else:
+        return value
+
+cdef ucomplex ucomplex_new(double complex value, Unit u):
+    """create a new ucomplex sharing the unit u"""
+    cdef ucomplex res = ucomplex.__new__(ucomplex)
+    res._value = value
+    res._unit = u
     return res
 
+cdef object cnewval(double complex value, Unit u):
+    """like newval for complex values"""
+    if u is not ONE:
+        return ucomplex_new(value, u)
+    else:
+        return value
+
+cdef Unit unit_of(object q):
+    """the unit of q, plain numbers and arrays are dimensionless"""
+    if isinstance(q, ufloat):
+        return (<ufloat>q)._unit
+    if isinstance(q, ucomplex):
+        return (<ucomplex>q)._unit
+    return as_unit(getattr(q, '_unit', None))
 
+cdef int uqty_from(object q, uqty* res) except -1:
+    """fill res with the value and unit of q"""
+    if isinstance(q, ufloat):
+        res.value = (<ufloat>q)._value
+        res.unit = (<ufloat>q)._unit.vec
+    else:
+        res.value = q
+        res.unit = ONE.vec
+    return 0
 
+cdef object uqty_box(const uqty* q):
+    """the python object for q"""
+    return newval(q.value, intern_vec(&q.unit))
 
+cdef double[::1] array_values(object a):
+    """the values of the array a as a contiguous double buffer
 
-cdef object newval(double value, unit* u, bint copy = False):
-    """helper for creating new unit values"""
-    cdef ufloat res
-    if u.ndims>0: # and not value == 0:
-        res = ufloat(value)
-        if not copy:
-            res._unit = u
-        else:
-            res._unit = unew(u.ndims)
-            uinitu(res._unit, u)
+    The buffer is shared with a, it raises if a is not a C contiguous array
+    of doubles."""
+    return getattr(a, 'value', a)
+
+cpdef object box(object value, Unit u):
+    """value with the unit u, nothing is copied
+
+    Real numbers become ufloat, complex numbers ucomplex and arrays a
+    UnitArray view of value. If u is dimensionless value is returned as it
+    is. The unit is shared, not copied."""
+    cdef object res
+    if u is ONE:
+        return value
+    if isinstance(value, float):
+        return ufloat_new(value, u)
+    if isinstance(value, ndarray):
+        res = value.view(UnitArray)
+        res._unit = u
         return res
+    if isinstance(value, (complex, complexfloating)):
+        return ucomplex_new(value, u)
+    return ufloat_new(value, u)
+
+cdef inline object _doubles(object a):
+    """a float64 array a, in native byte order so that a double memoryview
+    takes it (byte swapped arrays are copied)"""
+    if a.dtype == float64:
+        return a
+    return ascontiguousarray(a, dtype=float)
+
+def iter_boxed(object a, Unit u):
+    """iterate over the first axis of the array a, with unit u"""
+    cdef const double[:] d
+    cdef Py_ssize_t i
+    if u is not ONE and a.ndim == 1 and a.dtype.char == 'd':
+        d = _doubles(a)
+        for i in range(d.shape[0]):
+            yield ufloat_new(d[i], u)
     else:
-        if not copy:
-            ufree(u)
+        for x in a:
+            yield box(x, u)
+
+cpdef object boxed_list(object a, Unit u):
+    """a.tolist() with the elements boxed with unit u"""
+    cdef const double[:] d
+    cdef Py_ssize_t i
+    if u is ONE:
+        return a.tolist()
+    if a.ndim == 0:
+        return box(a.item(), u)
+    if a.ndim == 1:
+        if a.dtype.char == 'd':
+            d = _doubles(a)
+            return [ufloat_new(d[i], u) for i in range(d.shape[0])]
+        return [box(x, u) for x in a.tolist()]
+    return [boxed_list(x, u) for x in a]
+
+cdef inline bint _defer(object x):
+    """True for objects that do arithmetic with quantities themselves
+
+    Like numpy, these are recognized by __array_ufunc__ = None (e.g.
+    MixedUnitArray)."""
+    return (not isinstance(x, (ufloat, ucomplex))
+            and getattr(x, '__array_ufunc__', 0) is None)
+
+cdef inline bint _zero(object x):
+    """True if x is a plain 0 (int or float), which can be added to quantities"""
+    return (type(x) is int or type(x) is float) and x == 0
+
+def fsum(iterable):
+    """the sum of the ufloats (or numbers) in iterable
+
+    The units of all elements have to be the same (plain zeros are
+    ignored). The sum is compensated (Neumaier's variant of Kahan summation),
+    so it doesn't lose precision for many elements of different size. An
+    empty iterable sums to 0."""
+    cdef double total = 0, c = 0, v, t
+    cdef Unit u = None
+    cdef Py_ssize_t i = 0
+    for x in iterable:
+        if type(x) is ufloat or isinstance(x, ufloat):
+            v = (<ufloat>x)._value
+            if u is None:
+                u = (<ufloat>x)._unit
+            elif (<ufloat>x)._unit is not u:
+                raise ValueError('element %d of the sum has unit [%s], not [%s]'
+                                 % (i, (<ufloat>x)._unit.symbol, u.symbol))
         else:
-            pass
-        return value
-        
+            v = x
+            if v != 0:
+                if u is None:
+                    u = ONE
+                elif u is not ONE:
+                    raise ValueError('element %d of the sum has no unit, not [%s]'
+                                     % (i, u.symbol))
+        t = total + v
+        if fabs(total) >= fabs(v):
+            c += (total - t) + v
+        else:
+            c += (v - t) + total
+        total = t
+        i += 1
+    return newval(total + c, ONE if u is None else u)
+
+def from_ufloats(iterable, units=None):
+    """a UnitArray from the ufloats in iterable, see UnitArray.from_ufloats"""
+    cdef Py_ssize_t i, n
+    cdef double[::1] buf
+    cdef Unit u = None if units is None else as_unit(units)
+    if not isinstance(iterable, (list, tuple)):
+        iterable = list(iterable)
+    n = len(iterable)
+    res = empty(n)
+    buf = res
+    for i in range(n):
+        x = iterable[i]
+        if isinstance(x, ufloat):
+            if u is None:
+                u = (<ufloat>x)._unit
+            elif (<ufloat>x)._unit is not u:
+                raise ValueError('element %d has unit [%s], not [%s]'
+                                 % (i, (<ufloat>x)._unit.symbol, u.symbol))
+            buf[i] = (<ufloat>x)._value
+        else:
+            if u is None:
+                u = ONE
+            elif u is not ONE:
+                raise ValueError('element %d has no unit, not [%s]' % (i, u.symbol))
+            buf[i] = x
+    return UnitArray.wrap(res, ONE if u is None else u)
+
+#########################################
+# arithmetic of UnitArray
+#########################################
+cdef Unit _real_scalar(object x, double* v):
+    """the unit of x if it is a real scalar, None otherwise
+
+    Real scalars are floats, ints, ufloats and 0-d UnitArrays of (not long
+    double) floats or ints, their value is stored in v."""
+    cdef int t
+    if isinstance(x, float) or isinstance(x, int):
+        v[0] = x
+        return ONE
+    if type(x) is ufloat:
+        v[0] = (<ufloat>x)._value
+        return (<ufloat>x)._unit
+    if (type(x) is UnitArray and cnp.PyArray_NDIM(<cnp.ndarray>x) == 0
+            and cnp.PyArray_ISBEHAVED_RO(<cnp.ndarray>x)):
+        t = cnp.PyArray_TYPE(<cnp.ndarray>x)
+        if t == cnp.NPY_DOUBLE:
+            v[0] = (<double*>cnp.PyArray_DATA(<cnp.ndarray>x))[0]
+        elif t == cnp.NPY_LONG:
+            #the base units of aunits
+            v[0] = (<long*>cnp.PyArray_DATA(<cnp.ndarray>x))[0]
+        elif (cnp.PyArray_ISINTEGER(<cnp.ndarray>x) or
+              (cnp.PyArray_ISFLOAT(<cnp.ndarray>x) and t != cnp.NPY_LONGDOUBLE)):
+            v[0] = cnp.PyArray_GETITEM(<cnp.ndarray>x, cnp.PyArray_DATA(<cnp.ndarray>x))
+        else:
+            return None
+        return x._unit
+    return None
+
+cdef object _operand(object x):
+    """the value of the operand x without unit
+
+    Returns None if x is not something UnitArray arithmetic knows about."""
+    if isinstance(x, UnitArray):
+        return x.view(ndarray)
+    if isinstance(x, ufloat):
+        return (<ufloat>x)._value
+    if isinstance(x, ucomplex):
+        return (<ucomplex>x)._value
+    if isinstance(x, (ndarray, generic, float, int, complex, list, tuple)):
+        return x
+    return None
+
+cdef object _storage(object x, object v):
+    """the plain scalar x as a number of the dtype of the array v
+
+    Arithmetic keeps the precision of float16 and float32 arrays (see
+    uarray._ACCUMULATE), even where numpy would promote for large scalars."""
+    if type(x) is float and isinstance(v, ndarray):
+        dt = v.dtype
+        if dt.kind == 'f' and dt.itemsize < 8:
+            return dt.type(x)
+    return x
+
+cdef Unit _sum_unit(object a, Unit ua, object b, Unit ub):
+    """the unit of a+b (or a-b, a%b), plain zeros can be added to anything"""
+    if ua is ub:
+        return ua
+    if not isinstance(a, (ufloat, ucomplex, UnitArray)) and not asarray(a).any():
+        return ub
+    if not isinstance(b, (ufloat, ucomplex, UnitArray)) and not asarray(b).any():
+        return ua
+    raise ValueError('quantities must have identical units, got "%s" and "%s"'
+                     % (ua.symbol, ub.symbol))
+
+cdef double _exponent(object p) except? -1:
+    """the value of the exponent p, arrays must have the same value everywhere"""
+    if isinstance(p, (ndarray, list, tuple)):
+        p = asarray(p)
+        if p.ndim:
+            if p.min() != p.max():
+                raise ValueError('Quantities must be raised to a uniform power')
+            p = p.flat[0]
+    return p
+
+cdef object _scalar_binop(object uf, double x, Unit ux, object a,
+                          double y, Unit uy, object b):
+    """uf(a, b) for real scalars a (= x [ux]) and b (= y [uy])
+
+    Returns None if the result is left to numpy (division by zero)."""
+    if uf is multiply:
+        return newval(x*y, umul(ux, uy))
+    if uf is true_divide:
+        if y == 0:
+            return None
+        return newval(x/y, udiv(ux, uy))
+    if uf is add:
+        return newval(x + y, _sum_unit(a, ux, b, uy))
+    if uf is subtract:
+        return newval(x - y, _sum_unit(a, ux, b, uy))
+    if uf is power:
+        if uy is not ONE:
+            raise ValueError('exponent must be dimensionless')
+        return newval(x**y, upow(ux, y))
+    return None
+
+_binop_ufuncs = (multiply, true_divide, add, subtract, remainder, power)
+
+cdef object _binop(object uf, object a, object b):
+    """uf(a, b) for UnitArray arithmetic, NotImplemented if not supported"""
+    cdef double x, y
+    cdef Unit ua, ub, u
+    #scalars (0-d UnitArrays as used by aunits) don't need numpy at all
+    ua = _real_scalar(a, &x)
+    if ua is not None:
+        ub = _real_scalar(b, &y)
+        if ub is not None:
+            res = _scalar_binop(uf, x, ua, a, y, ub, b)
+            if res is not None:
+                return res
+    if (isinstance(a, (UncertainArray, uncertain))
+            or isinstance(b, (UncertainArray, uncertain))):
+        return NotImplemented
+    va = _operand(a)
+    vb = _operand(b)
+    if va is None or vb is None:
+        return NotImplemented
+    va = _storage(va, vb)
+    vb = _storage(vb, va)
+    ua = unit_of(a)
+    ub = unit_of(b)
+    if uf is multiply:
+        u = umul(ua, ub)
+        res = va*vb
+    elif uf is true_divide:
+        u = udiv(ua, ub)
+        res = va/vb
+    elif uf is add:
+        u = _sum_unit(a, ua, b, ub)
+        res = va + vb
+    elif uf is subtract:
+        u = _sum_unit(a, ua, b, ub)
+        res = va - vb
+    elif uf is remainder:
+        u = _sum_unit(a, ua, b, ub)
+        res = va % vb
+    elif uf is power:
+        if ub is not ONE:
+            raise ValueError('exponent must be dimensionless')
+        u = upow(ua, _exponent(vb)) if ua is not ONE else ONE
+        res = va**vb
+    else:
+        return NotImplemented
+    return box(res, u)
+
+cdef object _array_ufunc(object self, object ufunc, object method, tuple inputs,
+                         dict kwargs):
+    """ufunc.method(*inputs, **kwargs) for numpy, self is a quantity operand
+
+    Arithmetic is done by _binop (e.g. numpy scalar * ufloat), everything
+    else by UnitArray.__array_ufunc__ with self as 0-d UnitArray."""
+    if (method == '__call__' and not kwargs and len(inputs) == 2
+            and ufunc in _binop_ufuncs):
+        res = _binop(ufunc, inputs[0], inputs[1])
+        if res is not NotImplemented:
+            return res
+    return UnitArray.__array_ufunc__(uarray._quantity_array(self), ufunc,
+                                     method, *inputs, **kwargs)
+
+cpdef object binop(object uf, object a, object b, bint fallback=True):
+    """uf(a, b) for the arithmetic operators of UnitArray
+
+    uf is one of the ufuncs add, subtract, multiply, true_divide, remainder
+    or power. The unit of the result is computed directly, the values are
+    combined by numpy without going through UnitArray.__array_ufunc__. Real
+    scalars (including 0-d UnitArrays) don't touch numpy at all.
+
+    Operands that are not numbers, quantities or arrays are handed to
+    uf(a, b) if fallback is True, otherwise NotImplemented is returned."""
+    res = _binop(uf, a, b)
+    if res is NotImplemented and fallback:
+        if (getattr(a, '__array_ufunc__', True) is None
+                or getattr(b, '__array_ufunc__', True) is None
+                or isinstance(a, (UncertainArray, uncertain))
+                or isinstance(b, (UncertainArray, uncertain))):
+            return NotImplemented
+        return uf(a, b)
+    return res
+
 #########################################
 # ufloat: a float class with units
 #########################################
+@cython.freelist(256)
 cdef class ufloat:
     """a floating point class with units"""
-#    cdef int _unit
-    cdef double _value
-    cdef unit* _unit
     prefixmap = {'f':-15,'p':-12,'n':-9,'u':-6,'m':-3, 'k':3, 'M':6, 'G':9, 'T':12, 'P':15}
     __array_priority__ = 10
-    def __cinit__(self, value, u = None):
+    def __array_ufunc__(self, ufunc, method, *inputs, **kwargs):
+        """numpy ufuncs with quantities (see UnitArray.__array_ufunc__)"""
+        return _array_ufunc(self, ufunc, method, inputs, kwargs)
+
+    def __cinit__(self):
+        #results of arithmetic are created without calling __init__ (the
+        #constructor arguments are parsed there, __cinit__ ignores them)
+        self._unit = ONE
+
+    def __init__(self, value, u = None):
         """Create a new floatingpoint number with units
 
         Parameters
@@ -281,59 +446,55 @@ cdef class ufloat:
         """
         cdef ufloat v
         if u and isinstance(u, dict):
-            self._unit = unew(len(u))
-            uinitd(self._unit, u)
-            #printf("%p",self._unit)
+            self._unit = as_unit(u)
             self._value = value
         elif isinstance(value, ufloat):
             v = value
             self._value = v._value
-            self._unit = unew(v._ndims)
-            uinitu(self._unit, (<ufloat>u)._unit)
+            self._unit = v._unit
         else:
             self._value = value
-            self._unit = NULL
+            self._unit = ONE
             #raise ValueError('Either needs to be a ufloat or a unit has to be specified)
 
-
-        
-    def __dealloc__(self):
-        ufree(self._unit)
-
     def __str__(self):
-        return '%s [%s]'%(self._value, uformat(self._unit))
+        return '%s [%s]'%(self._value, self._unit.symbol)
 
     def __repr__(self):
         if uarray.STRREP:
             return self.__str__()
         return '%s(%s, %s)'%(
-            self.__class__.__name__, repr(self._value), repr(utodict(self._unit)))
+            self.__class__.__name__, repr(self._value), repr(dict(self._unit)))
 
     def __mul__(self, other):
         cdef ufloat s
 #        print 'mul', self, other
+        if isinstance(other, ucomplex) or isinstance(self, ucomplex):
+            return NotImplemented
         if isinstance(other, ufloat) and isinstance(self, ufloat):
                 return newval((<ufloat>self)._value*(<ufloat>other)._value, umul((<ufloat>self)._unit,(<ufloat>other)._unit))
         elif isinstance(other, ufloat):
             if isinstance(self, ndarray):
-                ounit = getattr(self,'unitDict',{})
-                ovalue = getattr(self, 'value', self)
-#                print 'self', ounit, ovalue
-                return UnitArray(<ufloat>other.value*ovalue,mulunit(other.unitDict, ounit), checkunit = False)
+                return binop(multiply, self, other)
             s = other
             o = self
         elif isinstance(self, ufloat):
+            if isinstance(other, (float, int)):
+                return newval((<ufloat>self)._value*(<double>other), (<ufloat>self)._unit)
             if isinstance(other, ndarray):
-                ounit = getattr(other,'unitDict',{})
-                ovalue = getattr(other, 'value', other)
-#                print 'other', ounit, ovalue
-                return UnitArray(<ufloat>self.value*ovalue,mulunit(self.unitDict, ounit), checkunit = False)
+                return binop(multiply, self, other)
             s = self
             o = other
         else:
             raise Exception("why did I get here?")
         #print "self: %s, other: %s"%(s,o)
-        return newval(s._value*o, s._unit, True)
+        if isinstance(o, (float, int)):
+            return newval(s._value*(<double>o), s._unit)
+        if isinstance(o, complex):
+            return cnewval(s._value*(<double complex>o), s._unit)
+        if _defer(o):
+            return NotImplemented
+        return newval(s._value*o, s._unit)
 
 
     #ATTENTION __truediv__ and __div__ have the same code (to support both python2 and python3)
@@ -341,63 +502,75 @@ cdef class ufloat:
     #FIXME: is there some construct to get rid of this redundant piece of code?
     def __truediv__(self, other):
         cdef ufloat s
-        cdef int exp
 #        print self, other
+        if isinstance(other, ucomplex) or isinstance(self, ucomplex):
+            return NotImplemented
         if isinstance(other, ufloat) and isinstance(self, ufloat):
                 return newval((<ufloat>self)._value/(<ufloat>other)._value,
-                              umul((<ufloat>self)._unit,(<ufloat>other)._unit,-1))
+                              udiv((<ufloat>self)._unit,(<ufloat>other)._unit))
         elif isinstance(other, ufloat):
             if isinstance(self, ndarray):
-                #print 'self.nd, other float'
-                ounit = getattr(self,'unitDict',{})
-                ovalue = getattr(self, 'value', self)
-                return UnitArray(ovalue/<ufloat>other.value,divunit(ounit, other.unitDict), checkunit = False)
+                return binop(true_divide, self, other)
             s = other
             o = self
-            exp = -1
-            return newval(o/s._value, upow(s._unit,-1))
+            if isinstance(o, (float, int)):
+                return newval((<double>o)/s._value, udiv(ONE, s._unit))
+            if isinstance(o, complex):
+                return cnewval((<double complex>o)/s._value, udiv(ONE, s._unit))
+            if _defer(o):
+                return NotImplemented
+            return newval(o/s._value, udiv(ONE, s._unit))
         elif isinstance(self, ufloat):
             if isinstance(other, ndarray):
-                ounit = getattr(other,'unitDict',{})
-                ovalue = getattr(other, 'value', other)
-                return UnitArray(<ufloat>self.value/ovalue,divunit(self.unitDict, ounit), checkunit = False)
+                return binop(true_divide, self, other)
             s = self
             o = other
-            exp = 1
         else:
             raise Exception("why did I get here?")
 #        print "self: %s, other: %s"%(s,o)
-        return newval(s._value/o, upow(s._unit,exp))
+        if isinstance(o, (float, int)):
+            return newval(s._value/(<double>o), s._unit)
+        if isinstance(o, complex):
+            return cnewval(s._value/(<double complex>o), s._unit)
+        if _defer(o):
+            return NotImplemented
+        return newval(s._value/o, s._unit)
 
     def __div__(self, other):
         cdef ufloat s
-        cdef int exp
 #        print self, other
+        if isinstance(other, ucomplex) or isinstance(self, ucomplex):
+            return NotImplemented
         if isinstance(other, ufloat) and isinstance(self, ufloat):
                 return newval((<ufloat>self)._value/(<ufloat>other)._value,
-                              umul((<ufloat>self)._unit,(<ufloat>other)._unit,-1))
+                              udiv((<ufloat>self)._unit,(<ufloat>other)._unit))
         elif isinstance(other, ufloat):
             if isinstance(self, ndarray):
-                #print 'self.nd, other float'
-                ounit = getattr(self,'unitDict',{})
-                ovalue = getattr(self, 'value', self)
-                return UnitArray(ovalue/<ufloat>other.value,divunit(ounit, other.unitDict), checkunit = False)
+                return binop(true_divide, self, other)
             s = other
             o = self
-            exp = -1
-            return newval(o/s._value, upow(s._unit,-1))
+            if isinstance(o, (float, int)):
+                return newval((<double>o)/s._value, udiv(ONE, s._unit))
+            if isinstance(o, complex):
+                return cnewval((<double complex>o)/s._value, udiv(ONE, s._unit))
+            if _defer(o):
+                return NotImplemented
+            return newval(o/s._value, udiv(ONE, s._unit))
         elif isinstance(self, ufloat):
             if isinstance(other, ndarray):
-                ounit = getattr(other,'unitDict',{})
-                ovalue = getattr(other, 'value', other)
-                return UnitArray(<ufloat>self.value/ovalue,divunit(self.unitDict, ounit), checkunit = False)
+                return binop(true_divide, self, other)
             s = self
             o = other
-            exp = 1
         else:
             raise Exception("why did I get here?")
 #        print "self: %s, other: %s"%(s,o)
-        return newval(s._value/o, upow(s._unit,exp))
+        if isinstance(o, (float, int)):
+            return newval(s._value/(<double>o), s._unit)
+        if isinstance(o, complex):
+            return cnewval(s._value/(<double complex>o), s._unit)
+        if _defer(o):
+            return NotImplemented
+        return newval(s._value/o, s._unit)
         
     def __pow__(self, other, modulo):
         #FIXME: modulo not supported (what does it?)
@@ -412,45 +585,58 @@ cdef class ufloat:
         return newval(s._value**other, upow(s._unit,other))
 
     def __add__(self, other):
-        if isinstance(other, ufloat) and isinstance(self, ufloat) and ucmp((<ufloat>self)._unit, (<ufloat>other)._unit):
-            return newval((<ufloat>self)._value + (<ufloat>other)._value, (<ufloat>self)._unit, True)
+        if isinstance(other, ucomplex) or isinstance(self, ucomplex):
+            return NotImplemented
+        if isinstance(other, ufloat) and isinstance(self, ufloat) and (<ufloat>self)._unit is (<ufloat>other)._unit:
+            return newval((<ufloat>self)._value + (<ufloat>other)._value, (<ufloat>self)._unit)
+        elif _zero(other):
+            #zero can be added to anything, this makes sum() work
+            return self
+        elif _zero(self):
+            return other
         elif isinstance(other, ndarray) or isinstance(self, ndarray):
-            udict = getattr(self, 'unitDict', {})
-            if udict == getattr(other, 'unitDict', {}):
-                svalue = getattr(self, 'value', self)
-                ovalue = getattr(other, 'value', other)
-                return UnitArray(svalue+ovalue, udict)
+            return binop(add, self, other)
+        elif _defer(other) or _defer(self):
+            return NotImplemented
 
         raise ValueError('Can\'t add two quantities with differnt units %s and %s.'%(self, other))
 
     def __sub__(self, other):
-        if isinstance(other, ufloat) and isinstance(self, ufloat) and ucmp((<ufloat>self)._unit, (<ufloat>other)._unit):
-            return newval((<ufloat>self)._value - (<ufloat>other)._value, (<ufloat>self)._unit, True)
+        if isinstance(other, ucomplex) or isinstance(self, ucomplex):
+            return NotImplemented
+        if isinstance(other, ufloat) and isinstance(self, ufloat) and (<ufloat>self)._unit is (<ufloat>other)._unit:
+            return newval((<ufloat>self)._value - (<ufloat>other)._value, (<ufloat>self)._unit)
+        elif _zero(other):
+            return self
+        elif _zero(self):
+            return -other
         elif isinstance(other, ndarray) or isinstance(self, ndarray):
-            udict = getattr(self, 'unitDict', {})
-            if udict == getattr(other, 'unitDict', {}):
-                svalue = getattr(self, 'value', self)
-                ovalue = getattr(other, 'value', other)
-                return UnitArray(svalue-ovalue, udict)
+            return binop(subtract, self, other)
+        elif _defer(other) or _defer(self):
+            return NotImplemented
         raise ValueError('Can\'t subtract two quantities with differnt units %s and %s.'%(self, other))
 
     def __neg__(self):
         if isinstance(self, ufloat):
-            return newval(-(<ufloat>self)._value, (<ufloat>self)._unit, True)
+            return newval(-(<ufloat>self)._value, (<ufloat>self)._unit)
         else:
             raise Exception('how did I get here?')
 
     def __richcmp__(self, other, op):
+        if isinstance(other, ucomplex) or isinstance(self, ucomplex):
+            return NotImplemented
+        if _defer(other) or _defer(self):
+            return NotImplemented
         if isinstance(self, ufloat) and isinstance(other, ufloat):
-            c = ucmp((<ufloat>self)._unit, (<ufloat>other)._unit)
+            c = (<ufloat>self)._unit is (<ufloat>other)._unit
             v = (<ufloat>self)._value
             o = (<ufloat>other)._value
         elif isinstance(self, ufloat):
-            c = ucmp((<ufloat>self)._unit, (<ufloat>getattr(other, 'unit', ufloat(1,{})))._unit)
+            c = (<ufloat>self)._unit is as_unit(getattr(other, '_unit', ONE))
             v = float((<ufloat>self)._value)
             o = getattr(other,'value',other)
         elif isinstance(other, ufloat):
-            c = ucmp((<ufloat>other)._unit, (<ufloat>getattr(self, 'unit', ufloat(1,{})))._unit)
+            c = (<ufloat>other)._unit is as_unit(getattr(self, '_unit', ONE))
             o = float((<ufloat>other)._value)
             v = getattr(self, 'value', self)
         else:
@@ -487,19 +673,30 @@ cdef class ufloat:
                 raise ValueError('can\'t compare apples to peaches')
         #print(result)
         return result
+
+    def __hash__(self):
+        #consistent with __richcmp__: dimensionless values hash like floats
+        if self._unit is ONE:
+            return hash(self._value)
+        return hash(self._value) ^ self._unit._hash
         
     property value:
         def __get__(self):
             return self._value
 
     def asNumber(self, other = None):
+        if isinstance(other, str):
+            unit, value = uarray.conversion_target(other)
+            if self._unit is not unit:
+                raise ValueError('Quantity %s can\'t be converted to %s'%(self, other))
+            return self._value/value
         if isinstance(other, ufloat):
-            if ucmp(self._unit, (<ufloat>other)._unit):
+            if self._unit is (<ufloat>other)._unit:
                 return self._value/((<ufloat>other)._value)
             else:
                 raise ValueError('Quantity %s can\'t be converted to %s'%(self, other.unit))
         elif isinstance(other, UnitArray):
-            if self.unitDict == other.unitDict:
+            if self._unit is as_unit(other.unitDict):
                 return self._value/(other.value)
             else:
                 raise ValueError('Quantity %s can\'t be converted to %s'%(self, other.unit))
@@ -511,20 +708,16 @@ cdef class ufloat:
     property unit:
         def __get__(self):
             cdef ufloat u = ufloat(1)
-            u._unit = unew(self._unit.ndims)
-            uinitu(u._unit, self._unit)
+            u._unit = self._unit
             return u
-            #(1.0, utodict(self._unit))
 
         def __set__(self, nunit):
-            cdef unit* u = NULL
+            cdef Unit u = None
             if isinstance(nunit, dict):
-                u = unew(len(nunit))
-                uinitd(u, nunit)
+                u = as_unit(nunit)
             if isinstance(nunit, ufloat):
-                u = upow((<ufloat>nunit)._unit, 1)
-            if not ucmp(self._unit, u):
-                ufree(u)
+                u = (<ufloat>nunit)._unit
+            if self._unit is not u:
                 raise ValueError('cant change to a different unit')
             else:
                 #nothing to be done
@@ -532,16 +725,425 @@ cdef class ufloat:
 
     property unitDict:
         def __get__(self):
-            """A dictionary representation of the quantitie's unit."""
-            return utodict(self._unit)
+            """A dictionary representation of the quantitie's unit.
+
+            This is the (immutable) unit itself."""
+            return self._unit
 
     property symbol:
         def __get__(self):
             """a string representation of the dimension"""
-            return uformat(self._unit)
+            return self._unit.symbol
 
     #Pickling support
     def __reduce__(self):
         return (ufloat,
                 (self._value, self.unitDict))
 
+
+
+cdef double complex _cvalue(object x) except *:
+    """the complex value of a ucomplex, ufloat or number"""
+    if isinstance(x, ucomplex):
+        return (<ucomplex>x)._value
+    if isinstance(x, ufloat):
+        return (<ufloat>x)._value
+    return x
+
+cdef bint _cnumber(object x):
+    """True if x can take part in ucomplex scalar arithmetic"""
+    if isinstance(x, (ucomplex, ufloat, float, int, complex)):
+        return True
+    try:
+        complex(x)
+    except TypeError:
+        return False
+    return True
+
+#########################################
+# ucomplex: a complex class with units
+#########################################
+@cython.freelist(64)
+cdef class ucomplex:
+    """a complex floating point class with units
+
+    Works like ufloat and mixes with ufloat, complex numbers and UnitArray.
+    abs, real and imag are ufloat, the phase is a plain float (in rad)."""
+    __array_priority__ = 10
+    def __array_ufunc__(self, ufunc, method, *inputs, **kwargs):
+        """numpy ufuncs with quantities (see UnitArray.__array_ufunc__)"""
+        return _array_ufunc(self, ufunc, method, inputs, kwargs)
+
+    def __cinit__(self):
+        #results of arithmetic are created without calling __init__ (the
+        #constructor arguments are parsed there, __cinit__ ignores them)
+        self._unit = ONE
+
+    def __init__(self, value, u = None):
+        """Create a new complex number with units
+
+        Parameters
+        ----------
+        value : the value of the quantity
+            this can either be a ucomplex or ufloat (in which case the unit is
+            copied) or a number that can be cast to complex
+
+        u : unit of the quantity
+            A dictionary of the form {'unit_name':exponent,...} specifying the unit
+            of the quantity. Defaults to None (no unit). If value has a unit,
+            this parameter is ignored
+        """
+        if isinstance(value, (ucomplex, ufloat)):
+            self._value = _cvalue(value)
+            self._unit = unit_of(value)
+        else:
+            self._value = value
+            self._unit = as_unit(u)
+
+    def __str__(self):
+        return '%s [%s]'%(complex(self._value), self._unit.symbol)
+
+    def __repr__(self):
+        if uarray.STRREP:
+            return self.__str__()
+        return '%s(%s, %s)'%(
+            self.__class__.__name__, repr(complex(self._value)), repr(dict(self._unit)))
+
+    def __mul__(self, other):
+        if isinstance(other, ndarray) or isinstance(self, ndarray):
+            return binop(multiply, self, other)
+        if not (_cnumber(self) and _cnumber(other)):
+            return NotImplemented
+        return cnewval(_cvalue(self)*_cvalue(other), umul(unit_of(self), unit_of(other)))
+
+    #ATTENTION __truediv__ and __div__ have the same code (to support both python2 and python3)
+    def __truediv__(self, other):
+        if isinstance(other, ndarray) or isinstance(self, ndarray):
+            return binop(true_divide, self, other)
+        if not (_cnumber(self) and _cnumber(other)):
+            return NotImplemented
+        return cnewval(_cvalue(self)/_cvalue(other), udiv(unit_of(self), unit_of(other)))
+
+    def __div__(self, other):
+        if isinstance(other, ndarray) or isinstance(self, ndarray):
+            return binop(true_divide, self, other)
+        if not (_cnumber(self) and _cnumber(other)):
+            return NotImplemented
+        return cnewval(_cvalue(self)/_cvalue(other), udiv(unit_of(self), unit_of(other)))
+
+    def __pow__(self, other, modulo):
+        if not isinstance(self, ucomplex) or unit_of(other) is not ONE or isinstance(other, ndarray):
+            raise ValueError('Can\'t expontiate using exponent with units or array')
+        return cnewval((<ucomplex>self)._value**(<double>other), upow((<ucomplex>self)._unit, other))
+
+    def __add__(self, other):
+        if isinstance(other, ndarray) or isinstance(self, ndarray):
+            return binop(add, self, other)
+        if not (_cnumber(self) and _cnumber(other)):
+            return NotImplemented
+        if _zero(other):
+            return self
+        if _zero(self):
+            return other
+        if unit_of(self) is not unit_of(other):
+            raise ValueError('Can\'t add two quantities with differnt units %s and %s.'%(self, other))
+        return cnewval(_cvalue(self) + _cvalue(other), unit_of(self))
+
+    def __sub__(self, other):
+        if isinstance(other, ndarray) or isinstance(self, ndarray):
+            return binop(subtract, self, other)
+        if not (_cnumber(self) and _cnumber(other)):
+            return NotImplemented
+        if _zero(other):
+            return self
+        if _zero(self):
+            return -other
+        if unit_of(self) is not unit_of(other):
+            raise ValueError('Can\'t subtract two quantities with differnt units %s and %s.'%(self, other))
+        return cnewval(_cvalue(self) - _cvalue(other), unit_of(self))
+
+    def __neg__(self):
+        return cnewval(-self._value, self._unit)
+
+    def __abs__(self):
+        return newval(abs(self._value), self._unit)
+
+    def __richcmp__(self, other, op):
+        if op != 2 and op != 3:
+            raise TypeError('complex quantities can only be compared for equality')
+        if isinstance(other, ndarray) or isinstance(self, ndarray):
+            ovalue = getattr(other, 'value', other)
+            svalue = getattr(self, 'value', self)
+            same = unit_of(self) is unit_of(other)
+            if op == 2:
+                return same and ovalue == svalue
+            return not same or ovalue != svalue
+        if not (_cnumber(self) and _cnumber(other)):
+            return NotImplemented
+        result = (unit_of(self) is unit_of(other)
+                  and _cvalue(self) == _cvalue(other))
+        if op == 2:
+            return result
+        return not result
+
+    def __hash__(self):
+        #consistent with __richcmp__: dimensionless values hash like complex
+        if self._unit is ONE:
+            return hash(complex(self._value))
+        return hash(complex(self._value)) ^ self._unit._hash
+
+    def conjugate(self):
+        """the complex conjugate"""
+        return ucomplex_new(self._value.conjugate(), self._unit)
+
+    property real:
+        def __get__(self):
+            return newval(self._value.real, self._unit)
+
+    property imag:
+        def __get__(self):
+            return newval(self._value.imag, self._unit)
+
+    property phase:
+        def __get__(self):
+            """the phase of the value in rad"""
+            return atan2(self._value.imag, self._value.real)
+
+    property value:
+        def __get__(self):
+            return complex(self._value)
+
+    def asNumber(self, other = None):
+        if other is None:
+            return complex(self._value)
+        if isinstance(other, str):
+            unit, value = uarray.conversion_target(other)
+            if self._unit is not unit:
+                raise ValueError('Quantity %s can\'t be converted to %s'%(self, other))
+            return complex(self._value)/value
+        if self._unit is not unit_of(other):
+            raise ValueError('Quantity %s can\'t be converted to %s'%(self, other))
+        return complex(self._value)/getattr(other, 'value', other)
+
+    def rescale(self, other):
+        return self.asNumber(other)
+
+    property unit:
+        def __get__(self):
+            return ufloat_new(1, self._unit)
+
+    property unitDict:
+        def __get__(self):
+            """A dictionary representation of the quantitie's unit.
+
+            This is the (immutable) unit itself."""
+            return self._unit
+
+    property symbol:
+        def __get__(self):
+            """a string representation of the dimension"""
+            return self._unit.symbol
+
+    #Pickling support
+    def __reduce__(self):
+        return (ucomplex,
+                (complex(self._value), dict(self._unit)))
+
+#########################################
+# uncertain: a ufloat with a standard deviation
+#########################################
+cdef uncertain uncertain_new(double value, double sigma, Unit u):
+    """create a new uncertain sharing the unit u"""
+    cdef uncertain res = uncertain.__new__(uncertain)
+    res._value = value
+    res._sigma = sigma
+    res._unit = u
+    return res
+
+cdef inline double _sigma(object x):
+    """the standard deviation of x, zero for everything but uncertain"""
+    if isinstance(x, uncertain):
+        return (<uncertain>x)._sigma
+    return 0
+
+cdef double _fvalue(object x) except? -1:
+    """the value of a ufloat or number as double"""
+    if isinstance(x, ufloat):
+        return (<ufloat>x)._value
+    return x
+
+cdef bint _rnumber(object x):
+    """True if x can take part in uncertain scalar arithmetic"""
+    if isinstance(x, (ufloat, float, int)):
+        return True
+    if isinstance(x, (ucomplex, complex, ndarray)):
+        return False
+    try:
+        float(x)
+    except (TypeError, ValueError):
+        return False
+    return True
+
+cdef object _uarray(object x):
+    """x as an (0-d) UncertainArray, for operations with arrays"""
+    if isinstance(x, uncertain):
+        return uarray.UncertainArray((<uncertain>x)._value, (<uncertain>x)._sigma,
+                                     (<uncertain>x)._unit)
+    return x
+
+cdef class uncertain(ufloat):
+    """a ufloat with a standard deviation
+
+    The standard deviation (sigma) is propagated linearly through +, -, *, /
+    and **, assuming that the errors of the operands are independent. Other
+    operations (e.g. comparisons) only look at the value. Results of
+    arithmetic are always uncertain, also if they are dimensionless.
+
+    Arithmetic with arrays gives an UncertainArray."""
+    def __init__(self, value, sigma = 0, u = None):
+        """Create a new floatingpoint number with standard deviation and units
+
+        Parameters
+        ----------
+        value : the value of the quantity
+            this can either be a ufloat (in which case its unit is used) or
+            a number that can be cast to float
+
+        sigma : the standard deviation of the value
+            a number or a ufloat with the same unit as value
+
+        u : unit of the quantity
+            A dictionary of the form {'unit_name':exponent,...} specifying the unit
+            of the quantity. Defaults to None (no unit). If value is of type ufloat,
+            this parameter is ignored
+        """
+        if isinstance(value, ufloat):
+            self._value = (<ufloat>value)._value
+            self._unit = (<ufloat>value)._unit
+        else:
+            self._value = value
+            self._unit = as_unit(u)
+        if isinstance(sigma, ufloat):
+            if (<ufloat>sigma)._unit is not self._unit:
+                raise ValueError('the standard deviation %s must have the unit of the value [%s]'
+                                 %(sigma, self._unit.symbol))
+            sigma = (<ufloat>sigma)._value
+        self._sigma = fabs(sigma)
+
+    def __str__(self):
+        return '%s +- %s [%s]'%(self._value, self._sigma, self._unit.symbol)
+
+    def __repr__(self):
+        if uarray.STRREP:
+            return self.__str__()
+        return '%s(%s, %s, %s)'%(
+            self.__class__.__name__, repr(self._value), repr(self._sigma),
+            repr(dict(self._unit)))
+
+    def __mul__(self, other):
+        cdef double a, b
+        if isinstance(other, ndarray) or isinstance(self, ndarray):
+            return _uarray(self)*_uarray(other)
+        if not (_rnumber(self) and _rnumber(other)):
+            return NotImplemented
+        a = _fvalue(self)
+        b = _fvalue(other)
+        return uncertain_new(a*b, hypot(b*_sigma(self), a*_sigma(other)),
+                             umul(unit_of(self), unit_of(other)))
+
+    #ATTENTION __truediv__ and __div__ have the same code (to support both python2 and python3)
+    def __truediv__(self, other):
+        cdef double a, b
+        if isinstance(other, ndarray) or isinstance(self, ndarray):
+            return _uarray(self)/_uarray(other)
+        if not (_rnumber(self) and _rnumber(other)):
+            return NotImplemented
+        a = _fvalue(self)
+        b = _fvalue(other)
+        return uncertain_new(a/b, hypot(_sigma(self)/b, a*_sigma(other)/(b*b)),
+                             udiv(unit_of(self), unit_of(other)))
+
+    def __div__(self, other):
+        cdef double a, b
+        if isinstance(other, ndarray) or isinstance(self, ndarray):
+            return _uarray(self)/_uarray(other)
+        if not (_rnumber(self) and _rnumber(other)):
+            return NotImplemented
+        a = _fvalue(self)
+        b = _fvalue(other)
+        return uncertain_new(a/b, hypot(_sigma(self)/b, a*_sigma(other)/(b*b)),
+                             udiv(unit_of(self), unit_of(other)))
+
+    def __pow__(self, other, modulo):
+        cdef double a, n
+        if not isinstance(self, uncertain) or isinstance(other, (ufloat, ndarray)):
+            raise ValueError('Can\'t expontiate using exponent with units, uncertainty or array')
+        a = (<uncertain>self)._value
+        n = other
+        return uncertain_new(a**n, fabs(n*a**(n - 1)*(<uncertain>self)._sigma),
+                             upow((<uncertain>self)._unit, n))
+
+    def __add__(self, other):
+        if isinstance(other, ndarray) or isinstance(self, ndarray):
+            return _uarray(self) + _uarray(other)
+        if not (_rnumber(self) and _rnumber(other)):
+            return NotImplemented
+        if _zero(other):
+            return self
+        if _zero(self):
+            return other
+        if unit_of(self) is not unit_of(other):
+            raise ValueError('Can\'t add two quantities with differnt units %s and %s.'%(self, other))
+        return uncertain_new(_fvalue(self) + _fvalue(other),
+                             hypot(_sigma(self), _sigma(other)), unit_of(self))
+
+    def __sub__(self, other):
+        if isinstance(other, ndarray) or isinstance(self, ndarray):
+            return _uarray(self) - _uarray(other)
+        if not (_rnumber(self) and _rnumber(other)):
+            return NotImplemented
+        if _zero(other):
+            return self
+        if _zero(self):
+            return -other
+        if unit_of(self) is not unit_of(other):
+            raise ValueError('Can\'t subtract two quantities with differnt units %s and %s.'%(self, other))
+        return uncertain_new(_fvalue(self) - _fvalue(other),
+                             hypot(_sigma(self), _sigma(other)), unit_of(self))
+
+    def __neg__(self):
+        return uncertain_new(-self._value, self._sigma, self._unit)
+
+    def __pos__(self):
+        return self
+
+    def __abs__(self):
+        return uncertain_new(fabs(self._value), self._sigma, self._unit)
+
+    property sigma:
+        def __get__(self):
+            """the standard deviation (with the unit of the value)"""
+            return newval(self._sigma, self._unit)
+
+    property relative:
+        def __get__(self):
+            """the relative standard deviation sigma/|value|"""
+            return self._sigma/fabs(self._value)
+
+    property nominal:
+        def __get__(self):
+            """the value as ufloat (or float), without standard deviation"""
+            return newval(self._value, self._unit)
+
+    #Pickling support
+    def __reduce__(self):
+        return (uncertain,
+                (self._value, self._sigma, dict(self._unit)))
+
+#the C level boxing for UnitArray indexing, iteration and tolist and the
+#arithmetic operators. uarray can't import them (this module imports uarray),
+#so they are handed over here.
+uarray._box = box
+uarray._iter_boxed = iter_boxed
+uarray._boxed_list = boxed_list
+uarray._binop = binop
@@ -0,0 +1,46 @@
+# -*- coding: utf-8 -*-
+#    ufloat - fast python floats with physical units
+#    Copyright (C) 2015  Christoph Gohle <christoph.gohle@mpq.mpg.de>
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+cdef enum:
+    #number of dimensions a unit can have (base dimensions and ad-hoc names)
+    UNIT_NDIMS = 32
+    #exponents are stored as multiples of 1/UNIT_DENOM
+    UNIT_DENOM = 60
+
+#the exponents of all dimensions of a unit
+ctypedef struct uvec:
+    short e[UNIT_NDIMS]
+
+cdef class Unit(dict):
+    cdef uvec vec
+    cdef readonly object symbol
+    cdef Py_hash_t _hash
+    #results of unit algebra with this unit as left operand
+    cdef dict _mulcache
+    cdef dict _divcache
+    cdef dict _powcache
+
+cdef int uvec_mul(const uvec* self, const uvec* other, uvec* res, int sign) nogil
+cdef int uvec_pow(const uvec* self, double exp, uvec* res) nogil
+cdef bint uvec_cmp(const uvec* self, const uvec* other) nogil
+
+cpdef Unit as_unit(object u)
+cdef Unit intern_vec(const uvec* vec)
+cdef Unit umul(Unit self, Unit other)
+cdef Unit udiv(Unit self, Unit other)
+cdef Unit upow(Unit self, double exp)
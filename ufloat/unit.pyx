@@ -0,0 +1,402 @@
+# -*- coding: utf-8 -*-
+# cython: freethreading_compatible=True
+#    ufloat - fast python floats with physical units
+#    Copyright (C) 2015  Christoph Gohle <christoph.gohle@mpq.mpg.de>
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+"""
+The table of units shared by ufloat and UnitArray.
+
+Every distinct unit exists exactly once as an immutable Unit object (the
+units are hash-consed). Two units are therefore equal if and only if they
+are the same object, and things like the symbol of a unit are computed only
+once, when the unit is first created.
+
+Internally a unit is a fixed size vector of exponents, one for each of the
+base dimensions the unit system is built on (kg, m, s, G, V, C, A, K, dBm,
+Pa, see units.py). Other names get one of the remaining slots the first time
+they are used. Exponents are small rationals, stored exactly as multiples of
+1/UNIT_DENOM, so that for example (m**0.5)**2 is m again. Multiplication and
+division of units are additions and subtractions of these vectors.
+
+Results of the unit algebra (multiplication, division and powers) are
+remembered by the left operand, so that repeated operations on the same units
+cost a single dictionary lookup.
+
+Units are never freed. The number of distinct units used by a program is
+usually small, so this is not a problem.
+
+All of this is safe to use from several threads, also on free-threaded python
+builds. The vector operations (uvec_mul, uvec_pow and uvec_cmp) use no global
+state and don't need the gil. New units are entered into the table with
+dict.setdefault, so that concurrent threads always agree on the canonical
+Unit without taking a lock. Only giving a slot to a new dimension name takes
+a lock, which happens once per name.
+"""
+from __future__ import division
+
+from cpython.bytes cimport PyBytes_FromStringAndSize
+from cpython.dict cimport PyDict_SetItem
+from libc.math cimport fabs, floor
+from libc.string cimport memcmp, memset
+
+from threading import Lock
+
+from numpy import generic, ndarray
+
+#the base dimensions, they always have the same slot in a uvec
+BASE_DIMENSIONS = ('kg', 'm', 's', 'G', 'V', 'C', 'A', 'K', 'dBm', 'Pa')
+
+#names of the dimensions in the order of their slots and the inverse map
+cdef list _names = list(BASE_DIMENSIONS)
+cdef dict _slots = dict((n, i) for i, n in enumerate(_names))
+cdef object _slots_lock = Lock()
+
+#the table of all units, maps the bytes of the exponent vector to the Unit
+cdef dict _table = {}
+
+
+cdef int uvec_mul(const uvec* self, const uvec* other, uvec* res, int sign) nogil:
+    """res = self*other**sign, returns -1 if an exponent overflows"""
+    cdef int i, e
+    for i in range(UNIT_NDIMS):
+        e = self.e[i] + sign*other.e[i]
+        if e != <short>e:
+            return -1
+        res.e[i] = e
+    return 0
+
+
+cdef int uvec_pow(const uvec* self, double exp, uvec* res) nogil:
+    """res = self**exp, returns -1 if the result is not representable"""
+    cdef int i
+    cdef double e, n
+    for i in range(UNIT_NDIMS):
+        e = self.e[i]*exp
+        n = floor(e + 0.5)
+        if fabs(e - n) > 1e-6 or n != <short>n:
+            return -1
+        res.e[i] = <short>n
+    return 0
+
+
+cdef bint uvec_cmp(const uvec* self, const uvec* other) nogil:
+    """True if the two vectors are the same"""
+    return memcmp(self, other, sizeof(uvec)) == 0
+
+
+cdef int _slot(object name) except -1:
+    """the slot of dimension name, new names are given the next free slot"""
+    if isinstance(name, bytes):
+        name = (<bytes>name).decode('UTF-8')
+    try:
+        return _slots[name]
+    except KeyError:
+        pass
+    with _slots_lock:
+        if name in _slots:
+            return _slots[name]
+        if len(_names) == UNIT_NDIMS:
+            raise ValueError('can\'t use more than %d different unit names (%s)'
+                             % (UNIT_NDIMS, name))
+        _names.append(name)
+        _slots[name] = len(_names) - 1
+        return _slots[name]
+
+
+cdef short _numerator(object exp) except? -1:
+    """the exponent exp in multiples of 1/UNIT_DENOM"""
+    cdef double e = exp*UNIT_DENOM
+    cdef double n = floor(e + 0.5)
+    if fabs(e - n) > 1e-6 or n != <short>n:
+        raise ValueError('unit exponent %r is not a multiple of 1/%d'
+                         % (exp, UNIT_DENOM))
+    return <short>n
+
+
+cdef object _exponent(short n):
+    """the exponent for a numerator n, integers are stored as int"""
+    if n % UNIT_DENOM == 0:
+        return n // UNIT_DENOM
+    return n / UNIT_DENOM
+
+
+cdef class Unit(dict):
+    """An immutable unit.
+
+    A Unit is a dictionary of the form {'unit_name':exponent,...}. There is
+    only one Unit for every distinct unit, use as_unit to get it. Don't
+    instantiate this class directly.
+    """
+
+    def __hash__(self):
+        return self._hash
+
+    def __setitem__(self, key, value):
+        raise TypeError('units are immutable')
+
+    def __delitem__(self, key):
+        raise TypeError('units are immutable')
+
+    def clear(self):
+        raise TypeError('units are immutable')
+
+    def pop(self, *args):
+        raise TypeError('units are immutable')
+
+    def popitem(self):
+        raise TypeError('units are immutable')
+
+    def setdefault(self, *args):
+        raise TypeError('units are immutable')
+
+    def update(self, *args, **kwargs):
+        raise TypeError('units are immutable')
+
+    def __ior__(self, other):
+        raise TypeError('units are immutable')
+
+    def __or__(self, other):
+        #a plain dict, like dict | dict (self can be either operand)
+        if not isinstance(self, dict) or not isinstance(other, dict):
+            return NotImplemented
+        res = dict(self)
+        dict.update(res, other)
+        return res
+
+    def __mul__(self, other):
+        return umul(as_unit(self), as_unit(other))
+
+    def __truediv__(self, other):
+        return udiv(as_unit(self), as_unit(other))
+
+    def __div__(self, other):
+        return udiv(as_unit(self), as_unit(other))
+
+    def __pow__(self, exp, modulo):
+        return upow(as_unit(self), exp)
+
+    def __reduce__(self):
+        return (as_unit, (dict(self),))
+
+
+cdef str _format(dict u):
+    """create a string representation of the unit u"""
+    nom = ''
+    denom = ''
+    for name, exp in u.items():
+        if exp > 0:
+            if exp > 1:
+                nom += '%s**%s ' % (name, abs(exp))
+            else:
+                nom += '%s ' % name
+        else:
+            if exp < -1:
+                denom += '%s**%s ' % (name, abs(exp))
+            else:
+                denom += '%s ' % name
+    fill = ''
+    if not denom == '':
+        fill = '/'
+        if nom == '':
+            nom = '1'
+    return nom.strip()+fill+denom.strip()
+
+
+cdef Unit intern_vec(const uvec* vec):
+    """return the Unit with exponent vector vec"""
+    cdef Unit res
+    cdef int i
+    key = PyBytes_FromStringAndSize(<const char*>vec, sizeof(uvec))
+    res = _table.get(key)
+    if res is None:
+        res = Unit.__new__(Unit)
+        res.vec = vec[0]
+        for i in range(len(_names)):
+            if vec.e[i] != 0:
+                PyDict_SetItem(res, _names[i], _exponent(vec.e[i]))
+        res.symbol = _format(res)
+        res._hash = hash(key)
+        res._mulcache = {}
+        res._divcache = {}
+        res._powcache = {}
+        res = _table.setdefault(key, res)
+    return res
+
+
+cpdef Unit as_unit(object u):
+    """return the Unit for u
+
+    Parameters
+    ----------
+    u : dict or None
+        A dictionary of the form {'unit_name':exponent,...}. Entries with a
+        zero exponent are dropped, None is dimensionless. Exponents have to
+        be multiples of 1/UNIT_DENOM.
+    """
+    cdef uvec vec
+    cdef int i
+    if type(u) is Unit:
+        return u
+    memset(&vec, 0, sizeof(uvec))
+    if u:
+        for name, exp in u.items():
+            i = _slot(name)
+            vec.e[i] = _numerator(exp)
+    return intern_vec(&vec)
+
+
+cdef Unit umul(Unit self, Unit other):
+    """multiply two units"""
+    cdef uvec vec
+    res = self._mulcache.get(other)
+    if res is None:
+        if uvec_mul(&self.vec, &other.vec, &vec, 1) < 0:
+            raise OverflowError('unit exponent out of range in [%s]*[%s]'
+                                % (self.symbol, other.symbol))
+        res = self._mulcache[other] = intern_vec(&vec)
+    return res
+
+
+cdef Unit udiv(Unit self, Unit other):
+    """divide two units"""
+    cdef uvec vec
+    res = self._divcache.get(other)
+    if res is None:
+        if uvec_mul(&self.vec, &other.vec, &vec, -1) < 0:
+            raise OverflowError('unit exponent out of range in [%s]/[%s]'
+                                % (self.symbol, other.symbol))
+        res = self._divcache[other] = intern_vec(&vec)
+    return res
+
+
+cdef Unit upow(Unit self, double exp):
+    """take the unit self to the power exp
+
+    Results are cached for exponents that are multiples of 1/UNIT_DENOM
+    (keyed by the numerator), so the cache stays small for arbitrary
+    exponents (which work for the dimensionless unit)."""
+    cdef uvec vec
+    cdef double e = exp*UNIT_DENOM
+    cdef double n = floor(e + 0.5)
+    key = None
+    if fabs(e - n) <= 1e-6 and n == <short>n:
+        key = <short>n
+        res = self._powcache.get(key)
+        if res is not None:
+            return res
+    if uvec_pow(&self.vec, exp, &vec) < 0:
+        raise ValueError('can\'t take [%s] to the power %r, unit exponents '
+                         'must be multiples of 1/%d'
+                         % (self.symbol, exp, UNIT_DENOM))
+    res = intern_vec(&vec)
+    if key is not None:
+        self._powcache[key] = res
+    return res
+
+
+cdef inline object _unit_attr(object o):
+    """the _unit of o or None, without an exception for plain numbers"""
+    if type(o) is float or type(o) is int:
+        return None
+    return getattr(o, '_unit', None)
+
+
+cdef object _value_key(tuple key, tuple objs):
+    """replace operands without unit in key by their value, None for arrays"""
+    cdef Py_ssize_t i
+    res = list(key)
+    for i in range(1, len(key)):
+        if key[i] is None:
+            o = objs[i - 1]
+            if isinstance(o, (int, float, complex)):
+                res[i] = (o, )
+            elif isinstance(o, (generic, ndarray)) and o.ndim == 0:
+                res[i] = (o.item(), )
+            else:
+                return None
+    return tuple(res)
+
+
+cdef class UnitCache:
+    """A bounded cache for the units of ufunc results.
+
+    The unit of the result of a ufunc only depends on the ufunc and the units
+    of its operands. The cache maps (ufunc, unit of operand 1, ...) to that
+    unit. Operands without unit enter the key as None, except for the ufuncs
+    in value_dependent (e.g. power), where the result unit depends on their
+    value. Then a scalar enters the key with its value and for arrays the
+    cache is not used.
+
+    Calling the cache with a ufunc and its operands returns the result unit,
+    on a miss compute(ufunc, operands) is called and the result stored. If
+    there are more than maxsize entries, the oldest ones are dropped.
+
+    Lookups don't take a lock, the statistics are therefore approximate if
+    several threads use the cache at the same time (on free-threaded python
+    builds).
+    """
+    cdef dict _table
+    cdef object _lock
+    cdef frozenset _dependent
+    cdef public Py_ssize_t maxsize
+    cdef readonly Py_ssize_t hits, misses, evictions, uncached
+
+    def __cinit__(self, maxsize=1024, value_dependent=()):
+        self._table = {}
+        self._lock = Lock()
+        self._dependent = frozenset(value_dependent)
+        self.maxsize = maxsize
+
+    def __call__(self, uf, tuple objs, compute):
+        cdef bint plain
+        if uf.nin == 1:
+            u1 = _unit_attr(objs[0])
+            key = (uf, u1)
+            plain = u1 is None
+        else:
+            u1 = _unit_attr(objs[0])
+            u2 = _unit_attr(objs[1])
+            key = (uf, u1, u2)
+            plain = u1 is None or u2 is None
+        if plain and uf in self._dependent:
+            key = _value_key(key, objs)
+            if key is None:
+                self.uncached += 1
+                return compute(uf, objs)
+        res = self._table.get(key)
+        if res is not None:
+            self.hits += 1
+            return res
+        res = compute(uf, objs)
+        with self._lock:
+            self.misses += 1
+            self._table[key] = res
+            while len(self._table) > self.maxsize:
+                del self._table[next(iter(self._table))]
+                self.evictions += 1
+        return res
+
+    def __len__(self):
+        return len(self._table)
+
+    def clear(self):
+        """remove all entries and reset the statistics"""
+        with self._lock:
+            self._table.clear()
+            self.hits = self.misses = self.evictions = self.uncached = 0
+
+
+DIMENSIONLESS = as_unit(None)